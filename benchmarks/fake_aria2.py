@@ -0,0 +1,299 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit, parse_qs, unquote
+
+from .stand_in import StandIn, StandInHandler
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+BLOCK_SIZE = 1024 * 1024
+# Seconds before the first byte, aria2 has to connect to the source as well
+CONNECT_TIME = 0.5
+# Written over and over into the downloaded files, random so that nothing downstream can compress them
+_BLOCK = os.urandom(BLOCK_SIZE)
+
+
+def download_link(name, size, files=1, rate=0):
+    """
+    Link the fake aria2 "downloads" by writing files locally
+    :param size: bytes of every file
+    :param files: more than one makes a folder download, like a torrent
+    :param rate: bytes per second the files are written at, 0 for as fast as the disk goes
+    """
+    return f'http://bench.invalid/{name}?size={size}&files={files}&rate={rate}'
+
+
+class _Download:
+    def __init__(self, gid, link, directory):
+        url = urlsplit(link)
+        query = parse_qs(url.query)
+        self.gid = gid
+        self.link = link
+        self.dir = directory
+        self.name = unquote(url.path.strip('/').split('/')[-1]) or 'download'
+        self.rate = int(query.get('rate', ['0'])[0])
+        size = int(query.get('size', ['0'])[0])
+        count = int(query.get('files', ['1'])[0])
+        if count > 1:
+            self.paths = [os.path.join(directory, self.name, f'{i:06d}.bin') for i in range(count)]
+        else:
+            self.paths = [os.path.join(directory, self.name)]
+        self.lengths = [size] * count
+        self.completed = [0] * count
+        self.status = 'active'
+        self.error = None
+        self.speed = 0
+        self.stop_event = threading.Event()
+
+    def struct(self, keys=None):
+        total = sum(self.lengths)
+        completed = sum(self.completed)
+        struct = {
+            'gid': self.gid,
+            'status': self.status,
+            'totalLength': str(total),
+            'completedLength': str(completed),
+            'uploadLength': '0',
+            'downloadSpeed': str(self.speed if self.status == 'active' else 0),
+            'uploadSpeed': '0',
+            'connections': '1' if self.status == 'active' else '0',
+            'numPieces': str(max(len(self.lengths), 1)),
+            'pieceLength': str(BLOCK_SIZE),
+            'dir': self.dir,
+            'errorCode': '1' if self.error else '0',
+            'files': self.files(),
+        }
+        if self.error:
+            struct['errorMessage'] = self.error
+        if len(self.paths) > 1:
+            struct['bittorrent'] = {'info': {'name': self.name}, 'mode': 'multi', 'announceList': []}
+            struct['numSeeders'] = '0'
+            struct['seeder'] = 'false'
+            struct['infoHash'] = hashlib.sha1(self.link.encode()).hexdigest()
+        if keys:
+            struct = {key: value for key, value in struct.items() if key in keys}
+        return struct
+
+    def files(self):
+        return [{'index': str(i + 1), 'path': path, 'length': str(length),
+                 'completedLength': str(completed), 'selected': 'true',
+                 'uris': [{'uri': self.link, 'status': 'used'}]}
+                for i, (path, length, completed) in enumerate(zip(self.paths, self.lengths, self.completed))]
+
+    def run(self, notify):
+        notify('aria2.onDownloadStart', self.gid)
+        if self.stop_event.wait(CONNECT_TIME):
+            return
+        start = time.time()
+        written = 0
+        try:
+            for i, (path, length) in enumerate(zip(self.paths, self.lengths)):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'wb') as f:
+                    while self.completed[i] < length:
+                        if self.stop_event.is_set():
+                            return
+                        block = _BLOCK[:min(BLOCK_SIZE, length - self.completed[i])]
+                        f.write(block)
+                        self.completed[i] += len(block)
+                        written += len(block)
+                        elapsed = time.time() - start
+                        if self.rate:
+                            # Sleeps until the bytes written so far are due at rate
+                            time.sleep(max(written / self.rate - elapsed, 0))
+                        self.speed = int(written / max(time.time() - start, 1e-3))
+        except OSError as e:
+            self.error = str(e)
+            self.status = 'error'
+            notify('aria2.onDownloadError', self.gid)
+            return
+        self.status = 'complete'
+        notify('aria2.onDownloadComplete', self.gid)
+
+
+class _Aria2Handler(StandInHandler):
+
+    def post(self):
+        request = json.loads(self.read_body())
+        if isinstance(request, list):
+            self.send_json([self.stand_in.handle(call) for call in request])
+        else:
+            self.send_json(self.stand_in.handle(request))
+
+    def get(self):
+        if self.headers.get('Upgrade', '').lower() != 'websocket':
+            self.send_empty(404)
+            return
+        key = self.headers['Sec-WebSocket-Key']
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        self.send_response(101)
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', accept)
+        self.end_headers()
+        self.wfile.flush()
+        self.stand_in.add_listener(self.wfile)
+        try:
+            # Notifications only go out, the frames of the client are read until it closes the connection
+            while self.__read_frame():
+                pass
+        finally:
+            self.stand_in.remove_listener(self.wfile)
+            self.close_connection = True
+
+    def __read_frame(self):
+        header = self.rfile.read(2)
+        if len(header) < 2:
+            return False
+        opcode = header[0] & 0x0f
+        length = header[1] & 0x7f
+        if length == 126:
+            length = int.from_bytes(self.rfile.read(2), 'big')
+        elif length == 127:
+            length = int.from_bytes(self.rfile.read(8), 'big')
+        mask_length = 4 if header[1] & 0x80 else 0
+        self.rfile.read(mask_length + length)
+        # 8 closes the connection
+        return opcode != 8
+
+
+class FakeAria2(StandIn):
+    """
+    aria2 JSON-RPC and WebSocket notifications, on the port the bot connects to. Links made by
+    download_link() are "downloaded" by writing their files into the dir of the download.
+    """
+    handler = _Aria2Handler
+
+    def __init__(self, port=6800, latency=0):
+        super().__init__(port, latency)
+        self.__lock = threading.Lock()
+        self.__downloads = {}
+        self.__next_gid = 1
+        self.__listeners = []
+
+    def add_listener(self, wfile):
+        with self.__lock:
+            self.__listeners.append(wfile)
+
+    def remove_listener(self, wfile):
+        with self.__lock:
+            if wfile in self.__listeners:
+                self.__listeners.remove(wfile)
+
+    def notify(self, method, gid):
+        payload = json.dumps({'jsonrpc': '2.0', 'method': method, 'params': [{'gid': gid}]}).encode('utf-8')
+        # Unmasked text frame
+        if len(payload) < 126:
+            frame = bytes([0x81, len(payload)])
+        elif len(payload) < 65536:
+            frame = bytes([0x81, 126]) + len(payload).to_bytes(2, 'big')
+        else:
+            frame = bytes([0x81, 127]) + len(payload).to_bytes(8, 'big')
+        self.count(f'notify:{method}')
+        with self.__lock:
+            for wfile in list(self.__listeners):
+                try:
+                    wfile.write(frame + payload)
+                    wfile.flush()
+                except OSError:
+                    self.__listeners.remove(wfile)
+
+    def handle(self, request):
+        method = request.get('method')
+        params = [param for param in request.get('params', []) if not str(param).startswith('token:')]
+        if method == 'system.multicall':
+            self.count(method)
+            results = []
+            for call in params[0]:
+                response = self.__call(call['methodName'], call.get('params', []))
+                if 'error' in response:
+                    results.append({'faultCode': response['error']['code'],
+                                    'faultString': response['error']['message']})
+                else:
+                    results.append([response['result']])
+            return {'jsonrpc': '2.0', 'id': request.get('id'), 'result': results}
+        response = self.__call(method, params)
+        response.update({'jsonrpc': '2.0', 'id': request.get('id')})
+        return response
+
+    def __call(self, method, params):
+        self.count(method)
+        rpc = getattr(self, f'_rpc_{method.replace(".", "_")}', None)
+        if rpc is None:
+            return {'error': {'code': 1, 'message': f'No such method: {method}'}}
+        try:
+            return {'result': rpc(*params)}
+        except KeyError as e:
+            return {'error': {'code': 1, 'message': f'GID {e} is not found'}}
+
+    def __get(self, gid):
+        with self.__lock:
+            return self.__downloads[gid]
+
+    def __select(self, statuses, offset=0, num=None, keys=None):
+        with self.__lock:
+            downloads = [d for d in self.__downloads.values() if d.status in statuses]
+        if num is not None:
+            downloads = downloads[offset:offset + num]
+        return [d.struct(keys) for d in downloads]
+
+    def _rpc_aria2_addUri(self, uris, options=None, position=None):
+        directory = (options or {}).get('dir', os.getcwd())
+        with self.__lock:
+            gid = f'{self.__next_gid:016x}'
+            self.__next_gid += 1
+            download = self.__downloads[gid] = _Download(gid, uris[0], directory)
+        threading.Thread(target=download.run, args=(self.notify,), daemon=True).start()
+        return gid
+
+    def _rpc_aria2_tellStatus(self, gid, keys=None):
+        return self.__get(gid).struct(keys)
+
+    def _rpc_aria2_getFiles(self, gid):
+        return self.__get(gid).files()
+
+    def _rpc_aria2_tellActive(self, keys=None):
+        return self.__select(('active',), keys=keys)
+
+    def _rpc_aria2_tellWaiting(self, offset, num, keys=None):
+        return self.__select(('waiting', 'paused'), offset, num, keys)
+
+    def _rpc_aria2_tellStopped(self, offset, num, keys=None):
+        return self.__select(('complete', 'error', 'removed'), offset, num, keys)
+
+    def _rpc_aria2_remove(self, gid):
+        download = self.__get(gid)
+        download.stop_event.set()
+        download.status = 'removed'
+        self.notify('aria2.onDownloadStop', gid)
+        return gid
+
+    _rpc_aria2_forceRemove = _rpc_aria2_remove
+
+    def _rpc_aria2_removeDownloadResult(self, gid):
+        with self.__lock:
+            del self.__downloads[gid]
+        return 'OK'
+
+    def _rpc_aria2_purgeDownloadResult(self):
+        with self.__lock:
+            for gid in [gid for gid, d in self.__downloads.items() if d.status != 'active']:
+                del self.__downloads[gid]
+        return 'OK'
+
+    def _rpc_aria2_getGlobalStat(self):
+        active = self.__select(('active',))
+        return {'downloadSpeed': str(sum(int(d['downloadSpeed']) for d in active)), 'uploadSpeed': '0',
+                'numActive': str(len(active)), 'numWaiting': '0', 'numStopped': '0', 'numStoppedTotal': '0'}
+
+    def _rpc_aria2_getVersion(self):
+        return {'version': '1.35.0', 'enabledFeatures': []}
+
+    def _rpc_aria2_getOption(self, gid):
+        return {'dir': self.__get(gid).dir}
+
+    def _rpc_aria2_changeOption(self, gid, options):
+        return 'OK'
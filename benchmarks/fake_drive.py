@@ -0,0 +1,321 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from email.parser import BytesParser
+from urllib.parse import urlsplit, parse_qs
+
+from .stand_in import StandIn, StandInHandler
+
+ROOT_ID = 'bench-root'
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+# Query parameters the bot passes to any of the methods, the discovery document declares them all
+_QUERY_PARAMETERS = ('supportsTeamDrives', 'supportsAllDrives', 'includeItemsFromAllDrives', 'includeTeamDriveItems',
+                     'corpora', 'driveId', 'teamDriveId', 'q', 'spaces', 'pageSize', 'pageToken', 'orderBy',
+                     'includeRemoved', 'includeCorpusRemovals', 'restrictToMyDrive', 'acknowledgeAbuse',
+                     'addParents', 'removeParents', 'sendNotificationEmail', 'transferOwnership',
+                     'useDomainAdminAccess', 'keepRevisionForever', 'ignoreDefaultVisibility')
+_METHODS = {
+    # resource.method: (http method, path, with a request body, supports media upload)
+    'files.create': ('POST', 'files', True, True),
+    'files.get': ('GET', 'files/{fileId}', False, False),
+    'files.list': ('GET', 'files', False, False),
+    'files.copy': ('POST', 'files/{fileId}/copy', True, False),
+    'files.update': ('PATCH', 'files/{fileId}', True, False),
+    'files.delete': ('DELETE', 'files/{fileId}', False, False),
+    'permissions.create': ('POST', 'files/{fileId}/permissions', True, False),
+    'changes.getStartPageToken': ('GET', 'changes/startPageToken', False, False),
+    'changes.list': ('GET', 'changes', False, False),
+}
+# Clauses of the files.list queries the bot makes
+_QUERY_CLAUSES = re.compile(r"'((?:[^'\\]|\\.)*)' in parents|(name|mimeType) (=|!=|contains) '((?:[^'\\]|\\.)*)'"
+                            r"|trashed = (true|false)")
+
+
+def discovery_document(root_url):
+    """:return: Drive v3 discovery document with the methods the bot uses, served from root_url"""
+    resources = {}
+    for name, (http_method, path, has_body, media) in _METHODS.items():
+        resource, method = name.split('.')
+        parameters = {param: {'type': 'string', 'location': 'query'} for param in _QUERY_PARAMETERS}
+        if '{fileId}' in path:
+            parameters['fileId'] = {'type': 'string', 'location': 'path', 'required': True}
+        description = {'id': f'drive.{name}', 'path': path, 'httpMethod': http_method,
+                       'parameters': parameters, 'parameterOrder': ['fileId'] if '{fileId}' in path else [],
+                       'response': {'$ref': 'File'}}
+        if has_body:
+            description['request'] = {'$ref': 'File'}
+        if media:
+            description['supportsMediaUpload'] = True
+            description['mediaUpload'] = {
+                'accept': ['*/*'], 'maxSize': '5120GB',
+                'protocols': {'simple': {'multipart': True, 'path': '/upload/drive/v3/files'},
+                              'resumable': {'multipart': True, 'path': '/upload/drive/v3/files'}}}
+        resources.setdefault(resource, {'methods': {}})['methods'][method] = description
+    return {
+        'kind': 'discovery#restDescription', 'discoveryVersion': 'v1', 'id': 'drive:v3', 'name': 'drive',
+        'version': 'v3', 'protocol': 'rest', 'rootUrl': f'{root_url}/', 'servicePath': 'drive/v3/',
+        'batchPath': 'batch/drive/v3',
+        'parameters': {'fields': {'type': 'string', 'location': 'query'},
+                       'alt': {'type': 'string', 'location': 'query', 'default': 'json', 'enum': ['json', 'media']}},
+        'schemas': {'File': {'id': 'File', 'type': 'object'}},
+        'resources': resources,
+    }
+
+
+class _UploadSession:
+    def __init__(self, metadata, size):
+        self.metadata = metadata
+        # None while the size of a streamed upload is unknown
+        self.size = size
+        self.received = 0
+        self.md5 = hashlib.md5()
+
+
+class _DriveHandler(StandInHandler):
+
+    def __route(self):
+        url = urlsplit(self.path)
+        return url.path.strip('/').split('/'), {key: values[0] for key, values in parse_qs(url.query).items()}
+
+    def get(self):
+        parts, query = self.__route()
+        drive = self.stand_in
+        if parts[:2] == ['discovery', 'v1']:
+            self.send_json(discovery_document(drive.url))
+        elif parts == ['drive', 'v3', 'files']:
+            drive.count('files.list')
+            self.send_json(drive.list_files(query))
+        elif parts[:3] == ['drive', 'v3', 'files'] and len(parts) == 4:
+            drive.count('files.get')
+            self.__send_file(drive.get_file(parts[3]))
+        elif parts == ['drive', 'v3', 'changes', 'startPageToken']:
+            drive.count('changes.getStartPageToken')
+            self.send_json({'startPageToken': '1'})
+        elif parts == ['drive', 'v3', 'changes']:
+            drive.count('changes.list')
+            self.send_json({'newStartPageToken': '1', 'changes': []})
+        else:
+            self.send_empty(404)
+
+    def post(self):
+        parts, query = self.__route()
+        drive = self.stand_in
+        if parts == ['upload', 'drive', 'v3', 'files']:
+            if query.get('uploadType') == 'resumable':
+                drive.count('upload.start')
+                size = self.headers.get('X-Upload-Content-Length')
+                session_id = drive.start_upload(json.loads(self.read_body() or b'{}'),
+                                                int(size) if size is not None else None)
+                self.send_empty(200, {'Location': f'{drive.url}/upload/drive/v3/files?uploadType=resumable'
+                                                  f'&upload_id={session_id}'})
+            else:
+                drive.count('upload.multipart')
+                self.send_json(drive.create_file(*self.__read_multipart()))
+        elif parts == ['drive', 'v3', 'files']:
+            drive.count('files.create')
+            self.send_json(drive.create_file(json.loads(self.read_body() or b'{}')))
+        elif parts[:3] == ['drive', 'v3', 'files'] and parts[4:] == ['copy']:
+            drive.count('files.copy')
+            self.__send_file(drive.copy_file(parts[3], json.loads(self.read_body() or b'{}')))
+        elif parts[:3] == ['drive', 'v3', 'files'] and parts[4:] == ['permissions']:
+            drive.count('permissions.create')
+            self.read_body()
+            self.send_json({'kind': 'drive#permission', 'id': 'anyoneWithLink', 'type': 'anyone',
+                            'role': 'reader'})
+        else:
+            self.send_empty(404)
+
+    def put(self):
+        parts, query = self.__route()
+        session_id = query.get('upload_id')
+        if parts != ['upload', 'drive', 'v3', 'files'] or session_id is None:
+            self.send_empty(404)
+            return
+        drive = self.stand_in
+        session = drive.upload_session(session_id)
+        if session is None:
+            self.read_body()
+            self.send_empty(404)
+            return
+        # bytes <first>-<last>/<total or *>, or bytes */<total> when asked for the committed offset
+        content_range = self.headers.get('Content-Range', '')
+        match = re.match(r'bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)', content_range)
+        if match is None:
+            self.read_body()
+            self.send_empty(400)
+            return
+        first, last, total = match.groups()
+        if total != '*':
+            session.size = int(total)
+        length = int(self.headers.get('Content-Length') or 0)
+        if first is None:
+            drive.count('upload.status')
+        elif int(first) != session.received:
+            # Not where the upload is at, Drive drops the chunk and tells where to continue
+            drive.count('upload.chunk.rejected')
+            self.rfile.read(length)
+        else:
+            drive.count('upload.chunk')
+            drive.receive(self.rfile, length, session)
+        if session.size is not None and session.received >= session.size:
+            self.send_json(drive.finish_upload(session_id))
+            return
+        headers = {'Range': f'bytes=0-{session.received - 1}'} if session.received else {}
+        self.send_empty(308, headers)
+
+    def patch(self):
+        parts, query = self.__route()
+        if parts[:3] == ['drive', 'v3', 'files'] and len(parts) == 4:
+            self.stand_in.count('files.update')
+            self.__send_file(self.stand_in.update_file(parts[3], json.loads(self.read_body() or b'{}')))
+        else:
+            self.send_empty(404)
+
+    def delete(self):
+        parts, query = self.__route()
+        if parts[:3] == ['drive', 'v3', 'files'] and len(parts) == 4:
+            self.stand_in.count('files.delete')
+            self.stand_in.delete_file(parts[3])
+            self.send_empty(204)
+        else:
+            self.send_empty(404)
+
+    def __send_file(self, file):
+        if file is None:
+            self.send_json({'error': {'code': 404, 'message': 'File not found.',
+                                      'errors': [{'reason': 'notFound', 'message': 'File not found.'}]}}, 404)
+        else:
+            self.send_json(file)
+
+    def __read_multipart(self):
+        """:return: metadata and the media of a multipart upload"""
+        header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode('utf-8')
+        parts = BytesParser().parsebytes(header + self.read_body()).get_payload()
+        metadata = json.loads(parts[0].get_payload() or '{}')
+        media = parts[1].get_payload(decode=True) if len(parts) > 1 else b''
+        self.stand_in.count('upload.bytes', len(media))
+        return metadata, len(media), hashlib.md5(media).hexdigest()
+
+
+class FakeDrive(StandIn):
+    """
+    Drive v3 with an in-memory file tree under the folder ROOT_ID. The uploads are received and
+    hashed, then dropped. upload_rate limits every upload connection to that many bytes per second.
+    """
+    handler = _DriveHandler
+    RECEIVE_BLOCK = 256 * 1024
+
+    def __init__(self, port=0, latency=0, upload_rate=0):
+        super().__init__(port, latency)
+        self.upload_rate = upload_rate
+        self.__lock = threading.Lock()
+        self.__next_id = 1
+        self.__files = {ROOT_ID: self.__file(ROOT_ID, {'name': 'bench', 'mimeType': FOLDER_MIME_TYPE})}
+        # Key: parent id, Value: ids of its children
+        self.__children = {}
+        self.__sessions = {}
+
+    @staticmethod
+    def __file(file_id, metadata, size=None, md5=None):
+        file = {'kind': 'drive#file', 'id': file_id, 'name': metadata.get('name', 'Untitled'),
+                'mimeType': metadata.get('mimeType', 'application/octet-stream'),
+                'parents': metadata.get('parents', [ROOT_ID]), 'trashed': False,
+                'modifiedTime': time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime())}
+        if file['mimeType'] != FOLDER_MIME_TYPE:
+            file['size'] = str(size or 0)
+            file['md5Checksum'] = md5 or hashlib.md5(b'').hexdigest()
+        return file
+
+    def create_file(self, metadata, size=None, md5=None):
+        with self.__lock:
+            file_id = f'bench{self.__next_id:012d}'
+            self.__next_id += 1
+            file = self.__files[file_id] = self.__file(file_id, metadata, size, md5)
+            for parent in file['parents']:
+                self.__children.setdefault(parent, []).append(file_id)
+        return file
+
+    def get_file(self, file_id):
+        with self.__lock:
+            return self.__files.get(file_id)
+
+    def copy_file(self, file_id, metadata):
+        source = self.get_file(file_id)
+        if source is None:
+            return None
+        return self.create_file(dict(source, **metadata), int(source.get('size', 0)), source.get('md5Checksum'))
+
+    def update_file(self, file_id, metadata):
+        with self.__lock:
+            file = self.__files.get(file_id)
+            if file is not None:
+                file.update({key: value for key, value in metadata.items() if key in ('name', 'trashed')})
+            return file
+
+    def delete_file(self, file_id):
+        with self.__lock:
+            file = self.__files.pop(file_id, None)
+            if file is not None:
+                for parent in file['parents']:
+                    self.__children.get(parent, []).remove(file_id)
+
+    def list_files(self, query):
+        parents, conditions = [], []
+        for parent, field, operator, value, trashed in _QUERY_CLAUSES.findall(query.get('q', '')):
+            value = value.replace("\\'", "'")
+            if parent:
+                parents.append(parent)
+            elif field:
+                conditions.append((field, operator, value))
+            else:
+                conditions.append(('trashed', '=', trashed == 'true'))
+        with self.__lock:
+            if parents:
+                candidates = [self.__files[i] for parent in parents for i in self.__children.get(parent, [])]
+            else:
+                candidates = list(self.__files.values())
+            files = [file for file in candidates if all(self.__matches(file, *c) for c in conditions)]
+        offset = int(query.get('pageToken') or 0)
+        page_size = int(query.get('pageSize') or 100)
+        response = {'kind': 'drive#fileList', 'files': files[offset:offset + page_size]}
+        if offset + page_size < len(files):
+            response['nextPageToken'] = str(offset + page_size)
+        return response
+
+    @staticmethod
+    def __matches(file, field, operator, value):
+        if operator == 'contains':
+            return value.lower() in file[field].lower()
+        return (file[field] == value) == (operator == '=')
+
+    def start_upload(self, metadata, size):
+        with self.__lock:
+            session_id = f'session{self.__next_id}'
+            self.__next_id += 1
+            self.__sessions[session_id] = _UploadSession(metadata, size)
+        return session_id
+
+    def upload_session(self, session_id):
+        with self.__lock:
+            return self.__sessions.get(session_id)
+
+    def receive(self, rfile, length, session):
+        start = time.time()
+        remaining = length
+        while remaining:
+            data = rfile.read(min(self.RECEIVE_BLOCK, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            session.md5.update(data)
+            session.received += len(data)
+            if self.upload_rate:
+                time.sleep(max((length - remaining) / self.upload_rate - (time.time() - start), 0))
+        self.count('upload.bytes', length - remaining)
+
+    def finish_upload(self, session_id):
+        with self.__lock:
+            session = self.__sessions.pop(session_id)
+        return self.create_file(session.metadata, session.received, session.md5.hexdigest())
@@ -0,0 +1,68 @@
+import json
+import threading
+import time
+from urllib.parse import urlsplit, parse_qs
+
+from .stand_in import StandIn, StandInHandler
+
+BOT_USER = {'id': 100000, 'is_bot': True, 'first_name': 'Benchmark', 'username': 'benchmark_bot'}
+
+
+class _TelegramHandler(StandInHandler):
+
+    def __request(self):
+        url = urlsplit(self.path)
+        # /bot<token>/<method>
+        method = url.path.rstrip('/').split('/')[-1]
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        body = self.read_body()
+        if body:
+            if self.headers.get('Content-Type', '').startswith('application/json'):
+                params.update(json.loads(body))
+            else:
+                params.update({key: values[0] for key, values in parse_qs(body.decode('utf-8')).items()})
+        return method, params
+
+    def get(self):
+        self.post()
+
+    def post(self):
+        method, params = self.__request()
+        self.stand_in.count(method)
+        result = self.stand_in.call(method, params)
+        if result is None:
+            self.send_json({'ok': False, 'error_code': 400, 'description': f'Bad Request: {method} is not faked'}, 400)
+        else:
+            self.send_json({'ok': True, 'result': result})
+
+
+class FakeTelegram(StandIn):
+    """Telegram Bot API, every message sent or edited is accepted and counted"""
+    handler = _TelegramHandler
+
+    def __init__(self, port=0, latency=0):
+        super().__init__(port, latency)
+        self.__lock = threading.Lock()
+        self.__next_message_id = 1000000
+
+    def call(self, method, params):
+        if method == 'getMe':
+            return BOT_USER
+        if method in ('deleteMessage', 'answerCallbackQuery', 'setMyCommands'):
+            return True
+        if method.startswith('send') or method.startswith('edit'):
+            if method.startswith('send'):
+                with self.__lock:
+                    message_id = self.__next_message_id
+                    self.__next_message_id += 1
+            else:
+                message_id = int(params.get('message_id', 0))
+            chat_id = params.get('chat_id', 0)
+            try:
+                chat_id = int(chat_id)
+            except ValueError:
+                pass
+            return {'message_id': message_id, 'date': int(time.time()), 'from': BOT_USER,
+                    'chat': {'id': chat_id, 'type': 'group', 'title': 'Benchmark'},
+                    'text': params.get('text', '')}
+        return None
@@ -0,0 +1,360 @@
+"""
+Runs mirrors end-to-end through MirrorListener against local stand-ins of aria2, Drive and the
+Telegram Bot API, and reports their throughput, the time spent in every stage, the calls made to
+each service and the memory used by the bot.
+
+    python -m benchmarks.run [scenario ...] [--scale 0.1] [--drive-latency 50] [--json results.json]
+
+The stand-ins run in processes of their own. The fake aria2 listens on port 6800, where the bot
+expects aria2, so a real aria2c mustn't be running. The bot is configured for the run through the
+environment, settings like UPLOAD_WORKERS, PIPELINED_UPLOAD or STREAM_TAR can be passed the same way.
+"""
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import tracemalloc
+import urllib.request
+from argparse import ArgumentParser
+
+import psutil
+
+from .fake_aria2 import FakeAria2, download_link
+from .fake_drive import FakeDrive, ROOT_ID
+from .fake_telegram import FakeTelegram
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOT_TOKEN = '123456:benchmark'
+CHAT_ID = -100100
+USER_ID = 100
+MEMORY_SAMPLE_INTERVAL = 0.1
+
+
+class Scenario:
+    def __init__(self, description, jobs, files, size, scales):
+        """
+        :param files: files of every job, more than one makes a folder download
+        :param size: bytes of every file
+        :param scales: 'jobs', 'files' or 'size', what --scale changes
+        """
+        self.description = description
+        self.jobs = jobs
+        self.files = files
+        self.size = size
+        self.scales = scales
+
+    def scaled(self, scale):
+        values = {'jobs': self.jobs, 'files': self.files, 'size': self.size}
+        values[self.scales] = max(int(values[self.scales] * scale), 1)
+        return Scenario(self.description, scales=self.scales, **values)
+
+
+SCENARIOS = {
+    'huge-file': Scenario('One mirror of a single huge file', 1, 1, 1024 ** 3, 'size'),
+    'tiny-files': Scenario('One mirror of a folder of 10k tiny files', 1, 10000, 1024, 'files'),
+    'concurrent': Scenario('50 mirrors at once', 50, 1, 20 * 1024 ** 2, 'size'),
+}
+STAGES = ('queued', 'download', 'process', 'upload', 'total')
+
+
+def _configure(work_dir):
+    config = {
+        'BOT_TOKEN': BOT_TOKEN,
+        'GDRIVE_FOLDER_ID': ROOT_ID,
+        'OWNER_ID': str(USER_ID),
+        'DOWNLOAD_DIR': os.path.join(work_dir, 'downloads/'),
+        'DOWNLOAD_STATUS_UPDATE_INTERVAL': '5',
+        'AUTO_DELETE_MESSAGE_DURATION': '-1',
+        'USER_SESSION_STRING': 'benchmark',
+        'TELEGRAM_API': '0',
+        'TELEGRAM_HASH': 'benchmark',
+        'IS_TEAM_DRIVE': 'True',
+    }
+    for name, value in config.items():
+        os.environ.setdefault(name, value)
+    # Nothing may leave the machine or outlive the run
+    os.environ['BOT_MODE'] = 'standalone'
+    os.environ['PERSISTENT_JOBS'] = 'False'
+    os.environ['USE_SERVICE_ACCOUNTS'] = 'False'
+    os.environ['DRIVE_INDEX_DB'] = os.path.join(work_dir, 'drive_index.db')
+    os.environ.pop('INDEX_URL', None)
+    os.environ.pop('MEGA_KEY', None)
+
+
+def _start_bot(drive_url, telegram_url):
+    """Imports the bot, pointed at the stand-ins. Its log goes to log.txt of the work dir only."""
+    sys.path.insert(0, REPO_DIR)
+    import bot
+    from googleapiclient.discovery import build_from_document
+    from googleapiclient.http import build_http
+    from bot.helper.mirror_utils.upload_utils.drive_services import drive_services
+    from bot.modules import mirror
+
+    for handler in list(logging.getLogger().handlers):
+        if not isinstance(handler, logging.FileHandler):
+            logging.getLogger().removeHandler(handler)
+    bot.bot.base_url = f'{telegram_url}/bot{BOT_TOKEN}'
+    with urllib.request.urlopen(f'{drive_url}/discovery/v1/apis/drive/v3/rest') as response:
+        document = response.read().decode('utf-8')
+    local = threading.local()
+
+    def get_service(account=None):
+        # Like the real cache, one service per thread, without credentials
+        service = getattr(local, 'service', None)
+        if service is None:
+            service = local.service = build_from_document(document, http=build_http())
+        return service
+
+    drive_services.get = get_service
+    return bot, mirror
+
+
+class StageClock:
+    """Time of every step of the jobs, taken when MirrorListener enters the method of the step"""
+    STEPS = ('submit', 'onDownloadStarted', 'onDownloadComplete', 'startUpload')
+    ENDS = ('onUploadComplete', 'onUploadError', 'onDownloadError')
+
+    def __init__(self, listener_class):
+        self.__condition = threading.Condition()
+        # Key: uid, Value: dict of step -> time
+        self.steps = {}
+        # Key: uid, Value: None if the mirror succeeded, else the error
+        self.results = {}
+        for name in self.STEPS + self.ENDS:
+            setattr(listener_class, name, self.__wrap(name, getattr(listener_class, name)))
+
+    def __wrap(self, name, method):
+        clock = self
+
+        def wrapper(listener, *args, **kwargs):
+            clock.record(listener.uid, name, args)
+            return method(listener, *args, **kwargs)
+        return wrapper
+
+    def record(self, uid, name, args):
+        with self.__condition:
+            # The first time counts, the methods of a step may be entered again on retries
+            self.steps.setdefault(uid, {}).setdefault(name, time.time())
+            if name in self.ENDS and uid not in self.results:
+                self.results[uid] = args[0] if name != 'onUploadComplete' else None
+                self.__condition.notify_all()
+
+    def wait(self, uids, timeout):
+        """:return: True if all the jobs uids ended within timeout"""
+        with self.__condition:
+            return self.__condition.wait_for(lambda: all(uid in self.results for uid in uids), timeout)
+
+    def durations(self, uid):
+        """:return: dict of stage -> seconds, for the stages the job uid went through"""
+        steps = self.steps.get(uid, {})
+        end = min((steps[name] for name in self.ENDS if name in steps), default=None)
+        points = [('queued', 'submit', 'onDownloadStarted'),
+                  ('download', 'onDownloadStarted', 'onDownloadComplete'),
+                  ('process', 'onDownloadComplete', 'startUpload'),
+                  ('upload', 'startUpload', None),
+                  ('total', 'submit', None)]
+        durations = {}
+        for stage, start, stop in points:
+            stop_time = steps.get(stop) if stop is not None else end
+            if start in steps and stop_time is not None:
+                durations[stage] = stop_time - steps[start]
+        return durations
+
+
+class MemorySampler:
+    """Peak resident memory, thread count and CPU time of the process while a scenario runs"""
+
+    def __init__(self, trace_python):
+        self.__process = psutil.Process()
+        self.__trace_python = trace_python
+        self.__stop_event = threading.Event()
+        self.__thread = None
+        self.peak_rss = self.start_rss = 0
+        self.peak_threads = 0
+        self.cpu_time = 0
+        self.python_peak = None
+
+    def __sample(self):
+        while True:
+            self.peak_rss = max(self.peak_rss, self.__process.memory_info().rss)
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+            if self.__stop_event.wait(MEMORY_SAMPLE_INTERVAL):
+                return
+
+    def start(self):
+        self.start_rss = self.peak_rss = self.__process.memory_info().rss
+        self.__cpu_start = sum(self.__process.cpu_times()[:2])
+        if self.__trace_python:
+            tracemalloc.start()
+        self.__thread = threading.Thread(target=self.__sample, daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__stop_event.set()
+        self.__thread.join()
+        self.cpu_time = sum(self.__process.cpu_times()[:2]) - self.__cpu_start
+        if self.__trace_python:
+            self.python_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def run_scenario(name, scenario, bot, mirror, clock, stand_ins, args, first_uid):
+    from telegram import Message, Update
+
+    for stand_in in stand_ins.values():
+        stand_in.reset()
+    uids = list(range(first_uid, first_uid + scenario.jobs))
+    rate = int(args.download_rate * 1024 * 1024)
+    memory = MemorySampler(args.tracemalloc)
+    memory.start()
+    start = time.time()
+    for uid in uids:
+        link = download_link(f'{name}-{uid}', scenario.size, scenario.files, rate)
+        command = 'tar' if args.tar else 'mirror'
+        message = Message.de_json({
+            'message_id': uid, 'date': int(time.time()),
+            'chat': {'id': CHAT_ID, 'type': 'supergroup', 'title': 'Benchmark'},
+            'from': {'id': USER_ID, 'is_bot': False, 'first_name': 'Benchmark', 'username': 'benchmark'},
+            'text': f'/{command} {link}'}, bot.bot)
+        mirror._mirror(bot.bot, Update(uid, message=message), isTar=args.tar)
+    finished = clock.wait(uids, args.timeout)
+    elapsed = time.time() - start
+    memory.stop()
+    failed = {uid: clock.results[uid] for uid in uids if clock.results.get(uid) is not None}
+    completed = sum(1 for uid in uids if uid in clock.results and uid not in failed)
+    stages = {}
+    for stage in STAGES:
+        values = [clock.durations(uid)[stage] for uid in uids if stage in clock.durations(uid)]
+        if values:
+            stages[stage] = {'mean': sum(values) / len(values), 'p50': _percentile(values, 0.5),
+                             'p95': _percentile(values, 0.95), 'max': max(values)}
+    uploaded = completed * scenario.files * scenario.size
+    return {
+        'scenario': name,
+        'description': scenario.description,
+        'jobs': scenario.jobs,
+        'files_per_job': scenario.files,
+        'file_size': scenario.size,
+        'finished': finished,
+        'completed': completed,
+        'failed': failed,
+        'seconds': elapsed,
+        'throughput': uploaded / elapsed if elapsed else 0,
+        'stages': stages,
+        'calls': {service: stand_in.stats() for service, stand_in in stand_ins.items()},
+        'memory': {'start_rss': memory.start_rss, 'peak_rss': memory.peak_rss,
+                   'python_peak': memory.python_peak, 'peak_threads': memory.peak_threads,
+                   'cpu_seconds': memory.cpu_time},
+    }
+
+
+def print_result(result):
+    from bot.helper.ext_utils.bot_utils import get_readable_file_size
+
+    print(f"\n{result['scenario']}: {result['description']}, {result['jobs']} job(s) of "
+          f"{result['files_per_job']} file(s) of {get_readable_file_size(result['file_size'])}")
+    print(f"  {result['completed']}/{result['jobs']} completed in {result['seconds']:.2f}s, "
+          f"{get_readable_file_size(result['throughput'])}/s"
+          + ('' if result['finished'] else ', timed out'))
+    for uid, error in list(result['failed'].items())[:5]:
+        print(f'  job {uid} failed: {error}')
+    print(f"  {'stage':<10}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}")
+    for stage, values in result['stages'].items():
+        print(f'  {stage:<10}' + ''.join(f'{values[key]:>9.2f}s' for key in ('mean', 'p50', 'p95', 'max')))
+    memory = result['memory']
+    line = (f"  memory: peak RSS {get_readable_file_size(memory['peak_rss'])} "
+            f"(+{get_readable_file_size(memory['peak_rss'] - memory['start_rss'])}), "
+            f"{memory['peak_threads']} threads at most, {memory['cpu_seconds']:.2f}s CPU")
+    if memory['python_peak'] is not None:
+        line += f", Python heap peak {get_readable_file_size(memory['python_peak'])}"
+    print(line)
+    for service, calls in result['calls'].items():
+        counts = ', '.join(f'{call} {count}' for call, count in sorted(calls.items()) if not call.endswith('.bytes'))
+        print(f'  {service}: {counts or "no calls"}')
+
+
+def main():
+    parser = ArgumentParser(description='Benchmarks the mirror pipeline against local stand-ins')
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help=f"Scenarios to run, all of them by default: {', '.join(SCENARIOS)}")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='Scales the size of the huge file, the number of tiny files and the size of '
+                             'the concurrent files, e.g. 0.01 for a quick run')
+    parser.add_argument('--tar', action='store_true', help='Archive the downloads, like /tar')
+    parser.add_argument('--download-rate', type=float, default=0,
+                        help='MiB/s every download is written at, 0 for as fast as the disk goes')
+    parser.add_argument('--upload-rate', type=float, default=0,
+                        help='MiB/s every upload connection to Drive is limited to, 0 for no limit')
+    parser.add_argument('--aria2-latency', type=float, default=0, help='Milliseconds aria2 takes per call')
+    parser.add_argument('--drive-latency', type=float, default=0, help='Milliseconds Drive takes per call')
+    parser.add_argument('--telegram-latency', type=float, default=0, help='Milliseconds Telegram takes per call')
+    parser.add_argument('--timeout', type=float, default=3600, help='Seconds a scenario may take')
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help='Also trace the peak of the Python heap, slows the bot down')
+    parser.add_argument('--json', help='Writes the results to this file as well')
+    parser.add_argument('--keep', action='store_true', help="Keeps the work dir with the bot's log")
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenario {', '.join(unknown)}")
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    work_dir = tempfile.mkdtemp(prefix='mirror-bench-')
+    try:
+        aria2 = FakeAria2.spawn(port=6800, latency=args.aria2_latency / 1000)
+    except OSError as e:
+        sys.exit(f'Unable to listen on the port of aria2, is aria2c running? {e}')
+    stand_ins = {
+        'aria2': aria2,
+        'drive': FakeDrive.spawn(latency=args.drive_latency / 1000,
+                                 upload_rate=int(args.upload_rate * 1024 * 1024)),
+        'telegram': FakeTelegram.spawn(latency=args.telegram_latency / 1000),
+    }
+    results = []
+    status = 1
+    try:
+        _configure(work_dir)
+        os.chdir(work_dir)
+        bot, mirror = _start_bot(stand_ins['drive'].url, stand_ins['telegram'].url)
+        clock = StageClock(mirror.MirrorListener)
+        first_uid = 1
+        for name in args.scenarios or SCENARIOS:
+            scenario = SCENARIOS[name].scaled(args.scale)
+            print(f'Running {name}...', flush=True)
+            result = run_scenario(name, scenario, bot, mirror, clock, stand_ins, args, first_uid)
+            first_uid += scenario.jobs
+            results.append(result)
+            print_result(result)
+            if not result['finished']:
+                break
+        if json_path is not None:
+            with open(json_path, 'w') as f:
+                json.dump(results, f, indent=2)
+        if all(result['completed'] == result['jobs'] for result in results):
+            status = 0
+    except Exception:
+        traceback.print_exc()
+    finally:
+        for stand_in in stand_ins.values():
+            stand_in.stop()
+        os.chdir(REPO_DIR)
+        if args.keep:
+            print(f'\nWork dir: {work_dir}')
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        # The bot leaves its aria2 listener and status threads behind
+        os._exit(status)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+import json
+import multiprocessing
+import threading
+import time
+import urllib.request
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Prefix of the paths through which the benchmark reads and resets the counters of a stand-in
+CONTROL_PATH = '/_bench/'
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Requests of a stand-in, subclasses answer them in get(), post(), put(), patch() and delete()"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        # Thousands of requests per run, the stand-ins count them instead
+        pass
+
+    def __dispatch(self, name):
+        if self.path.startswith(CONTROL_PATH):
+            self.read_body()
+            if self.path == f'{CONTROL_PATH}reset':
+                self.stand_in.reset()
+            self.send_json(self.stand_in.stats())
+            return
+        handler = getattr(self, name, None)
+        if handler is None:
+            self.send_empty(405)
+            return
+        self.stand_in.delay()
+        handler()
+
+    def do_GET(self):
+        self.__dispatch('get')
+
+    def do_POST(self):
+        self.__dispatch('post')
+
+    def do_PUT(self):
+        self.__dispatch('put')
+
+    def do_PATCH(self):
+        self.__dispatch('patch')
+
+    def do_DELETE(self):
+        self.__dispatch('delete')
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def send_json(self, result, status=200, headers=None):
+        body = json.dumps(result).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_empty(self, status, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+
+class StandIn:
+    """
+    Local HTTP server which plays one of the services the bot talks to. Every call is counted
+    under a name, and answered after latency seconds to simulate the round trip to the real service.
+    """
+    handler = StandInHandler
+
+    def __init__(self, port=0, latency=0):
+        self.latency = latency
+        self.calls = Counter()
+        self.__lock = threading.Lock()
+        server = self
+
+        class Handler(self.handler):
+            stand_in = server
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.url = f'http://127.0.0.1:{self.port}'
+
+    def count(self, name, amount=1):
+        with self.__lock:
+            self.calls[name] += amount
+
+    def delay(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def stats(self):
+        with self.__lock:
+            return dict(self.calls)
+
+    def reset(self):
+        with self.__lock:
+            self.calls.clear()
+
+    @classmethod
+    def spawn(cls, **kwargs):
+        """
+        Runs the stand-in in a process of its own, so that it doesn't compete with the bot
+        for the GIL or show up in its memory
+        :return: StandInProcess
+        """
+        parent, child = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=cls.__serve, args=(child, kwargs), daemon=True)
+        process.start()
+        url = parent.recv()
+        if isinstance(url, Exception):
+            process.join()
+            raise url
+        return StandInProcess(process, url)
+
+    @classmethod
+    def __serve(cls, connection, kwargs):
+        try:
+            stand_in = cls(**kwargs)
+        except Exception as e:
+            connection.send(e)
+            return
+        connection.send(stand_in.url)
+        stand_in.server.serve_forever()
+
+
+class StandInProcess:
+    def __init__(self, process, url):
+        self.process = process
+        self.url = url
+
+    def __control(self, name, data=None):
+        with urllib.request.urlopen(f'{self.url}{CONTROL_PATH}{name}', data=data, timeout=30) as response:
+            return json.loads(response.read())
+
+    def stats(self):
+        """:return: dict of call name -> count"""
+        return self.__control('stats')
+
+    def reset(self):
+        self.__control('reset', b'')
+
+    def stop(self):
+        self.process.terminate()
+        self.process.join()
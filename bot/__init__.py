@@ -11,6 +11,8 @@ from megasdkrestclient import MegaSdkRestClient, errors as mega_err
 import subprocess
 import redis
 
+from bot.helper.mirror_utils.download_utils.aria2_client import TimedAria2Client
+
 socket.setdefaulttimeout(600)
 
 botStartTime = time.time()
@@ -41,7 +43,7 @@ except KeyError:
     pass
 
 aria2 = aria2p.API(
-    aria2p.Client(
+    TimedAria2Client(
         host="http://127.0.0.1",
         port=6800,
         secret="",
@@ -143,6 +145,132 @@ try:
 except KeyError:
     USE_SERVICE_ACCOUNTS = False
 
+try:
+    UPLOAD_WORKERS = int(getConfig('UPLOAD_WORKERS'))
+    if UPLOAD_WORKERS < 1:
+        UPLOAD_WORKERS = 1
+except (KeyError, ValueError):
+    UPLOAD_WORKERS = 4
+
+try:
+    UPLOAD_CHUNK_MIN = int(getConfig('UPLOAD_CHUNK_MIN')) * 1024 * 1024
+except (KeyError, ValueError):
+    UPLOAD_CHUNK_MIN = 8 * 1024 * 1024
+
+try:
+    UPLOAD_CHUNK_MAX = int(getConfig('UPLOAD_CHUNK_MAX')) * 1024 * 1024
+except (KeyError, ValueError):
+    UPLOAD_CHUNK_MAX = 256 * 1024 * 1024
+
+try:
+    CLONE_WORKERS = int(getConfig('CLONE_WORKERS'))
+    if CLONE_WORKERS < 1:
+        CLONE_WORKERS = 1
+except (KeyError, ValueError):
+    CLONE_WORKERS = 8
+
+try:
+    DRIVE_INDEX_SYNC_INTERVAL = int(getConfig('DRIVE_INDEX_SYNC_INTERVAL'))
+except (KeyError, ValueError):
+    DRIVE_INDEX_SYNC_INTERVAL = 300
+
+try:
+    DRIVE_INDEX_DB = getConfig('DRIVE_INDEX_DB')
+    if len(DRIVE_INDEX_DB) == 0:
+        raise KeyError
+except KeyError:
+    DRIVE_INDEX_DB = 'drive_index.db'
+
+try:
+    STREAM_TAR = getConfig('STREAM_TAR')
+    if STREAM_TAR.lower() == 'true':
+        STREAM_TAR = True
+    else:
+        STREAM_TAR = False
+except KeyError:
+    STREAM_TAR = False
+
+try:
+    EXTRACT_FOLDERS = getConfig('EXTRACT_FOLDERS')
+    if EXTRACT_FOLDERS.lower() == 'true':
+        EXTRACT_FOLDERS = True
+    else:
+        EXTRACT_FOLDERS = False
+except KeyError:
+    EXTRACT_FOLDERS = False
+
+try:
+    STATUS_EDIT_RATE_LIMIT = int(getConfig('STATUS_EDIT_RATE_LIMIT'))
+    if STATUS_EDIT_RATE_LIMIT < 1:
+        STATUS_EDIT_RATE_LIMIT = 1
+except (KeyError, ValueError):
+    STATUS_EDIT_RATE_LIMIT = 30
+
+try:
+    PIPELINED_UPLOAD = getConfig('PIPELINED_UPLOAD')
+    if PIPELINED_UPLOAD.lower() == 'true':
+        PIPELINED_UPLOAD = True
+    else:
+        PIPELINED_UPLOAD = False
+except KeyError:
+    PIPELINED_UPLOAD = False
+
+try:
+    PERSISTENT_JOBS = getConfig('PERSISTENT_JOBS')
+    if PERSISTENT_JOBS.lower() == 'true':
+        PERSISTENT_JOBS = True
+    else:
+        PERSISTENT_JOBS = False
+except KeyError:
+    PERSISTENT_JOBS = False
+
+try:
+    BOT_MODE = getConfig('BOT_MODE').lower()
+    if BOT_MODE not in ('standalone', 'frontend', 'worker'):
+        raise KeyError
+except KeyError:
+    BOT_MODE = 'standalone'
+
+try:
+    WORKER_ID = getConfig('WORKER_ID')
+    if len(WORKER_ID) == 0:
+        raise KeyError
+except KeyError:
+    WORKER_ID = socket.gethostname()
+
+try:
+    WORKER_JOBS = int(getConfig('WORKER_JOBS'))
+    if WORKER_JOBS < 1:
+        WORKER_JOBS = 1
+except (KeyError, ValueError):
+    WORKER_JOBS = 4
+
+try:
+    METRICS_PORT = int(getConfig('METRICS_PORT'))
+    if METRICS_PORT < 1:
+        METRICS_PORT = None
+except (KeyError, ValueError):
+    METRICS_PORT = None
+
+try:
+    METRICS_HOST = getConfig('METRICS_HOST')
+    if len(METRICS_HOST) == 0:
+        raise KeyError
+except KeyError:
+    METRICS_HOST = '127.0.0.1'
+
+# Key: stage of a mirror job, Value: (maximum number of jobs in it, maximum number of jobs of one user in it)
+# 0 means no limit
+JOB_LIMITS = {}
+for stage in ('DOWNLOAD', 'PROCESS', 'UPLOAD'):
+    stage_limits = []
+    for limit_name in (f'QUEUE_{stage}_LIMIT', f'QUEUE_USER_{stage}_LIMIT'):
+        try:
+            stage_limits.append(max(int(getConfig(limit_name)), 0))
+        except (KeyError, ValueError):
+            stage_limits.append(0)
+    JOB_LIMITS[stage.lower()] = tuple(stage_limits)
+
 updater = tg.Updater(token=BOT_TOKEN,use_context=True)
 bot = updater.bot
 dispatcher = updater.dispatcher
@@ -7,13 +7,17 @@ from sys import executable
 import time
 
 from telegram.ext import CommandHandler, run_async
-from bot import dispatcher, updater, botStartTime
-from bot.helper.ext_utils import fs_utils
+from bot import dispatcher, updater, botStartTime, PERSISTENT_JOBS, BOT_MODE, METRICS_PORT, METRICS_HOST, \
+    download_dict
+from bot.helper.ext_utils import fs_utils, metrics
+from bot.helper.ext_utils.job_queue import scheduler
+from bot.helper.ext_utils.job_store import job_store
+from bot.helper.mirror_utils.upload_utils.drive_index import drive_index
 from bot.helper.telegram_helper.bot_commands import BotCommands
 from bot.helper.telegram_helper.message_utils import *
 from .helper.ext_utils.bot_utils import get_readable_file_size, get_readable_time
 from .helper.telegram_helper.filters import CustomFilters
-from .modules import authorize, list, cancel_mirror, mirror_status, mirror, clone, watch
+from .modules import authorize, list, cancel_mirror, mirror_status, mirror, clone, watch, worker, trace
 
 
 @run_async
@@ -31,6 +35,13 @@ def stats(update, context):
             f'Free: {free}\n' \
             f'CPU: {cpuUsage}%\n' \
             f'RAM: {memory}%'
+    if drive_index.ready:
+        files, folders, size = drive_index.stats()
+        stats += f'\nMirrored: {files} files in {folders} folders, {get_readable_file_size(size)}'
+        duplicates = drive_index.duplicates(limit=-1)
+        if duplicates:
+            wasted = sum((copies - 1) * (size or 0) for md5, copies, size in duplicates)
+            stats += f'\nDuplicates: {len(duplicates)} files stored more than once, {get_readable_file_size(wasted)}'
     sendMessage(stats, context.bot, update)
 
 
@@ -47,7 +58,8 @@ Type /{BotCommands.HelpCommand} to get a list of available commands
 def restart(update, context):
     restart_message = sendMessage("Restarting, Please wait!", context.bot, update)
     # Save restart message object in order to reply to it after restarting
-    fs_utils.clean_all()
+    if not PERSISTENT_JOBS:
+        fs_utils.clean_all()
     with open('restart.pickle', 'wb') as status:
         pickle.dump(restart_message, status)
     execl(executable, executable, "-m", "bot")
@@ -85,7 +97,7 @@ def bot_help(update, context):
 
 /{BotCommands.StatusCommand}: Shows a status of all the downloads
 
-/{BotCommands.ListCommand} [search term]: Searches the search term in the Google drive, if found replies with the link
+/{BotCommands.ListCommand} [search term]: Searches the search term in the Google drive, if found replies with the link. Use /{BotCommands.ListCommand} -p [page] [search term] for more results
 
 /{BotCommands.StatsCommand}: Show Stats of the machine the bot is hosted on
 
@@ -93,12 +105,25 @@ def bot_help(update, context):
 
 /{BotCommands.LogCommand}: Get a log file of the bot. Handy for getting crash reports
 
+/{BotCommands.TraceCommand} [gid] [json]: Shows how long a mirror spent in each stage, or sends it as a JSON file. Also works as a reply to the mirror message
+
 '''
     sendMessage(help_string, context.bot, update)
 
 
 def main():
-    fs_utils.start_cleanup()
+    # The downloads of the mirrors which are picked up again are kept
+    fs_utils.start_cleanup(job_store.all() if PERSISTENT_JOBS else ())
+    if METRICS_PORT is not None:
+        metrics.QUEUE_DEPTH.set_function(scheduler.waiting_counts)
+        metrics.ACTIVE_MIRRORS.set_function(lambda: len(download_dict))
+        metrics.start_server(METRICS_HOST, METRICS_PORT)
+    if BOT_MODE == 'worker':
+        # Commands are handled by the frontend, a worker only runs the mirrors it queues
+        signal.signal(signal.SIGINT, fs_utils.exit_clean_up)
+        mirror.recover_jobs()
+        worker.run_worker()
+        return
     # Check if the bot is restarting
     if path.exists('restart.pickle'):
         with open('restart.pickle', 'rb') as status:
@@ -123,6 +148,10 @@ def main():
     dispatcher.add_handler(help_handler)
     dispatcher.add_handler(stats_handler)
     dispatcher.add_handler(log_handler)
+    drive_index.start()
+    if BOT_MODE == 'frontend':
+        worker.start_frontend()
+    mirror.recover_jobs()
     updater.start_polling()
     LOGGER.info("Bot Started!")
     signal.signal(signal.SIGINT, fs_utils.exit_clean_up)
@@ -1,9 +1,14 @@
+import base64
+import hashlib
 import logging
 import re
 import threading
 import time
+import urllib.parse as urlparse
+from collections import deque
 
-from bot import download_dict, download_dict_lock
+from bot import download_dict, download_dict_lock, BOT_MODE
+from bot.helper.ext_utils.worker_queue import worker_queue
 
 LOGGER = logging.getLogger(__name__)
 
@@ -20,6 +25,7 @@ class MirrorStatus:
     STATUS_CANCELLED = "Cancelled"
     STATUS_ARCHIVING = "Archiving"
     STATUS_EXTRACTING = "Extracting"
+    STATUS_CLONING = "Cloning"
 
 
 PROGRESS_MAX_SIZE = 100 // 8
@@ -46,6 +52,58 @@ class setInterval:
         self.stopEvent.set()
 
 
+class SpeedTracker:
+    """
+    Speed of a transfer over the last WINDOW seconds, fed with the bytes as they are processed.
+    Unlike the average since the start, it follows changes of the throughput and drops to 0 when
+    the transfer stalls.
+    """
+    WINDOW = 10
+    # Samples closer together than this are merged, so that small reads don't pile up samples
+    RESOLUTION = 0.5
+
+    def __init__(self, window=WINDOW):
+        self.__window = window
+        self.__lock = threading.Lock()
+        self.__total = 0
+        # (time, total) samples, the first one is the last sample from before the window
+        self.__samples = deque([(time.time(), 0)])
+
+    def __trim(self, now):
+        while len(self.__samples) > 1 and self.__samples[1][0] <= now - self.__window:
+            self.__samples.popleft()
+
+    def __record(self, now):
+        if len(self.__samples) > 1 and now - self.__samples[-2][0] < self.RESOLUTION:
+            self.__samples[-1] = (now, self.__total)
+        else:
+            self.__samples.append((now, self.__total))
+        self.__trim(now)
+
+    def add(self, count):
+        """:param count: bytes processed since the last call"""
+        with self.__lock:
+            self.__total += count
+            self.__record(time.time())
+
+    def update(self, total):
+        """:param total: bytes processed so far"""
+        with self.__lock:
+            self.__total = total
+            self.__record(time.time())
+
+    def speed(self):
+        """:return: speed in bytes/second"""
+        with self.__lock:
+            now = time.time()
+            self.__trim(now)
+            start, start_total = self.__samples[0]
+            try:
+                return max(self.__total - start_total, 0) / (now - start)
+            except ZeroDivisionError:
+                return 0
+
+
 def get_readable_file_size(size_in_bytes) -> str:
     if size_in_bytes is None:
         return '0B'
@@ -88,23 +146,101 @@ def get_progress_bar_string(status):
     return p_str
 
 
-def get_readable_message():
+def get_download_snapshot(download):
+    """
+    Reads everything the status message shows about a download, so that every accessor is called only once
+    :return: dict of the rendered values
+    """
+    status = download.status()
+    snapshot = {
+        'chat_id': download.message.chat.id if hasattr(download, 'message') else None,
+        'user_id': download.message.from_user.id if hasattr(download, 'message') else None,
+        'name': download.name(),
+        'status': status,
+        'progress_bar': get_progress_bar_string(download),
+        'progress': download.progress(),
+        'size': download.size(),
+        'speed': download.speed(),
+        'eta': download.eta(),
+    }
+    if hasattr(download, 'queue_position'):
+        snapshot['queue'] = download.queue_position()
+    if status == MirrorStatus.STATUS_DOWNLOADING:
+        if hasattr(download, 'is_torrent'):
+            aria_download = download.aria_download()
+            snapshot['connections'] = aria_download.connections
+            snapshot['seeders'] = aria_download.num_seeders
+        snapshot['gid'] = download.gid()
+    elif status == MirrorStatus.STATUS_CLONING:
+        snapshot['gid'] = download.gid()
+    elif status == MirrorStatus.STATUS_UPLOADING and hasattr(download, 'chunk_size'):
+        snapshot['chunk_size'] = download.chunk_size()
+    return snapshot
+
+
+def get_download_snapshots():
     with download_dict_lock:
-        msg = ""
-        for download in list(download_dict.values()):
-            msg += f"<i>{download.name()}</i> - "
-            msg += download.status()
-            if download.status() != MirrorStatus.STATUS_ARCHIVING and download.status() != MirrorStatus.STATUS_EXTRACTING:
-                msg += f"\n<code>{get_progress_bar_string(download)} {download.progress()}</code> of " \
-                       f"{download.size()}" \
-                       f" at {download.speed()}, ETA: {download.eta()} "
-            if download.status() == MirrorStatus.STATUS_DOWNLOADING:
-                if hasattr(download, 'is_torrent'):
-                    msg += f"| P: {download.aria_download().connections} " \
-                           f"| S: {download.aria_download().num_seeders}"
-                msg += f"\nGID: <code>{download.gid()}</code>"
-            msg += "\n\n"
-        return msg
+        downloads = list(download_dict.items())
+    snapshots = []
+    for uid, download in downloads:
+        try:
+            snapshot = get_download_snapshot(download)
+        except Exception as e:
+            # The download may have finished or failed in the meantime
+            LOGGER.error(f'Unable to read the status of a download: {e}')
+            continue
+        snapshot['uid'] = uid
+        snapshots.append(snapshot)
+    if BOT_MODE == 'frontend':
+        snapshots += get_worker_snapshots()
+    return snapshots
+
+
+def get_worker_snapshots():
+    """:return: snapshots of the mirrors running on the workers and of those waiting for one"""
+    snapshots = worker_queue.snapshots()
+    pending = worker_queue.pending()
+    for position, (uid, job) in enumerate(pending, 1):
+        snapshots.append({
+            'uid': uid,
+            'chat_id': job['message']['chat']['id'],
+            'user_id': job['message']['from']['id'],
+            'name': job['link'] or 'Telegram file',
+            'status': MirrorStatus.STATUS_WAITING,
+            'queue': ('worker', position, len(pending)),
+        })
+    return snapshots
+
+
+def get_readable_message(chat_id=None, snapshots=None):
+    """
+    :param chat_id: only show the downloads started in this chat
+    :param snapshots: snapshots of the downloads from get_download_snapshots, taken now if not given
+    """
+    if snapshots is None:
+        snapshots = get_download_snapshots()
+    msg = ""
+    for snapshot in snapshots:
+        if chat_id is not None and snapshot['chat_id'] != chat_id:
+            continue
+        msg += f"<i>{snapshot['name']}</i> - "
+        msg += snapshot['status']
+        if snapshot.get('queue') is not None:
+            stage, position, length = snapshot['queue']
+            msg += f"\nPosition in {stage} queue: {position} of {length}\n\n"
+            continue
+        msg += f"\n<code>{snapshot['progress_bar']} {snapshot['progress']}</code> of " \
+               f"{snapshot['size']}" \
+               f" at {snapshot['speed']}, ETA: {snapshot['eta']} "
+        if 'seeders' in snapshot:
+            msg += f"| P: {snapshot['connections']} " \
+                   f"| S: {snapshot['seeders']}"
+        if 'chunk_size' in snapshot:
+            msg += f"| Chunk: {snapshot['chunk_size']}"
+        if 'gid' in snapshot:
+            msg += f"\nGID: <code>{snapshot['gid']}</code>"
+        msg += "\n\n"
+    return msg
 
 
 def get_readable_time(seconds: int) -> str:
@@ -144,6 +280,74 @@ def is_magnet(url: str):
     return False
 
 
+def get_fingerprint(link=None, file=None):
+    """
+    Identifies the content of a link or of a Telegram file regardless of how the link is written
+    :param file: telegram Document, Video or Audio
+    :return: fingerprint or None
+    """
+    if file is not None:
+        return f'tg:{file.file_unique_id}'
+    if is_magnet(link):
+        info_hash = re.search(MAGNET_REGEX, link).group(0).split(':')[-1]
+        if len(info_hash) == 32:
+            # Base32 info hashes are old style, the same torrent also comes in hex
+            try:
+                info_hash = base64.b32decode(info_hash.upper()).hex()
+            except ValueError:
+                pass
+        return f'btih:{info_hash.lower()}'
+    if not is_url(link):
+        return None
+    if '://' not in link:
+        link = f'http://{link}'
+    url = urlparse.urlsplit(link)
+    query = urlparse.urlencode(sorted(urlparse.parse_qsl(url.query, keep_blank_values=True)))
+    # http and https links of a host serve the same content
+    scheme = '' if url.scheme.lower() in ('http', 'https') else url.scheme.lower()
+    return f"url:{urlparse.urlunsplit((scheme, url.netloc.lower(), url.path.rstrip('/'), query, ''))}"
+
+
+def _bencode_end(data, start):
+    """:return: offset after the bencoded value at start of data"""
+    kind = data[start:start + 1]
+    if kind == b'i':
+        return data.index(b'e', start) + 1
+    if kind in (b'l', b'd'):
+        end = start + 1
+        while data[end:end + 1] != b'e':
+            if end >= len(data):
+                raise ValueError('Truncated bencoded value')
+            end = _bencode_end(data, end)
+        return end + 1
+    colon = data.index(b':', start)
+    if not data[start:colon].isdigit():
+        raise ValueError('Invalid bencoded value')
+    return colon + 1 + int(data[start:colon])
+
+
+def get_torrent_fingerprint(data):
+    """
+    Identifies a .torrent file by the info hash of its info dict, which is what its magnet link carries
+    :param data: content of the .torrent file
+    :return: fingerprint as of get_fingerprint or None if data is no torrent
+    """
+    try:
+        if data[:1] != b'd':
+            return None
+        offset = 1
+        while data[offset:offset + 1] not in (b'e', b''):
+            key_end = _bencode_end(data, offset)
+            key = data[data.index(b':', offset) + 1:key_end]
+            value_end = _bencode_end(data, key_end)
+            if key == b'info':
+                return f'btih:{hashlib.sha1(data[key_end:value_end]).hexdigest()}'
+            offset = value_end
+    except ValueError:
+        pass
+    return None
+
+
 def new_thread(fn):
     """To use as decorator to make a function call threaded.
     Needs import
@@ -6,3 +6,8 @@ class DirectDownloadLinkException(Exception):
 class NotSupportedExtractionArchive(Exception):
     """The archive format use is trying to extract is not supported"""
     pass
+
+
+class ExtractionError(Exception):
+    """An archive could not be extracted"""
+    pass
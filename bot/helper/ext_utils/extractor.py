@@ -0,0 +1,366 @@
+import bz2
+import copy
+import gzip
+import logging
+import lzma
+import os
+import re
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import threading
+import zipfile
+from contextlib import contextmanager
+
+from .exceptions import ExtractionError, NotSupportedExtractionArchive
+
+LOGGER = logging.getLogger(__name__)
+
+READ_SIZE = 1024 * 1024
+# Archives which only contain archives are extracted again, up to this depth
+MAX_NESTING = 3
+
+# (suffix, kind, compression), the longest suffixes first. Kinds: 'tar', 'file' for a single compressed file
+# and '7z' for the formats 7z extracts
+_FORMATS = (
+    ('.tar.gz', 'tar', 'gz'), ('.tgz', 'tar', 'gz'),
+    ('.tar.bz2', 'tar', 'bz2'), ('.tbz2', 'tar', 'bz2'), ('.tbz', 'tar', 'bz2'),
+    ('.tar.xz', 'tar', 'xz'), ('.txz', 'tar', 'xz'),
+    ('.tar.zst', 'tar', 'zst'), ('.tzst', 'tar', 'zst'),
+    ('.tar.Z', 'tar', 'Z'),
+    ('.tar', 'tar', None),
+    ('.gz', 'file', 'gz'), ('.bz2', 'file', 'bz2'), ('.xz', 'file', 'xz'), ('.zst', 'file', 'zst'),
+    ('.Z', 'file', 'Z'),
+    ('.zip', '7z', None), ('.7z', '7z', None), ('.rar', '7z', None),
+)
+# Decompressors by compression, the multi-threaded ones first. The Python modules are used if none is installed
+_DECOMPRESSORS = {
+    'gz': (['pigz', '-dc'], ['gzip', '-dc']),
+    'bz2': (['pbzip2', '-dc'], ['lbzip2', '-dc'], ['bzip2', '-dc']),
+    'xz': (['xz', '-dc', '-T0'],),
+    'zst': (['zstd', '-dcq', '-T0'],),
+    'Z': (['gzip', '-dc'], ['uncompress', '-c']),
+}
+_MODULES = {'gz': gzip, 'bz2': bz2, 'xz': lzma}
+# Volumes of multi-part archives: name.part1.rar, name.7z.001, name.zip.001. 7z is given the first one
+_VOLUME = re.compile(r'(?P<base>.+?)(?:\.part(?P<part>\d+)\.rar|\.(?:7z|zip|rar)\.(?P<number>\d{3}))', re.I)
+# Further volumes of old style rar and split zip archives, which are opened through the .rar or .zip file
+_CONTINUATION = re.compile(r'.+\.(?:r|z)\d{2}', re.I)
+_PERCENT = re.compile(rb'(\d+)%')
+_TAR_FILTER = {'filter': 'tar'} if hasattr(tarfile, 'tar_filter') else {}
+# Modes folders get once their files are extracted: no set-id bits and not writable by others, as the tar filter
+_DIR_MODE_MASK = 0o1755
+
+
+def _parse(name):
+    """:return: (base name, kind, compression) of the archive name, None if it isn't one or a further volume"""
+    match = _VOLUME.fullmatch(name)
+    if match is not None:
+        number = match.group('part') or match.group('number')
+        return (match.group('base'), '7z', None) if int(number) == 1 else None
+    if _CONTINUATION.fullmatch(name):
+        return None
+    lower = name.lower()
+    for suffix, kind, compression in _FORMATS:
+        if lower.endswith(suffix.lower()) and len(name) > len(suffix):
+            return name[:-len(suffix)], kind, compression
+    return None
+
+
+def _is_volume(name):
+    return _parse(name) is not None or _VOLUME.fullmatch(name) is not None or _CONTINUATION.fullmatch(name) is not None
+
+
+def _volumes(path):
+    """:return: paths of all the volumes of the archive path"""
+    directory, name = os.path.split(path)
+    match = _VOLUME.fullmatch(name)
+    if match is None:
+        if not name.lower().endswith(('.rar', '.zip')):
+            return [path]
+        # name.r00 or name.z01
+        others = re.escape(name[:-4]) + r'\.' + name[-3] + r'\d{2}'
+    elif match.group('part') is not None:
+        others = re.escape(match.group('base')) + r'\.part\d+\.rar'
+    else:
+        others = re.escape(name[:-4]) + r'\.\d{3}'
+    others = re.compile(others, re.I)
+    return [path] + [os.path.join(directory, entry) for entry in sorted(os.listdir(directory or '.'))
+                     if entry != name and others.fullmatch(entry)]
+
+
+class _Progress:
+    """Sums up the archive bytes read by all the extractions of a mirror"""
+
+    def __init__(self, on_progress):
+        self.__on_progress = on_progress
+        self.__lock = threading.Lock()
+        self.processed_bytes = 0
+
+    def add(self, count):
+        with self.__lock:
+            self.processed_bytes += count
+            processed_bytes = self.processed_bytes
+        if self.__on_progress is not None:
+            self.__on_progress(processed_bytes)
+
+
+class _CountingReader:
+    """Read only file wrapper which reports the bytes read to a _Progress"""
+
+    def __init__(self, path, progress):
+        self.__file = open(path, 'rb')
+        self.__progress = progress
+
+    def read(self, size=-1):
+        data = self.__file.read(size)
+        self.__progress.add(len(data))
+        return data
+
+    def close(self):
+        self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _decompressor(compression):
+    """:return: command of the preferred installed decompressor, None to use the Python module"""
+    for command in _DECOMPRESSORS[compression]:
+        if shutil.which(command[0]) is not None:
+            return command
+    if compression not in _MODULES:
+        raise ExtractionError(f'No decompressor for .{compression} files is installed')
+    return None
+
+
+def _feed(source, pipe):
+    try:
+        with source:
+            for block in iter(lambda: source.read(READ_SIZE), b''):
+                pipe.write(block)
+    except OSError:
+        # The decompressor exited, its exit code tells why
+        pass
+    finally:
+        try:
+            pipe.close()
+        except OSError:
+            pass
+
+
+@contextmanager
+def _decompressed(path, compression, progress):
+    """
+    Yields a file object of the decompressed content of path. An external decompressor runs in its own
+    process, so that decompressing and writing the extracted files use different cores
+    """
+    command = _decompressor(compression)
+    source = _CountingReader(path, progress)
+    if command is None:
+        with source, _MODULES[compression].open(source) as stream:
+            yield stream
+        return
+    # A file rather than a pipe, a decompressor with lots of warnings would block on a full pipe otherwise
+    stderr = tempfile.TemporaryFile()
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=stderr)
+    feeder = threading.Thread(target=_feed, args=(source, process.stdin), daemon=True)
+    feeder.start()
+    try:
+        yield process.stdout
+        # Whatever wasn't needed, such as the padding at the end of a tar archive
+        while process.stdout.read(READ_SIZE):
+            pass
+    except BaseException:
+        process.kill()
+        raise
+    finally:
+        feeder.join()
+        process.stdout.close()
+        process.wait()
+        # The end of the warnings is enough for the error message
+        stderr.seek(max(stderr.seek(0, os.SEEK_END) - 2048, 0))
+        error = stderr.read().decode('utf-8', 'replace').strip()
+        stderr.close()
+    if process.returncode != 0:
+        raise ExtractionError(f'{command[0]} exited with {process.returncode}: {error}')
+
+
+def _is_safe(name):
+    return not os.path.isabs(name) and '..' not in name.replace('\\', '/').split('/')
+
+
+def _is_below(path, root):
+    return os.path.commonpath([path, root]) == root
+
+
+def _is_safe_member(member, destination):
+    """
+    :return: whether member is extracted below destination, and links to files below it if it is a link.
+    The paths are resolved with the links extracted so far, so that nothing is written through them either
+    """
+    if not _is_safe(member.name):
+        return False
+    root = os.path.realpath(destination)
+    if not _is_below(os.path.realpath(os.path.join(destination, member.name)), root):
+        return False
+    if member.issym():
+        target = os.path.join(destination, os.path.dirname(member.name), member.linkname)
+    elif member.islnk():
+        # Hard links name a member of the archive
+        target = os.path.join(destination, member.linkname)
+    else:
+        return True
+    return not os.path.isabs(member.linkname) and _is_below(os.path.realpath(target), root)
+
+
+def _extract_tar(path, compression, destination, progress):
+    os.makedirs(destination, exist_ok=True)
+    if compression is None:
+        source = _CountingReader(path, progress)
+    else:
+        source = _decompressed(path, compression, progress)
+    directories = []
+    with source as stream:
+        # Stream mode reads the archive front to back only, which is all a pipe allows
+        with tarfile.open(fileobj=stream, mode='r|', bufsize=READ_SIZE, copybufsize=READ_SIZE) as archive:
+            for member in archive:
+                if not _is_safe_member(member, destination):
+                    LOGGER.warning(f'Skipping {member.name} of {path}, it would be extracted outside of it')
+                    continue
+                if member.isdir():
+                    # Writable until its files are in, a read-only folder gets its mode at the end like extractall
+                    directories.append(member)
+                    member = copy.copy(member)
+                    member.mode = 0o700
+                archive.extract(member, destination, **_TAR_FILTER)
+    # The deepest first, so that setting the mode of a folder doesn't stop the ones in it from being changed
+    for member in sorted(directories, key=lambda member: member.name, reverse=True):
+        dir_path = os.path.join(destination, member.name)
+        os.utime(dir_path, (member.mtime, member.mtime))
+        os.chmod(dir_path, member.mode & _DIR_MODE_MASK)
+
+
+def _extract_file(path, compression, destination, progress):
+    with _decompressed(path, compression, progress) as stream, open(destination, 'wb') as f:
+        shutil.copyfileobj(stream, f, READ_SIZE)
+
+
+def _extract_zip(path, destination, progress):
+    with zipfile.ZipFile(path) as archive:
+        for member in archive.infolist():
+            archive.extract(member, destination)
+            progress.add(member.compress_size)
+
+
+def _extract_7z(path, destination, progress):
+    if shutil.which('7z') is None:
+        if path.lower().endswith('.zip'):
+            return _extract_zip(path, destination, progress)
+        raise ExtractionError('7z is not installed')
+    size = sum(os.path.getsize(volume) for volume in _volumes(path))
+    # -bsp1 writes the progress in percent to stdout, stdin is closed so that 7z can't wait for a password
+    process = subprocess.Popen(['7z', 'x', '-y', '-mmt=on', '-bsp1', '-bso0', f'-o{destination}', path],
+                               stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    reported = 0
+    output = b''
+    for chunk in iter(lambda: process.stdout.read1(READ_SIZE), b''):
+        # Only the end of the output is kept, for the error message
+        output = (output + chunk)[-2048:]
+        percentages = _PERCENT.findall(chunk)
+        if percentages:
+            processed = size * min(int(percentages[-1]), 100) // 100
+            if processed > reported:
+                progress.add(processed - reported)
+                reported = processed
+    process.wait()
+    # 1 stands for warnings, such as data after the end of the archive
+    if process.returncode > 1:
+        error = output.replace(b'\b', b'').decode('utf-8', 'replace').strip()
+        raise ExtractionError(f'7z exited with {process.returncode}: {error}')
+    if process.returncode == 1:
+        LOGGER.warning(f'7z reported warnings extracting {path}')
+    progress.add(size - reported)
+
+
+def _extract_archive(path, progress):
+    """
+    Extracts the archive path next to it and deletes its volumes
+    :return: path of the extracted file or folder
+    """
+    base, kind, compression = _parse(os.path.basename(path))
+    destination = os.path.join(os.path.dirname(path), base)
+    LOGGER.info(f'Extracting {path} into {destination}')
+    try:
+        if kind == 'tar':
+            _extract_tar(path, compression, destination, progress)
+        elif kind == 'file':
+            _extract_file(path, compression, destination, progress)
+        else:
+            _extract_7z(path, destination, progress)
+    except ExtractionError:
+        raise
+    except Exception as e:
+        # Broken archives show up as all kinds of errors of tarfile, zipfile and the decompression modules
+        raise ExtractionError(f'Unable to extract {os.path.basename(path)}: {e}') from e
+    for volume in _volumes(path):
+        os.remove(volume)
+    return destination
+
+
+def _extract_nested(output, progress, depth=1):
+    """Extracts the output of an archive as well if it consists of archives only, like a zip of rar volumes"""
+    if depth > MAX_NESTING:
+        return
+    if not os.path.isdir(output):
+        if _parse(os.path.basename(output)) is not None:
+            _extract_nested(_extract_archive(output, progress), progress, depth + 1)
+        return
+    entries = os.listdir(output)
+    if not entries or not all(os.path.isfile(os.path.join(output, name)) and _is_volume(name) for name in entries):
+        return
+    for name in sorted(entries):
+        if _parse(name) is not None:
+            _extract_nested(_extract_archive(os.path.join(output, name), progress), progress, depth + 1)
+
+
+def _archives_in(directory):
+    for root, dirs, files in os.walk(directory):
+        for name in sorted(files):
+            if _parse(name) is not None:
+                yield os.path.join(root, name)
+
+
+def can_extract(path):
+    """:return: whether path is an archive, or a folder with archives in it"""
+    if os.path.isdir(path):
+        return next(_archives_in(path), None) is not None
+    return _parse(os.path.basename(path)) is not None
+
+
+def extract(path, on_progress=None):
+    """
+    Extracts the archive path next to it, or all the archives in the folder path in place.
+    The first volume of a multi-part archive stands for all of them. Archives are deleted once they are extracted.
+    :param on_progress: called with the number of bytes of the archives read so far
+    :return: path of the extracted files
+    :raises NotSupportedExtractionArchive: if path is no archive or has none in it
+    :raises ExtractionError: if an archive can't be extracted
+    """
+    progress = _Progress(on_progress)
+    if os.path.isdir(path):
+        archives = list(_archives_in(path))
+        if not archives:
+            raise NotSupportedExtractionArchive('No archives to extract in the folder')
+        for archive in archives:
+            _extract_nested(_extract_archive(archive, progress), progress)
+        return path
+    if _parse(os.path.basename(path)) is None:
+        raise NotSupportedExtractionArchive('File format not supported for extraction')
+    output = _extract_archive(path, progress)
+    _extract_nested(output, progress)
+    return output
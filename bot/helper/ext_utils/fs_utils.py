@@ -1,11 +1,18 @@
+import hashlib
 import sys
-from bot import aria2, LOGGER, DOWNLOAD_DIR
+from bot import aria2, LOGGER, DOWNLOAD_DIR, PERSISTENT_JOBS
 import shutil
 import os
 import pathlib
-import magic
 import tarfile
-from .exceptions import NotSupportedExtractionArchive
+import time
+from concurrent.futures import ThreadPoolExecutor
+from . import extractor
+from .mime_types import mime_types
+from .bot_utils import get_readable_file_size, get_readable_time
+
+# Threads scanning the top level folders of a folder for scan_path
+SCAN_WORKERS = 4
 
 
 def clean_download(path: str):
@@ -14,11 +21,26 @@ def clean_download(path: str):
         shutil.rmtree(path)
 
 
-def start_cleanup():
-    try:
-        shutil.rmtree(DOWNLOAD_DIR)
-    except FileNotFoundError:
-        pass
+def start_cleanup(keep=()):
+    """
+    :param keep: uids of the mirrors whose downloads are kept, to be picked up again
+    """
+    if not keep:
+        try:
+            shutil.rmtree(DOWNLOAD_DIR)
+        except FileNotFoundError:
+            pass
+        return
+    keep = {str(uid) for uid in keep}
+    if not os.path.isdir(DOWNLOAD_DIR):
+        return
+    for entry in os.scandir(DOWNLOAD_DIR):
+        if entry.name in keep:
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path)
+        else:
+            os.remove(entry.path)
 
 
 def clean_all():
@@ -30,6 +52,9 @@ def clean_all():
 
 
 def exit_clean_up(signal, frame):
+    if PERSISTENT_JOBS:
+        LOGGER.info("Keeping the downloads, the running mirrors are picked up again on the next start")
+        sys.exit(0)
     try:
         LOGGER.info("Please wait, while we clean up the downloads and stop running downloads")
         clean_all()
@@ -39,56 +64,144 @@ def exit_clean_up(signal, frame):
         sys.exit(1)
 
 
+class PathManifest:
+    """Everything below a path, as found by scan_path"""
+
+    def __init__(self, path):
+        self.path = path
+        self.size = 0
+        # (path, size) of every file, in the order of the directory listings
+        self.files = []
+        # Paths of the folders below path, every folder comes before the folders in it
+        self.dirs = []
+
+    def _add(self, other):
+        self.size += other.size
+        self.files += other.files
+        self.dirs += other.dirs
+
+
+def _scan_dir(directory, manifest, recursive=True):
+    """:return: the folders of directory, which are scanned as well if recursive"""
+    subdirs = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            # Symbolic links are left out, a link to a folder above would be scanned forever
+            # and the uploader can't upload links anyway
+            if entry.is_symlink():
+                continue
+            # The type comes with the directory listing, only files need a stat call for their size
+            if entry.is_dir(follow_symlinks=False):
+                manifest.dirs.append(entry.path)
+                subdirs.append(entry.path)
+            else:
+                size = entry.stat(follow_symlinks=False).st_size
+                manifest.files.append((entry.path, size))
+                manifest.size += size
+    if recursive:
+        for subdir in subdirs:
+            _scan_dir(subdir, manifest)
+    return subdirs
+
+
+def _scan_tree(directory):
+    manifest = PathManifest(directory)
+    _scan_dir(directory, manifest)
+    return manifest
+
+
+def scan_path(path):
+    """
+    Lists the files below path with their sizes. Its folders are scanned in parallel
+    :return: PathManifest
+    """
+    manifest = PathManifest(path)
+    if not os.path.isdir(path):
+        manifest.size = os.path.getsize(path)
+        manifest.files.append((path, manifest.size))
+        return manifest
+    subdirs = _scan_dir(path, manifest, recursive=False)
+    if len(subdirs) < 2:
+        for subdir in subdirs:
+            _scan_dir(subdir, manifest)
+        return manifest
+    with ThreadPoolExecutor(max_workers=min(SCAN_WORKERS, len(subdirs))) as executor:
+        for subtree in executor.map(_scan_tree, subdirs):
+            manifest._add(subtree)
+    return manifest
+
+
 def get_path_size(path):
-    if os.path.isfile(path):
-        return os.path.getsize(path)
-    total_size = 0
-    for root, dirs, files in os.walk(path):
-        for f in files:
-            abs_path = os.path.join(root, f)
-            total_size += os.path.getsize(abs_path)
-    return total_size
+    return scan_path(path).size
 
 
-def tar(org_path):
+class _ProgressWriter:
+    """Write only file wrapper which reports the number of bytes written so far"""
+
+    def __init__(self, fileobj, on_progress=None):
+        self.__fileobj = fileobj
+        self.__on_progress = on_progress
+        self.written_bytes = 0
+
+    def write(self, data):
+        self.__fileobj.write(data)
+        self.written_bytes += len(data)
+        if self.__on_progress is not None:
+            self.__on_progress(self.written_bytes)
+        return len(data)
+
+
+def _log_throughput(action, path, processed_bytes, start_time):
+    elapsed = time.time() - start_time
+    try:
+        speed = processed_bytes / elapsed
+    except ZeroDivisionError:
+        speed = 0
+    LOGGER.info(f'{action}: {path} took {get_readable_time(elapsed)} for '
+                f'{get_readable_file_size(processed_bytes)} ({get_readable_file_size(speed)}/s)')
+
+
+def tar(org_path, on_progress=None):
+    """
+    Archives org_path into org_path.tar
+    :param on_progress: called with the number of bytes of the archive written so far
+    :return: path of the archive
+    """
     tar_path = org_path + ".tar"
     path = pathlib.PurePath(org_path)
     LOGGER.info(f'Tar: orig_path: {org_path}, tar_path: {tar_path}')
-    tar = tarfile.open(tar_path, "w")
-    tar.add(org_path, arcname=path.name)
-    tar.close()
+    start_time = time.time()
+    with open(tar_path, 'wb') as f:
+        writer = _ProgressWriter(f, on_progress)
+        # Stream mode only ever writes to the file object, which lets us count the bytes
+        tar = tarfile.open(fileobj=writer, mode="w|")
+        tar.add(org_path, arcname=path.name)
+        tar.close()
+    _log_throughput('Tar', tar_path, writer.written_bytes, start_time)
     return tar_path
 
 
-def get_base_name(orig_path: str):
-    if orig_path.endswith(".tar.bz2"):
-        return orig_path.replace(".tar.bz2", "")
-    elif orig_path.endswith(".tar.gz"):
-        return orig_path.replace(".tar.gz", "")
-    elif orig_path.endswith(".bz2"):
-        return orig_path.replace(".bz2", "")
-    elif orig_path.endswith(".gz"):
-        return orig_path.replace(".gz", "")
-    elif orig_path.endswith(".tar"):
-        return orig_path.replace(".tar", "")
-    elif orig_path.endswith(".tbz2"):
-        return orig_path.replace("tbz2", "")
-    elif orig_path.endswith(".tgz"):
-        return orig_path.replace(".tgz", "")
-    elif orig_path.endswith(".zip"):
-        return orig_path.replace(".zip", "")
-    elif orig_path.endswith(".7z"):
-        return orig_path.replace(".7z", "")
-    elif orig_path.endswith(".Z"):
-        return orig_path.replace(".Z", "")
-    elif orig_path.endswith(".rar"):
-        return orig_path.replace(".rar", "")
-    else:
-        raise NotSupportedExtractionArchive('File format not supported for extraction')
+def extract(path, on_progress=None, size=None):
+    """
+    Extracts the archive path, or the archives in the folder path, see extractor.extract
+    :param on_progress: called with the number of bytes of the archives read so far
+    :param size: size of path, if it is known already
+    :return: path of the extracted files
+    """
+    archive_size = size if size is not None else get_path_size(path)
+    start_time = time.time()
+    extracted_path = extractor.extract(path, on_progress)
+    _log_throughput('Extract', path, archive_size, start_time)
+    return extracted_path
+
+
+def get_md5(file_path):
+    md5 = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(4 * 1024 * 1024), b''):
+            md5.update(block)
+    return md5.hexdigest()
 
 
 def get_mime_type(file_path):
-    mime = magic.Magic(mime=True)
-    mime_type = mime.from_file(file_path)
-    mime_type = mime_type if mime_type else "text/plain"
-    return mime_type
+    return mime_types.get(file_path)
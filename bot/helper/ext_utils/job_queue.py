@@ -0,0 +1,141 @@
+import threading
+
+from bot import JOB_LIMITS
+
+
+class JobStage:
+    DOWNLOAD = 'download'
+    PROCESS = 'process'
+    UPLOAD = 'upload'
+
+
+class _Waiter:
+    def __init__(self, uid, user_id):
+        self.uid = uid
+        self.user_id = user_id
+        self.admitted = False
+        self.event = threading.Event()
+
+
+class _StageQueue:
+    def __init__(self, limit, user_limit):
+        # 0 means no limit
+        self.limit = limit
+        self.user_limit = user_limit
+        # Key: uid of the job, Value: id of the user who started it
+        self.running = {}
+        self.waiting = []
+
+    def fits(self, user_id):
+        if self.limit and len(self.running) >= self.limit:
+            return False
+        if self.user_limit and list(self.running.values()).count(user_id) >= self.user_limit:
+            return False
+        return True
+
+
+class JobScheduler:
+    """
+    Admission control for the stages of mirror jobs. Every stage has its own global and per user
+    concurrency limit, jobs which don't fit wait in a FIFO queue of that stage.
+    """
+
+    def __init__(self, limits):
+        self.__lock = threading.Lock()
+        self.__stages = {stage: _StageQueue(*stage_limits) for stage, stage_limits in limits.items()}
+        # Key: uid of the job, Value: (stage, _Waiter) the job is waiting for. Admitted waiters are kept
+        # until wait() has seen them, the job may only get to call it after it has been admitted
+        self.__waiters = {}
+
+    def enqueue(self, stage, uid, user_id):
+        """
+        Admits the job uid into stage, or queues it if the stage is full
+        :return: True if the job was admitted right away, else wait() has to be called
+        """
+        queue = self.__stages[stage]
+        with self.__lock:
+            # Queued jobs which fit are admitted as soon as a slot frees up, so nobody is skipped here
+            if queue.fits(user_id):
+                queue.running[uid] = user_id
+                return True
+            waiter = _Waiter(uid, user_id)
+            queue.waiting.append(waiter)
+            self.__waiters[uid] = (stage, waiter)
+            return False
+
+    def restore(self, stage, uid, user_id):
+        """
+        Counts the job uid as running in stage, even beyond the limits, for jobs which were
+        already running there before a restart
+        """
+        with self.__lock:
+            self.__stages[stage].running[uid] = user_id
+
+    def wait(self, uid):
+        """
+        Blocks until the queued job uid is admitted
+        :return: False if the job was cancelled while it was queued
+        """
+        with self.__lock:
+            try:
+                stage, waiter = self.__waiters[uid]
+            except KeyError:
+                return False
+        waiter.event.wait()
+        with self.__lock:
+            self.__waiters.pop(uid, None)
+        return waiter.admitted
+
+    def release(self, stage, uid):
+        queue = self.__stages[stage]
+        with self.__lock:
+            if queue.running.pop(uid, None) is not None:
+                self.__admit(queue)
+
+    def release_all(self, uid):
+        for stage in self.__stages:
+            self.release(stage, uid)
+        self.cancel(uid)
+
+    def cancel(self, uid):
+        """
+        Removes the job uid from the queue it is waiting in
+        :return: True if the job was queued
+        """
+        with self.__lock:
+            stage, waiter = self.__waiters.get(uid, (None, None))
+            if waiter is None or waiter.admitted:
+                return False
+            del self.__waiters[uid]
+            self.__stages[stage].waiting.remove(waiter)
+        waiter.event.set()
+        return True
+
+    def position(self, uid):
+        """:return: (stage, position in its queue starting from 1, length of the queue) or None if not queued"""
+        with self.__lock:
+            stage, waiter = self.__waiters.get(uid, (None, None))
+            if waiter is None or waiter.admitted:
+                return None
+            waiting = self.__stages[stage].waiting
+            return stage, waiting.index(waiter) + 1, len(waiting)
+
+    def queued_count(self):
+        with self.__lock:
+            return sum(not waiter.admitted for stage, waiter in self.__waiters.values())
+
+    def waiting_counts(self):
+        """:return: dict of stage -> number of jobs waiting for it"""
+        with self.__lock:
+            return {stage: len(queue.waiting) for stage, queue in self.__stages.items()}
+
+    def __admit(self, queue):
+        for waiter in list(queue.waiting):
+            if queue.fits(waiter.user_id):
+                queue.waiting.remove(waiter)
+                queue.running[waiter.uid] = waiter.user_id
+                waiter.admitted = True
+                waiter.event.set()
+
+
+scheduler = JobScheduler(JOB_LIMITS)
@@ -0,0 +1,80 @@
+import json
+import logging
+import threading
+
+import redis
+
+import bot
+from bot import BOT_MODE, WORKER_ID
+
+LOGGER = logging.getLogger(__name__)
+
+
+class JobState:
+    # The source is being downloaded
+    DOWNLOAD = 'download'
+    # The download is complete, it is being archived or extracted
+    DOWNLOADED = 'downloaded'
+    # path is being uploaded
+    UPLOAD = 'upload'
+
+
+class JobStore:
+    """
+    State of the running mirror jobs, kept in redis so that the jobs can be picked up again after a restart.
+    Every job is a JSON object in the hash bots:jobs, or bots:jobs:<worker> on a worker, under its uid,
+    with the fields:
+        message      the command message as a dict, the listener is rebuilt from it
+        is_tar, extract, tag, fingerprint
+        source       'aria2', 'mega', 'telegram' or 'youtube-dl'
+        link         link of aria2, mega and youtube-dl downloads
+        quality      format of youtube-dl downloads
+        gid          gid of the aria2 download
+        state        JobState of the job
+        name, size   name and size of the download once it is complete
+        path         what is being uploaded
+        dir_id       Drive folder of a folder upload, its files are skipped when the upload is resumed
+    Without redis nothing is persisted.
+    """
+
+    def __init__(self, key):
+        self.__key = key
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def __call(name, *args):
+        # redis is connected in the background at startup
+        client = bot.redis_client
+        if client is None:
+            return None
+        try:
+            return getattr(client, name)(*args)
+        except redis.RedisError as e:
+            LOGGER.error(f'Job store: {e}')
+            return None
+
+    def save(self, uid, **job):
+        with self.__lock:
+            self.__call('hset', self.__key, uid, json.dumps(job))
+
+    def update(self, uid, **fields):
+        """Changes fields of the job uid, if it is stored"""
+        with self.__lock:
+            job = self.__call('hget', self.__key, uid)
+            if job is None:
+                return
+            job = json.loads(job)
+            job.update(fields)
+            self.__call('hset', self.__key, uid, json.dumps(job))
+
+    def delete(self, uid):
+        with self.__lock:
+            self.__call('hdel', self.__key, uid)
+
+    def all(self):
+        """:return: Dict of uid -> job"""
+        jobs = self.__call('hgetall', self.__key) or {}
+        return {int(uid): json.loads(job) for uid, job in jobs.items()}
+
+
+job_store = JobStore(f'bots:jobs:{WORKER_ID}' if BOT_MODE == 'worker' else 'bots:jobs')
@@ -0,0 +1,189 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import redis
+
+import bot
+
+LOGGER = logging.getLogger(__name__)
+
+
+class JobTrace:
+    """
+    Timed spans of the stages a mirror job went through, to find out where the time of a slow mirror went.
+    Operations which are repeated for every file, such as detecting the mime type, are summed up
+    into a count and a total instead of getting a span each.
+    The trace is saved whenever a span ends, and is looked up by /trace with the uid or any gid of the job.
+    """
+
+    def __init__(self, uid, started=None):
+        self.uid = uid
+        self.started = started or time.time()
+        self.name = None
+        # 'running', 'completed' or the error the job failed with
+        self.result = 'running'
+        self.finished = None
+        self.gids = []
+        self.__lock = threading.Lock()
+        # Finished spans, dicts of name, start (seconds after the job started) and duration
+        self.__spans = []
+        # Key: name, Value: start time of a span which didn't end yet
+        self.__open = {}
+        # Key: name of a repeated operation, Value: [count, total seconds]
+        self.__totals = {}
+
+    def start(self, name):
+        with self.__lock:
+            self.__open[name] = time.time()
+
+    def end(self, name):
+        """Ends the span name, if it was started"""
+        with self.__lock:
+            started = self.__open.pop(name, None)
+            if started is None:
+                return
+            self.__spans.append(dict(name=name, start=round(started - self.started, 3),
+                                     duration=round(time.time() - started, 3)))
+        self.save()
+
+    @contextmanager
+    def span(self, name):
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.end(name)
+
+    @contextmanager
+    def timed(self, name):
+        """Adds the time taken to the total of the repeated operation name"""
+        started = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - started
+            with self.__lock:
+                total = self.__totals.setdefault(name, [0, 0])
+                total[0] += 1
+                total[1] += elapsed
+
+    def add_gid(self, gid):
+        with self.__lock:
+            if gid is None or gid in self.gids:
+                return
+            self.gids.append(gid)
+        trace_store.map_gid(gid, self.uid)
+
+    def finish(self, result='completed'):
+        with self.__lock:
+            now = time.time()
+            # Spans of stages the job never got out of, because it failed or was cancelled in them
+            for name, started in self.__open.items():
+                self.__spans.append(dict(name=name, start=round(started - self.started, 3),
+                                         duration=round(now - started, 3)))
+            self.__open.clear()
+            self.result = result
+            self.finished = now
+        self.save()
+
+    def save(self):
+        trace_store.save(self)
+
+    def to_dict(self):
+        with self.__lock:
+            return dict(uid=self.uid, name=self.name, started=self.started, finished=self.finished,
+                        result=self.result, gids=list(self.gids),
+                        spans=sorted(self.__spans, key=lambda span: span['start']),
+                        running=[dict(name=name, start=round(started - self.started, 3))
+                                 for name, started in self.__open.items()],
+                        totals={name: dict(count=count, seconds=round(seconds, 3))
+                                for name, (count, seconds) in self.__totals.items()})
+
+    @classmethod
+    def from_dict(cls, data):
+        """Continues a trace which was saved by another process, the spans which were running are lost"""
+        trace = cls(data['uid'], data['started'])
+        trace.name = data['name']
+        trace.gids = data['gids']
+        trace.__spans = data['spans']
+        trace.__totals = {name: [total['count'], total['seconds']] for name, total in data['totals'].items()}
+        return trace
+
+
+class TraceStore:
+    """
+    Traces of the recent mirror jobs, kept in redis for TRACE_TTL seconds so that the traces of jobs which ran
+    on workers or before a restart can be looked up too. The latest traces are also kept in memory.
+    """
+    TRACE_TTL = 7 * 24 * 60 * 60
+    MEMORY_TRACES = 100
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        # Key: uid, Value: JobTrace
+        self.__traces = OrderedDict()
+        # Key: gid, Value: uid
+        self.__gids = {}
+
+    @staticmethod
+    def __call(name, *args, **kwargs):
+        # redis is connected in the background at startup
+        client = bot.redis_client
+        if client is None:
+            return None
+        try:
+            return getattr(client, name)(*args, **kwargs)
+        except redis.RedisError as e:
+            LOGGER.error(f'Trace store: {e}')
+            return None
+
+    def save(self, trace):
+        with self.__lock:
+            self.__traces[trace.uid] = trace
+            self.__traces.move_to_end(trace.uid)
+            while len(self.__traces) > self.MEMORY_TRACES:
+                uid, old = self.__traces.popitem(last=False)
+                for gid in old.gids:
+                    self.__gids.pop(gid, None)
+        self.__call('set', f'bots:trace:{trace.uid}', json.dumps(trace.to_dict()), ex=self.TRACE_TTL)
+
+    def map_gid(self, gid, uid):
+        with self.__lock:
+            self.__gids[gid] = uid
+        self.__call('set', f'bots:trace_gid:{gid}', uid, ex=self.TRACE_TTL)
+
+    def load(self, uid):
+        """:return: the JobTrace of the job uid, continued from its saved state, or None"""
+        with self.__lock:
+            trace = self.__traces.get(uid)
+        if trace is not None:
+            return trace
+        data = self.__call('get', f'bots:trace:{uid}')
+        return JobTrace.from_dict(json.loads(data)) if data else None
+
+    def find(self, gid):
+        """:return: the saved trace of the job with the gid or uid gid as a dict, or None"""
+        # redis comes first, the job may have been continued by a worker
+        uid = self.__call('get', f'bots:trace_gid:{gid}') or _to_uid(gid)
+        data = self.__call('get', f'bots:trace:{uid}') if uid is not None else None
+        if data:
+            return json.loads(data)
+        with self.__lock:
+            uid = self.__gids.get(gid)
+            trace = self.__traces.get(uid if uid is not None else _to_uid(gid))
+        return trace.to_dict() if trace is not None else None
+
+
+def _to_uid(gid):
+    # Queued mirrors show their uid as gid
+    try:
+        return int(gid)
+    except ValueError:
+        return None
+
+
+trace_store = TraceStore()
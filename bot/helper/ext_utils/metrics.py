@@ -0,0 +1,189 @@
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        # Key: tuple of the label values
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _samples(self):
+        """:return: list of (name suffix, label values, extra labels, value)"""
+        with self._lock:
+            return [('', key, (), value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        for suffix, key, extra, value in self._samples():
+            lines.append(f'{self.name}{suffix}{_format_labels(self.labels, key, extra)} {_format_value(value)}')
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError('Counters can only go up')
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self.__function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function):
+        """
+        :param function: called whenever the metrics are collected, returns the value or, with labels,
+        a dict of label values -> value, where the label values are a tuple or the value of the only label
+        """
+        self.__function = function
+
+    def _samples(self):
+        if self.__function is None:
+            return super()._samples()
+        try:
+            values = self.__function()
+        except Exception as e:
+            LOGGER.error(f'Unable to collect {self.name}: {e}')
+            return []
+        if not self.labels:
+            values = {(): values}
+        keys = (key if isinstance(key, tuple) else (key,) for key in values)
+        return sorted(('', tuple(map(str, key)), (), value) for key, value in zip(keys, values.values()))
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=()):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0))
+            # Counts per bucket, made cumulative when rendered
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append(('_bucket', key, (('le', _format_value(bound)),), cumulative))
+            samples.append(('_sum', key, (), total))
+            samples.append(('_count', key, (), cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """Metrics of the bot, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self.__metrics = []
+
+    def __add(self, metric):
+        self.__metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.__add(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self.__add(Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=()):
+        return self.__add(Histogram(name, documentation, labels, buckets))
+
+    def render(self):
+        return '\n'.join(metric.render() for metric in self.__metrics) + '\n'
+
+
+registry = MetricsRegistry()
+
+DOWNLOAD_BYTES = registry.counter('mirror_download_bytes_total', 'Bytes of the finished downloads', ['source'])
+UPLOAD_BYTES = registry.counter('mirror_upload_bytes_total', 'Bytes Drive committed for uploads')
+STAGE_DURATION = registry.histogram(
+    'mirror_stage_duration_seconds', 'Time mirrors spent downloading, archiving, extracting and uploading',
+    ['stage'], buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400, 28800))
+QUEUE_DEPTH = registry.gauge('mirror_queue_depth', 'Mirrors waiting for a slot in a stage', ['stage'])
+ACTIVE_MIRRORS = registry.gauge('mirror_active', 'Mirrors in progress, queued ones included')
+DRIVE_CALLS = registry.counter('drive_api_calls_total', 'Requests made to the Drive API', ['method'])
+DRIVE_ERRORS = registry.counter('drive_api_errors_total', 'Drive API requests which failed', ['method', 'reason'])
+DRIVE_RETRIES = registry.counter('drive_api_retries_total', 'Drive API operations which were tried again',
+                                 ['reason'])
+ARIA2_RPC_DURATION = registry.histogram('aria2_rpc_duration_seconds', 'Time aria2 took to answer JSON-RPC calls',
+                                        ['method'], buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                                                             0.5, 1, 2.5, 5))
+TELEGRAM_EDIT_FAILURES = registry.counter('telegram_edit_failures_total', 'Status message edits which failed',
+                                          ['reason'])
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scraped every few seconds, that isn't worth a log line
+        pass
+
+
+def start_server(host, port):
+    """Serves the metrics at http://host:port/metrics in the background"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    LOGGER.info(f'Serving metrics on http://{host}:{port}/metrics')
+    return server
@@ -0,0 +1,119 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+import magic
+
+# Threads detecting the types of the files of a folder ahead of its upload. libmagic is called through ctypes,
+# which releases the GIL, so they really run in parallel
+DETECT_WORKERS = 4
+# Number of detected types which are remembered
+CACHE_SIZE = 50000
+
+# Types of extensions whose files libmagic identifies as the same type anyway, they aren't read at all.
+# Extensions shared by different kinds of files, like .ts for TypeScript and MPEG transport streams, are left out
+_EXTENSION_TYPES = {
+    '.mkv': 'video/x-matroska', '.mp4': 'video/mp4', '.webm': 'video/webm', '.avi': 'video/x-msvideo',
+    '.mov': 'video/quicktime', '.flv': 'video/x-flv',
+    '.mp3': 'audio/mpeg', '.flac': 'audio/flac', '.opus': 'audio/ogg', '.wav': 'audio/x-wav',
+    '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png', '.gif': 'image/gif', '.webp': 'image/webp',
+    '.pdf': 'application/pdf', '.epub': 'application/epub+zip',
+    '.zip': 'application/zip', '.rar': 'application/x-rar', '.7z': 'application/x-7z-compressed',
+    '.gz': 'application/gzip', '.bz2': 'application/x-bzip2', '.xz': 'application/x-xz',
+    '.tar': 'application/x-tar', '.iso': 'application/x-iso9660-image',
+}
+
+
+class MimeTypes:
+    """
+    Detects the mime types of the files to upload.
+    Known extensions are answered without reading the file, every thread keeps its own libmagic handle,
+    and the types are cached by inode and modification time, so that a file is only read once
+    even if the types of a whole folder were detected ahead of its upload by prefetch.
+    """
+
+    def __init__(self):
+        self.__local = threading.local()
+        self.__lock = threading.Lock()
+        # Key: (device, inode, modification time), Value: mime type
+        self.__cache = OrderedDict()
+        # Key: as in __cache, Value: future of a detection which is running or queued
+        self.__pending = {}
+        self.__executor = ThreadPoolExecutor(max_workers=DETECT_WORKERS, thread_name_prefix='mime')
+
+    def __magic(self):
+        # Magic objects are not thread safe
+        handle = getattr(self.__local, 'magic', None)
+        if handle is None:
+            handle = self.__local.magic = magic.Magic(mime=True)
+        return handle
+
+    @staticmethod
+    def __key(file_path):
+        stat = os.stat(file_path)
+        return stat.st_dev, stat.st_ino, stat.st_mtime_ns
+
+    def __detect(self, file_path, key):
+        try:
+            mime_type = self.__magic().from_file(file_path) or 'text/plain'
+        except Exception:
+            with self.__lock:
+                self.__pending.pop(key, None)
+            raise
+        with self.__lock:
+            self.__cache[key] = mime_type
+            while len(self.__cache) > CACHE_SIZE:
+                self.__cache.popitem(last=False)
+            self.__pending.pop(key, None)
+        return mime_type
+
+    def get(self, file_path):
+        mime_type = _EXTENSION_TYPES.get(os.path.splitext(file_path)[1].lower())
+        if mime_type is not None:
+            return mime_type
+        key = self.__key(file_path)
+        with self.__lock:
+            mime_type = self.__cache.get(key)
+            pending = self.__pending.get(key)
+        if mime_type is not None:
+            return mime_type
+        if pending is not None:
+            try:
+                return pending.result()
+            except CancelledError:
+                # prefetch's detection was cancelled before it started
+                pass
+        return self.__detect(file_path, key)
+
+    def prefetch(self, file_paths):
+        """
+        Detects the types of file_paths in the background, in their order
+        :return: futures of the detections, to be cancelled if they aren't needed anymore
+        """
+        futures = []
+        for file_path in file_paths:
+            if os.path.splitext(file_path)[1].lower() in _EXTENSION_TYPES:
+                continue
+            try:
+                key = self.__key(file_path)
+            except OSError:
+                continue
+            with self.__lock:
+                if key in self.__cache or key in self.__pending:
+                    continue
+                future = self.__pending[key] = self.__executor.submit(self.__detect, file_path, key)
+            futures.append(future)
+        return futures
+
+    def cancel(self, futures):
+        """Cancels the detections of prefetch which didn't start yet"""
+        for future in futures:
+            future.cancel()
+        with self.__lock:
+            for key, future in list(self.__pending.items()):
+                if future.cancelled():
+                    del self.__pending[key]
+
+
+mime_types = MimeTypes()
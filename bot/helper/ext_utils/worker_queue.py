@@ -0,0 +1,159 @@
+import json
+import logging
+import time
+
+import redis
+
+import bot
+from bot import WORKER_ID, DOWNLOAD_STATUS_UPDATE_INTERVAL
+
+LOGGER = logging.getLogger(__name__)
+
+
+class WorkerQueue:
+    """
+    Everything the frontend and the workers of BOT_MODE exchange, through redis:
+        bots:queue             list of mirrors waiting for a worker, pushed left and taken from the right
+        bots:processing:<worker>  mirrors a worker took from the queue, until they are finished. They are
+                               queued again when the worker starts, if it stopped before finishing them
+        bots:workers:<worker>  status snapshots of the mirrors running on a worker, expire if it stops
+        bots:cancel:<worker>   uids of the mirrors the frontend wants a worker to cancel
+        bots:results           fingerprints of the finished mirrors, for the drive index of the frontend
+    A queued mirror is {"uid": <uid>, "job": <job as stored by job_store>}.
+    """
+    QUEUE_KEY = 'bots:queue'
+    PROCESSING_KEY = 'bots:processing:'
+    STATUS_KEY = 'bots:workers:'
+    CANCEL_KEY = 'bots:cancel:'
+    RESULTS_KEY = 'bots:results'
+    # A worker which hasn't reported for this long is gone, along with its status
+    STATUS_TTL = max(DOWNLOAD_STATUS_UPDATE_INTERVAL * 3, 30)
+
+    def __init__(self, worker_id):
+        self.__worker_id = worker_id
+        self.__processing_key = f'{self.PROCESSING_KEY}{worker_id}'
+
+    @staticmethod
+    def __call(name, *args, **kwargs):
+        # redis is connected in the background at startup
+        client = bot.redis_client
+        if client is None:
+            LOGGER.error('The frontend and the workers need redis')
+            return None
+        try:
+            return getattr(client, name)(*args, **kwargs)
+        except redis.RedisError as e:
+            LOGGER.error(f'Worker queue: {e}')
+            return None
+
+    def __block(self, name, timeout, *keys):
+        start = time.time()
+        item = self.__call(name, *keys, timeout)
+        if item is None:
+            # Without redis the call returns right away, the callers shouldn't retry in a busy loop
+            time.sleep(max(timeout - (time.time() - start), 0))
+        return item
+
+    def push(self, uid, job):
+        self.__call('lpush', self.QUEUE_KEY, json.dumps({'uid': uid, 'job': job}))
+
+    def pop(self, timeout):
+        """
+        Takes the oldest queued mirror, it stays in the processing list of this worker until finish is called
+        :return: (uid, job) of the mirror, or None if none was queued within timeout
+        """
+        item = self.__block('brpoplpush', timeout, self.QUEUE_KEY, self.__processing_key)
+        if item is None:
+            return None
+        item = json.loads(item)
+        return item['uid'], item['job']
+
+    def finish(self, uid):
+        """Takes the mirror uid out of the processing list of this worker, once it is done"""
+        for item in self.__call('lrange', self.__processing_key, 0, -1) or []:
+            if json.loads(item)['uid'] == uid:
+                self.__call('lrem', self.__processing_key, 1, item)
+                return
+
+    def requeue_processing(self, keep=()):
+        """
+        Queues the mirrors this worker took before it stopped again, ahead of the others
+        :param keep: uids of the mirrors which were picked up again from the job store, they stay here
+        """
+        # The newest comes first, it is pushed first so that the oldest is taken next
+        for item in self.__call('lrange', self.__processing_key, 0, -1) or []:
+            uid = json.loads(item)['uid']
+            if uid in keep:
+                continue
+            LOGGER.info(f'Queueing {uid} again, it was not finished')
+            self.__call('rpush', self.QUEUE_KEY, item)
+            self.__call('lrem', self.__processing_key, 1, item)
+
+    def processing(self):
+        """:return: uids of the mirrors which the workers took from the queue and haven't finished"""
+        try:
+            keys = list(self.__call('scan_iter', match=f'{self.PROCESSING_KEY}*') or [])
+        except redis.RedisError as e:
+            LOGGER.error(f'Worker queue: {e}')
+            return []
+        uids = []
+        for key in keys:
+            uids += [json.loads(item)['uid'] for item in self.__call('lrange', key, 0, -1) or []]
+        return uids
+
+    def pending(self):
+        """:return: List of (uid, job) of the queued mirrors, the next one first"""
+        items = self.__call('lrange', self.QUEUE_KEY, 0, -1) or []
+        return [(item['uid'], item['job']) for item in map(json.loads, reversed(items))]
+
+    def remove(self, uid):
+        """
+        Takes the mirror uid out of the queue
+        :return: True if it was still queued
+        """
+        for item in self.__call('lrange', self.QUEUE_KEY, 0, -1) or []:
+            if json.loads(item)['uid'] == uid:
+                return bool(self.__call('lrem', self.QUEUE_KEY, 1, item))
+        return False
+
+    def publish(self, snapshots):
+        """Reports the status snapshots of the mirrors of this worker"""
+        self.__call('set', f'{self.STATUS_KEY}{self.__worker_id}', json.dumps(snapshots), ex=self.STATUS_TTL)
+
+    def snapshots(self):
+        """:return: status snapshots of the mirrors running on all the workers, with the worker they run on"""
+        try:
+            keys = list(self.__call('scan_iter', match=f'{self.STATUS_KEY}*') or [])
+        except redis.RedisError as e:
+            LOGGER.error(f'Worker queue: {e}')
+            return []
+        if not keys:
+            return []
+        snapshots = []
+        for key, value in zip(keys, self.__call('mget', keys) or []):
+            if value is None:
+                continue
+            worker = key[len(self.STATUS_KEY):]
+            for snapshot in json.loads(value):
+                snapshot['worker'] = worker
+                snapshots.append(snapshot)
+        return snapshots
+
+    def cancel(self, worker, uid):
+        self.__call('rpush', f'{self.CANCEL_KEY}{worker}', uid)
+
+    def next_cancel(self, timeout):
+        """:return: uid of a mirror of this worker the frontend wants cancelled, None after timeout"""
+        item = self.__block('blpop', timeout, f'{self.CANCEL_KEY}{self.__worker_id}')
+        return int(item[1]) if item is not None else None
+
+    def add_result(self, fingerprint, file_id):
+        self.__call('rpush', self.RESULTS_KEY, json.dumps([fingerprint, file_id]))
+
+    def next_result(self, timeout):
+        """:return: (fingerprint, file id) of a mirror a worker finished, None after timeout"""
+        item = self.__block('blpop', timeout, self.RESULTS_KEY)
+        return tuple(json.loads(item[1])) if item is not None else None
+
+
+worker_queue = WorkerQueue(WORKER_ID)
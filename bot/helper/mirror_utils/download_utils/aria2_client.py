@@ -0,0 +1,30 @@
+import time
+
+import aria2p
+
+from bot.helper.ext_utils.metrics import ARIA2_RPC_DURATION
+
+
+class TimedAria2Client(aria2p.Client):
+    """aria2p client which records how long aria2 takes to answer every JSON-RPC call, by method"""
+
+    def call(self, method, params=None, msg_id=None, insert_secret=True):
+        start = time.time()
+        try:
+            return super().call(method, params, msg_id=msg_id, insert_secret=insert_secret)
+        finally:
+            ARIA2_RPC_DURATION.observe(time.time() - start, method=method)
+
+    def batch_call(self, calls, insert_secret=True):
+        start = time.time()
+        try:
+            return super().batch_call(calls, insert_secret=insert_secret)
+        finally:
+            ARIA2_RPC_DURATION.observe(time.time() - start, method='batch')
+
+    def multicall2(self, calls, insert_secret=True):
+        start = time.time()
+        try:
+            return super().multicall2(calls, insert_secret=insert_secret)
+        finally:
+            ARIA2_RPC_DURATION.observe(time.time() - start, method=self.MULTICALL)
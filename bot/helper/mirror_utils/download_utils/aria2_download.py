@@ -25,12 +25,17 @@ class AriaDownloadHelper(DownloadHelper):
         if download.followed_by_ids:
             new_gid = download.followed_by_ids[0]
             new_download = api.get_download(new_gid)
+            if dl:
+                dl.getListener().trace.end('aria2 metadata')
+                dl.getListener().trace.add_gid(new_gid)
             with download_dict_lock:
                 download_dict[dl.uid()] = AriaDownloadStatus(new_gid, dl.getListener())
                 if new_download.is_torrent:
                     download_dict[dl.uid()].is_torrent = True
             update_all_messages()
             LOGGER.info(f'Changed gid from {gid} to {new_gid}')
+            if dl and new_download.is_torrent:
+                dl.getListener().onDownloadMetadata(len(new_download.files))
         else:
             if dl: threading.Thread(target=dl.getListener().onDownloadComplete).start()
 
@@ -66,6 +71,8 @@ class AriaDownloadHelper(DownloadHelper):
 
     def add_download(self, link: str, path, listener):
         if is_magnet(link):
+            # The torrent follows the download of its metadata
+            listener.trace.start('aria2 metadata')
             download = aria2.add_magnet(link, {'dir': path})
         else:
             download = aria2.add_uris([link], {'dir': path})
@@ -75,3 +82,4 @@ class AriaDownloadHelper(DownloadHelper):
         with download_dict_lock:
             download_dict[listener.uid] = AriaDownloadStatus(download.gid, listener)
             LOGGER.info(f"Started: {download.gid} DIR:{download.dir} ")
+        listener.onDownloadStarted()
@@ -1,11 +1,11 @@
 import logging
 import threading
-import time
 
 from pyrogram import Client
 
 from bot import LOGGER, download_dict, download_dict_lock, TELEGRAM_API, \
     TELEGRAM_HASH, USER_SESSION_STRING
+from bot.helper.ext_utils.bot_utils import SpeedTracker
 from .download_helper import DownloadHelper
 from ..status_utils.telegram_download_status import TelegramDownloadStatus
 
@@ -22,7 +22,7 @@ class TelegramDownloadHelper(DownloadHelper):
         self.__resource_lock = threading.RLock()
         self.__name = ""
         self.__gid = ''
-        self.__start_time = time.time()
+        self.__speed = SpeedTracker()
         self.__user_bot = Client(api_id=TELEGRAM_API,
                                  api_hash=TELEGRAM_HASH,
                                  session_name=USER_SESSION_STRING)
@@ -36,8 +36,7 @@ class TelegramDownloadHelper(DownloadHelper):
 
     @property
     def download_speed(self):
-        with self.__resource_lock:
-            return self.downloaded_bytes / (time.time() - self.__start_time)
+        return self.__speed.speed()
 
     def __onDownloadStart(self, name, size, file_id):
         with download_dict_lock:
@@ -57,6 +56,7 @@ class TelegramDownloadHelper(DownloadHelper):
             return
         with self.__resource_lock:
             self.downloaded_bytes = current
+            self.__speed.update(current)
             try:
                 self.progress = current / self.size * 100
             except ZeroDivisionError:
@@ -1,10 +1,51 @@
+import threading
+import time
+
+from aria2p import Download
+
 from bot import aria2, DOWNLOAD_DIR, LOGGER
 from bot.helper.ext_utils.bot_utils import MirrorStatus
 from .status import Status
 
+# Seconds for which the state of the aria2 downloads fetched in one batch is served to all status objects
+ARIA_STATE_CACHE_TTL = 1
+
+_aria_state_lock = threading.Lock()
+# Key: gid, Value: aria2p.Download
+_aria_downloads = {}
+_aria_state_time = 0
+
+
+def _refresh_aria_state():
+    global _aria_state_time
+    client = aria2.client
+    # One round trip for the state of every download, instead of one tellStatus per download and accessor
+    results = client.multicall2([(client.TELL_ACTIVE, []),
+                                 (client.TELL_WAITING, [0, 1000]),
+                                 (client.TELL_STOPPED, [0, 1000])])
+    downloads = {}
+    for result in results:
+        # Every result is a one item list, or a fault struct if that call failed
+        if isinstance(result, list):
+            for struct in result[0]:
+                downloads[struct['gid']] = Download(aria2, struct)
+    _aria_downloads.clear()
+    _aria_downloads.update(downloads)
+    _aria_state_time = time.time()
+
 
 def get_download(gid):
-    return aria2.get_download(gid)
+    with _aria_state_lock:
+        if time.time() - _aria_state_time > ARIA_STATE_CACHE_TTL:
+            try:
+                _refresh_aria_state()
+            except Exception as e:
+                LOGGER.error(f'Unable to fetch the state of aria2 downloads: {e}')
+        download = _aria_downloads.get(gid)
+    if download is None:
+        # Added after the last refresh
+        download = aria2.get_download(gid)
+    return download
 
 
 class AriaDownloadStatus(Status):
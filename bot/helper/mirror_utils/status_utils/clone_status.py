@@ -0,0 +1,64 @@
+from bot import DOWNLOAD_DIR
+from bot.helper.ext_utils.bot_utils import MirrorStatus, get_readable_file_size, get_readable_time
+from .status import Status
+
+
+class CloneStatus(Status):
+    def __init__(self, obj, link, message):
+        self.obj = obj
+        self.__link = link
+        self.uid = message.message_id
+        self.message = message
+
+    def gid(self):
+        return str(self.uid)
+
+    def path(self):
+        return f"{DOWNLOAD_DIR}{self.uid}"
+
+    def processed_bytes(self):
+        return self.obj.transferred_size
+
+    def size_raw(self):
+        """:return: size of the files found so far, the source folder is listed while cloning"""
+        return self.obj.total_size
+
+    def size(self):
+        return get_readable_file_size(self.size_raw())
+
+    def status(self):
+        return MirrorStatus.STATUS_CLONING
+
+    def name(self):
+        return self.obj.name or self.__link
+
+    def progress_raw(self):
+        try:
+            return self.processed_bytes() / self.size_raw() * 100
+        except ZeroDivisionError:
+            return 0
+
+    def progress(self):
+        return f'{round(self.progress_raw(), 2)}%'
+
+    def speed_raw(self):
+        """
+        :return: Clone speed in Bytes/Seconds
+        """
+        return self.obj.speed()
+
+    def speed(self):
+        return f'{get_readable_file_size(self.speed_raw())}/s'
+
+    def eta(self):
+        try:
+            seconds = (self.size_raw() - self.processed_bytes()) / self.speed_raw()
+            return f'{get_readable_time(seconds)}'
+        except ZeroDivisionError:
+            return '-'
+
+    def download(self):
+        return self
+
+    def cancel_download(self):
+        self.obj.cancel()
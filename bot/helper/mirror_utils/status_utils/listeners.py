@@ -8,6 +8,9 @@ class MirrorListeners:
     def onDownloadStarted(self):
         raise NotImplementedError
 
+    def onDownloadMetadata(self, file_count):
+        raise NotImplementedError
+
     def onDownloadProgress(self):
         raise NotImplementedError
     
@@ -20,6 +23,9 @@ class MirrorListeners:
     def onUploadStarted(self):
         raise NotImplementedError
 
+    def onUploadFolderCreated(self, dir_id):
+        raise NotImplementedError
+
     def onUploadProgress(self):
         raise NotImplementedError
 
@@ -0,0 +1,63 @@
+from .status import Status
+from bot.helper.ext_utils.bot_utils import get_readable_file_size, get_readable_time, SpeedTracker
+
+
+class ProcessingStatus(Status):
+    """Status of archiving or extracting a download, driven by the bytes processed so far"""
+
+    def __init__(self, name, path, size, listener):
+        self.__name = name
+        self.__path = path
+        self.__size = size
+        self.__processed_bytes = 0
+        self.__speed = SpeedTracker()
+        self.uid = listener.uid
+        self.message = listener.message
+
+    def update_progress(self, processed_bytes):
+        """
+        Progress hook of fs_utils.tar and fs_utils.extract
+        :param processed_bytes: bytes processed so far
+        """
+        self.__processed_bytes = processed_bytes
+        self.__speed.update(processed_bytes)
+
+    def progress_raw(self):
+        try:
+            return min(self.__processed_bytes / self.__size * 100, 100)
+        except ZeroDivisionError:
+            return 0
+
+    def progress(self):
+        return f'{round(self.progress_raw(), 2)}%'
+
+    def speed_raw(self):
+        """
+        :return: Processing speed in Bytes/Seconds
+        """
+        return self.__speed.speed()
+
+    def speed(self):
+        return f'{get_readable_file_size(self.speed_raw())}/s'
+
+    def name(self):
+        return self.__name
+
+    def path(self):
+        return self.__path
+
+    def size_raw(self):
+        return self.__size
+
+    def size(self):
+        return get_readable_file_size(self.__size)
+
+    def eta(self):
+        try:
+            seconds = max(self.__size - self.__processed_bytes, 0) / self.speed_raw()
+            return f'{get_readable_time(seconds)}'
+        except ZeroDivisionError:
+            return '-'
+
+    def processed_bytes(self):
+        return self.__processed_bytes
@@ -0,0 +1,57 @@
+from bot import DOWNLOAD_DIR, LOGGER
+from bot.helper.ext_utils.bot_utils import MirrorStatus, get_readable_file_size
+from bot.helper.ext_utils.job_queue import scheduler
+from .status import Status
+
+
+class QueueStatus(Status):
+    def __init__(self, name, size, stage, listener):
+        self.__name = name
+        self.__size = size
+        self.__stage = stage
+        self.uid = listener.uid
+        self.message = listener.message
+        # Set by /cancel, which may come after the job was admitted but before it replaced this status
+        self.cancelled = False
+
+    def gid(self):
+        return str(self.uid)
+
+    def path(self):
+        return f"{DOWNLOAD_DIR}{self.uid}"
+
+    def processed_bytes(self):
+        return 0
+
+    def size_raw(self):
+        return self.__size
+
+    def size(self):
+        return get_readable_file_size(self.__size)
+
+    def status(self):
+        return MirrorStatus.STATUS_WAITING
+
+    def name(self):
+        return self.__name
+
+    def progress(self):
+        return '0%'
+
+    def speed(self):
+        return '-'
+
+    def eta(self):
+        return '-'
+
+    def queue_position(self):
+        """:return: (stage, position, length of the queue) or None once the job has been admitted"""
+        return scheduler.position(self.uid)
+
+    def download(self):
+        return self
+
+    def cancel_download(self):
+        LOGGER.info(f"Cancelling queued job of {self.__stage} stage: {self.__name}")
+        self.cancelled = True
+        scheduler.cancel(self.uid)
@@ -46,6 +46,10 @@ class UploadStatus(Status):
     def speed(self):
         return f'{get_readable_file_size(self.speed_raw())}/s'
 
+    def chunk_size(self):
+        """:return: size of the chunks the upload is currently sent in"""
+        return get_readable_file_size(self.obj.chunk_size)
+
     def eta(self):
         try:
             seconds = (self.__size - self.obj.uploaded_bytes) / self.speed_raw()
@@ -0,0 +1,29 @@
+class AdaptiveChunkSize:
+    """
+    Chunk size of resumable uploads, sized so that sending a chunk takes about TARGET_CHUNK_TIME.
+    Fast links get big chunks and need fewer requests, slow or flaky ones get small chunks,
+    so a failed chunk doesn't cost much to send again.
+    """
+    # Drive only accepts chunks which are a multiple of this
+    ALIGNMENT = 256 * 1024
+    TARGET_CHUNK_TIME = 20
+
+    def __init__(self, minimum, maximum, initial):
+        self.__minimum = max(minimum, self.ALIGNMENT)
+        self.__maximum = max(maximum, self.__minimum)
+        self.size = self.__clamp(initial)
+
+    def __clamp(self, size):
+        size = min(max(int(size), self.__minimum), self.__maximum)
+        return size // self.ALIGNMENT * self.ALIGNMENT
+
+    def record(self, sent_bytes, seconds):
+        """Adapts the size to the throughput of a chunk which was sent successfully"""
+        if seconds <= 0 or sent_bytes <= 0:
+            return
+        ideal = sent_bytes / seconds * self.TARGET_CHUNK_TIME
+        # At most doubled per chunk, so that a single fast chunk doesn't overshoot
+        self.size = self.__clamp(min(ideal, self.size * 2))
+
+    def failed(self):
+        self.size = self.__clamp(self.size // 2)
@@ -0,0 +1,64 @@
+import logging
+
+import redis
+
+import bot
+
+LOGGER = logging.getLogger(__name__)
+
+
+class CloneCheckpoint:
+    """
+    Progress of the clone of a source folder, kept in redis so that an interrupted clone can be resumed.
+    Keys:
+        clone:<source id>          destination folder of the clone
+        clone:<source id>:folders  hash of source folder id -> destination folder id
+        clone:<source id>:done     set of source folders whose files have all been copied
+    Without redis the checkpoint isn't persisted and every clone starts from scratch.
+    """
+    EXPIRE_TIME = 7 * 24 * 60 * 60
+
+    def __init__(self, source_id):
+        self.__key = f'clone:{source_id}'
+
+    @staticmethod
+    def __client():
+        # redis is connected in the background at startup
+        return bot.redis_client
+
+    def __call(self, name, *args):
+        client = self.__client()
+        if client is None:
+            return None
+        try:
+            return getattr(client, name)(*args)
+        except redis.RedisError as e:
+            LOGGER.error(f'Clone checkpoint {self.__key}: {e}')
+            return None
+
+    def __touch(self, key):
+        self.__call('expire', key, self.EXPIRE_TIME)
+
+    def destination(self):
+        """:return: id of the destination folder of an unfinished clone or None"""
+        return self.__call('get', self.__key)
+
+    def start(self, dest_id):
+        self.__call('set', self.__key, dest_id, self.EXPIRE_TIME)
+
+    def folder(self, source_id):
+        return self.__call('hget', f'{self.__key}:folders', source_id)
+
+    def set_folder(self, source_id, dest_id):
+        self.__call('hset', f'{self.__key}:folders', source_id, dest_id)
+        self.__touch(f'{self.__key}:folders')
+
+    def is_done(self, source_id):
+        return bool(self.__call('sismember', f'{self.__key}:done', source_id))
+
+    def set_done(self, source_id):
+        self.__call('sadd', f'{self.__key}:done', source_id)
+        self.__touch(f'{self.__key}:done')
+
+    def delete(self):
+        self.__call('delete', self.__key, f'{self.__key}:folders', f'{self.__key}:done')
@@ -0,0 +1,21 @@
+class CountingReader:
+    """
+    Wraps the file object of a MediaIoBaseUpload and reports every read to callback.
+    httplib reads the body of a chunk in small blocks while sending it, so the reads follow
+    the bytes going out over the network instead of jumping once per chunk.
+    """
+
+    def __init__(self, fd, callback=None):
+        self.__fd = fd
+        # Set by the uploader once it knows where to count the bytes
+        self.callback = callback
+
+    def read(self, size=-1):
+        data = self.__fd.read(size)
+        if data and self.callback is not None:
+            self.callback(len(data))
+        return data
+
+    def __getattr__(self, name):
+        # seek, tell, close and everything else of the file object
+        return getattr(self.__fd, name)
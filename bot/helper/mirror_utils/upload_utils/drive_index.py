@@ -0,0 +1,328 @@
+import logging
+import sqlite3
+import threading
+
+from bot import parent_id, USE_SERVICE_ACCOUNTS, DRIVE_INDEX_SYNC_INTERVAL, DRIVE_INDEX_DB
+from bot.helper.mirror_utils.upload_utils.drive_services import drive_services
+from bot.helper.mirror_utils.upload_utils.service_accounts import service_accounts
+
+LOGGER = logging.getLogger(__name__)
+
+G_DRIVE_DIR_MIME_TYPE = "application/vnd.google-apps.folder"
+FILE_FIELDS = 'id, name, mimeType, parents, size, md5Checksum, modifiedTime, trashed'
+
+
+class DriveIndex:
+    """
+    Catalog of everything below the GDRIVE_FOLDER_ID folder, so /list, duplicate checks and stats don't
+    have to query Drive. It is stored in an SQLite database along with the page token of the Drive changes
+    feed, so the tree is only crawled once and after a restart the changes since then are applied.
+    The files the bot uploads, copies and creates itself are added right away.
+    """
+    SCHEMA_VERSION = '1'
+
+    def __init__(self, root_id, sync_interval, db_path):
+        self.__root_id = root_id
+        self.__sync_interval = sync_interval
+        # One connection shared by all threads, every use of it is serialized by the lock
+        self.__db = sqlite3.connect(db_path if sync_interval > 0 else ':memory:', check_same_thread=False)
+        self.__db.execute('PRAGMA journal_mode=WAL')
+        self.__db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.__db.execute('CREATE TABLE IF NOT EXISTS files (id TEXT PRIMARY KEY, name TEXT, name_lower TEXT, '
+                          'parent TEXT, mime_type TEXT, size INTEGER, md5 TEXT, modified TEXT)')
+        self.__db.execute('CREATE INDEX IF NOT EXISTS files_parent ON files (parent)')
+        self.__db.execute('CREATE INDEX IF NOT EXISTS files_md5 ON files (md5)')
+        self.__db.execute('CREATE INDEX IF NOT EXISTS files_size ON files (size)')
+        # Key: fingerprint of the source of a mirror, see get_fingerprint, Value: id of its upload
+        self.__db.execute('CREATE TABLE IF NOT EXISTS fingerprints (fingerprint TEXT PRIMARY KEY, id TEXT)')
+        self.__db.commit()
+        self.__lock = threading.Lock()
+        self.__stop_event = threading.Event()
+        self.__drive_id = self.__get_meta('drive_id')
+        self.__page_token = None
+        self.ready = False
+        if self.__get_meta('root_id') == root_id and self.__get_meta('schema') == self.SCHEMA_VERSION:
+            self.__page_token = self.__get_meta('page_token')
+            # Catalog of an earlier run, it only has to catch up with the changes feed
+            self.ready = self.__page_token is not None
+
+    def __get_meta(self, key):
+        row = self.__db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def __set_meta(self, **values):
+        with self.__lock:
+            self.__db.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)', values.items())
+            self.__db.commit()
+
+    def __service(self):
+        account = service_accounts.acquire() if USE_SERVICE_ACCOUNTS else None
+        return drive_services.get(account)
+
+    @property
+    def enabled(self):
+        return self.__sync_interval > 0
+
+    def start(self):
+        if self.enabled:
+            threading.Thread(target=self.__run, daemon=True).start()
+
+    def stop(self):
+        self.__stop_event.set()
+
+    def __run(self):
+        if self.ready:
+            try:
+                self.sync()
+            except Exception as e:
+                LOGGER.error(f'Drive index: sync failed: {e}')
+        while not self.ready and not self.__stop_event.is_set():
+            try:
+                self.__crawl()
+            except Exception as e:
+                LOGGER.error(f'Drive index: crawling {self.__root_id} failed: {e}')
+                self.__stop_event.wait(self.__sync_interval)
+        while not self.__stop_event.wait(self.__sync_interval):
+            try:
+                self.sync()
+            except Exception as e:
+                LOGGER.error(f'Drive index: sync failed: {e}')
+
+    def __crawl(self):
+        service = self.__service()
+        root = service.files().get(supportsAllDrives=True, fileId=self.__root_id, fields='driveId').execute()
+        self.__drive_id = root.get('driveId')
+        # Taken before crawling, so that nothing changed while crawling is missed
+        start_token = self.__changes_call(service.changes().getStartPageToken)().execute()['startPageToken']
+        LOGGER.info(f'Drive index: crawling {self.__root_id}')
+        with self.__lock:
+            self.__db.execute('DELETE FROM files')
+            self.__db.execute('DELETE FROM meta')
+            self.__db.commit()
+        count = self.__crawl_folders(service, [self.__root_id])
+        if count is not None:
+            LOGGER.info(f'Drive index: {count} files indexed')
+            # Only stored once the crawl is complete, an interrupted crawl starts over after a restart
+            self.__page_token = start_token
+            self.__set_meta(root_id=self.__root_id, schema=self.SCHEMA_VERSION, drive_id=self.__drive_id,
+                            page_token=start_token)
+            self.ready = True
+
+    def __crawl_folders(self, service, folders):
+        """
+        Indexes everything below folders, breadth first
+        :return: number of files indexed, None if the index was stopped before
+        """
+        folders = list(folders)
+        count = 0
+        while folders:
+            if self.__stop_event.is_set():
+                return None
+            folder_id = folders.pop(0)
+            page_token = None
+            while True:
+                response = service.files().list(supportsAllDrives=True, includeItemsFromAllDrives=True,
+                                                q=f"'{folder_id}' in parents and trashed = false",
+                                                spaces='drive', pageSize=1000, pageToken=page_token,
+                                                fields=f'nextPageToken, files({FILE_FIELDS})').execute()
+                files = response.get('files', [])
+                self.__add_files(files, folder_id)
+                count += len(files)
+                folders += [file['id'] for file in files if file.get('mimeType') == G_DRIVE_DIR_MIME_TYPE]
+                page_token = response.get('nextPageToken')
+                if page_token is None:
+                    break
+        return count
+
+    def __changes_call(self, method):
+        def call(**kwargs):
+            if self.__drive_id is not None:
+                kwargs['driveId'] = self.__drive_id
+            return method(supportsAllDrives=True, **kwargs)
+        return call
+
+    def sync(self):
+        """Applies the changes made to the drive since the last sync"""
+        if not self.ready:
+            return
+        service = self.__service()
+        page_token = self.__page_token
+        # Key: id, Value: changed file whose parent isn't indexed, yet or at all
+        pending = {}
+        while page_token is not None:
+            response = self.__changes_call(service.changes().list)(
+                pageToken=page_token, spaces='drive', includeItemsFromAllDrives=True, pageSize=1000,
+                fields=f'nextPageToken, newStartPageToken, changes(fileId, removed, file({FILE_FIELDS}))').execute()
+            for change in response.get('changes', []):
+                file = change.get('file')
+                if change.get('removed') or file is None or file.get('trashed'):
+                    pending.pop(change['fileId'], None)
+                    self.remove(change['fileId'])
+                else:
+                    pending[file['id']] = file
+            # Folders which came into the tree, by a move rather than by being created, have an unknown content
+            for folder_id in self.__apply_changes(pending):
+                self.__crawl_folders(service, [folder_id])
+            page_token = response.get('nextPageToken')
+            if response.get('newStartPageToken') is not None:
+                self.__page_token = response['newStartPageToken']
+            else:
+                self.__page_token = page_token
+            self.__set_meta(page_token=self.__page_token)
+        # Moved out of the indexed tree, or they never were in it
+        for file_id in pending:
+            self.remove(file_id)
+
+    def __apply_changes(self, pending):
+        """
+        Indexes the files of pending whose parent is indexed, and takes them out of it. A parent may come after
+        its files in the changes, so they are gone through until no more files fit in.
+        :return: ids of the folders which weren't indexed before
+        """
+        new_folders = []
+        added = True
+        while added:
+            added = False
+            for file_id, file in list(pending.items()):
+                parents = file.get('parents') or []
+                if not parents or not self.__is_indexed_folder(parents[0]):
+                    continue
+                if file.get('mimeType') == G_DRIVE_DIR_MIME_TYPE and not self.__is_indexed_folder(file_id):
+                    new_folders.append(file_id)
+                self.__add_files([file], parents[0])
+                del pending[file_id]
+                added = True
+        return new_folders
+
+    def __add_files(self, files, folder_id):
+        rows = [(file['id'], file.get('name'), file.get('name', '').lower(), folder_id, file.get('mimeType'),
+                 int(file['size']) if file.get('size') is not None else None, file.get('md5Checksum'),
+                 file.get('modifiedTime'))
+                for file in files]
+        with self.__lock:
+            self.__db.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self.__db.commit()
+
+    def __is_indexed_folder(self, folder_id):
+        if folder_id == self.__root_id:
+            return True
+        with self.__lock:
+            return self.__db.execute('SELECT 1 FROM files WHERE id = ? AND mime_type = ?',
+                                     (folder_id, G_DRIVE_DIR_MIME_TYPE)).fetchone() is not None
+
+    def add(self, file):
+        """
+        Adds or updates a file the bot created or copied
+        :param file: Drive file resource with at least id, name, mimeType and parents
+        """
+        if not self.enabled:
+            return
+        parents = file.get('parents') or []
+        if parents and self.__is_indexed_folder(parents[0]):
+            self.__add_files([file], parents[0])
+        else:
+            # Moved out of the indexed tree, or it never was in it
+            self.remove(file['id'])
+
+    def remove(self, file_id):
+        """Removes file_id and, if it is a folder, everything in it"""
+        with self.__lock:
+            self.__db.execute('DELETE FROM files WHERE id IN (WITH RECURSIVE tree(id) AS '
+                              '(SELECT ? UNION SELECT files.id FROM files JOIN tree ON files.parent = tree.id) '
+                              'SELECT id FROM tree)', (file_id,))
+            self.__db.commit()
+
+    @staticmethod
+    def __like_pattern(token):
+        token = token.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return f'%{token}%'
+
+    def search(self, query, page=1, page_size=20):
+        """
+        Finds the files whose name contains every word of query, anywhere in the indexed tree
+        :return: (list of dicts with id, name, mimeType and size, total number of matches)
+        """
+        tokens = query.lower().split()
+        where = ' AND '.join(["name_lower LIKE ? ESCAPE '\\'"] * len(tokens)) or '1'
+        params = [self.__like_pattern(token) for token in tokens]
+        with self.__lock:
+            total = self.__db.execute(f'SELECT COUNT(*) FROM files WHERE {where}', params).fetchone()[0]
+            rows = self.__db.execute(f'SELECT id, name, mime_type, size FROM files WHERE {where} '
+                                     f'ORDER BY modified DESC LIMIT ? OFFSET ?',
+                                     params + [page_size, (page - 1) * page_size]).fetchall()
+        files = [{'id': id, 'name': name, 'mimeType': mime_type, 'size': size}
+                 for id, name, mime_type, size in rows]
+        return files, total
+
+    def path(self, file_id):
+        """:return: path of file_id relative to the indexed folder"""
+        names = []
+        with self.__lock:
+            while file_id != self.__root_id:
+                row = self.__db.execute('SELECT name, parent FROM files WHERE id = ?', (file_id,)).fetchone()
+                if row is None:
+                    break
+                names.append(row[0])
+                file_id = row[1]
+        return '/'.join(reversed(names))
+
+    def find_by_md5(self, md5, size=None):
+        """:return: list of dicts with id, name, mimeType and size of the files with the checksum md5"""
+        query = 'SELECT id, name, mime_type, size FROM files WHERE md5 = ?'
+        params = [md5]
+        if size is not None:
+            query += ' AND size = ?'
+            params.append(size)
+        with self.__lock:
+            rows = self.__db.execute(query, params).fetchall()
+        return [{'id': id, 'name': name, 'mimeType': mime_type, 'size': size}
+                for id, name, mime_type, size in rows]
+
+    def has_size(self, size, name=None):
+        """
+        :param name: only files of this name count, case-insensitively
+        :return: whether a file of size bytes with a checksum is in the catalog, before hashing a local file
+        """
+        query = 'SELECT 1 FROM files WHERE size = ? AND md5 IS NOT NULL'
+        params = [size]
+        if name is not None:
+            query += ' AND name_lower = ?'
+            params.append(name.lower())
+        with self.__lock:
+            return self.__db.execute(query + ' LIMIT 1', params).fetchone() is not None
+
+    def add_fingerprint(self, fingerprint, file_id):
+        if not self.enabled:
+            return
+        with self.__lock:
+            self.__db.execute('INSERT OR REPLACE INTO fingerprints VALUES (?, ?)', (fingerprint, file_id))
+            self.__db.commit()
+
+    def find_fingerprint(self, fingerprint):
+        """:return: dict with id, name, mimeType and size of the upload of fingerprint, None if it isn't in the drive anymore"""
+        with self.__lock:
+            row = self.__db.execute('SELECT files.id, name, mime_type, size FROM fingerprints '
+                                    'JOIN files ON files.id = fingerprints.id WHERE fingerprint = ?',
+                                    (fingerprint,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('id', 'name', 'mimeType', 'size'), row))
+
+    def duplicates(self, limit=20):
+        """:return: list of (md5, number of copies, size of a copy) of the files stored more than once"""
+        with self.__lock:
+            return self.__db.execute('SELECT md5, COUNT(*), MAX(size) FROM files WHERE md5 IS NOT NULL '
+                                     'GROUP BY md5 HAVING COUNT(*) > 1 ORDER BY COUNT(*) * MAX(size) DESC '
+                                     'LIMIT ?', (limit,)).fetchall()
+
+    def stats(self):
+        """:return: (number of files, number of folders, total size of the files)"""
+        with self.__lock:
+            files, size = self.__db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM files '
+                                            'WHERE mime_type != ?', (G_DRIVE_DIR_MIME_TYPE,)).fetchone()
+            folders = self.__db.execute('SELECT COUNT(*) FROM files WHERE mime_type = ?',
+                                        (G_DRIVE_DIR_MIME_TYPE,)).fetchone()[0]
+        return files, folders, size
+
+
+drive_index = DriveIndex(parent_id, DRIVE_INDEX_SYNC_INTERVAL, DRIVE_INDEX_DB)
@@ -0,0 +1,131 @@
+import json
+import logging
+import os
+import pickle
+import threading
+
+from google.auth.transport.requests import Request
+from google.oauth2 import service_account
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.discovery import build_from_document, DISCOVERY_URI
+from googleapiclient.errors import HttpError
+from googleapiclient.http import build_http, HttpRequest
+
+from bot.helper.ext_utils.metrics import DRIVE_CALLS, DRIVE_ERRORS
+
+LOGGER = logging.getLogger(__name__)
+
+
+def http_error_reason(err):
+    """:return: reason Drive gave for the HttpError err, or its status code"""
+    try:
+        return json.loads(err.content)['error']['errors'][0]['reason']
+    except (ValueError, KeyError, IndexError, TypeError):
+        return str(err.resp.status)
+
+
+class _CountedHttpRequest(HttpRequest):
+    """Requests of the Drive services, counted by method and by the reason they failed for"""
+
+    def execute(self, http=None, num_retries=0):
+        if self.resumable:
+            # Sent chunk by chunk through next_chunk, which counts them
+            return super().execute(http=http, num_retries=num_retries)
+        return self.__count(super().execute, http, num_retries)
+
+    def next_chunk(self, http=None, num_retries=0):
+        return self.__count(super().next_chunk, http, num_retries)
+
+    def __count(self, send, http, num_retries):
+        method = self.methodId or 'unknown'
+        DRIVE_CALLS.inc(method=method)
+        try:
+            return send(http=http, num_retries=num_retries)
+        except HttpError as err:
+            DRIVE_ERRORS.inc(method=method, reason=http_error_reason(err))
+            raise
+
+
+class DriveServiceCache:
+    """
+    Process wide cache of everything needed for Drive service objects. Credentials are loaded once per
+    account and the discovery document is downloaded once, so a service only has to be built from them.
+    The services themselves aren't shared between threads, as their httplib2 transports aren't thread safe.
+    """
+    # Check https://developers.google.com/drive/scopes for all available scopes
+    OAUTH_SCOPE = ['https://www.googleapis.com/auth/drive']
+    TOKEN_FILE = "token.pickle"
+
+    def __init__(self, accounts_path):
+        self.__accounts_path = accounts_path
+        self.__lock = threading.Lock()
+        self.__document = None
+        # Key: file name of the service account or None for token.pickle, Value: credentials
+        self.__credentials = {}
+        self.__local = threading.local()
+
+    def __discovery_document(self):
+        if self.__document is None:
+            uri = DISCOVERY_URI.format(api='drive', apiVersion='v3')
+            resp, content = build_http().request(uri)
+            if resp.status >= 400:
+                raise HttpError(resp, content, uri=uri)
+            # Kept as text, build_from_document modifies the parsed document
+            self.__document = content.decode('utf-8')
+        return self.__document
+
+    def __load_user_credentials(self):
+        credentials = None
+        if os.path.exists(self.TOKEN_FILE):
+            with open(self.TOKEN_FILE, 'rb') as f:
+                credentials = pickle.load(f)
+        if credentials is None or not credentials.valid:
+            if credentials and credentials.expired and credentials.refresh_token:
+                credentials.refresh(Request())
+            else:
+                flow = InstalledAppFlow.from_client_secrets_file(
+                    'credentials.json', self.OAUTH_SCOPE)
+                LOGGER.info(flow)
+                credentials = flow.run_console(port=0)
+            self.__save_user_credentials(credentials)
+        return credentials
+
+    def __save_user_credentials(self, credentials):
+        # Save the credentials for the next run
+        with open(self.TOKEN_FILE, 'wb') as token:
+            pickle.dump(credentials, token)
+
+    def credentials(self, account=None):
+        """
+        :param account: file name of a service account, None for the credentials of token.pickle
+        """
+        with self.__lock:
+            credentials = self.__credentials.get(account)
+            if credentials is None:
+                if account is None:
+                    credentials = self.__load_user_credentials()
+                else:
+                    credentials = service_account.Credentials.from_service_account_file(
+                        os.path.join(self.__accounts_path, account), scopes=self.OAUTH_SCOPE)
+                self.__credentials[account] = credentials
+            elif account is None and not credentials.valid and credentials.refresh_token:
+                # Refreshed here once instead of by every thread which uses it
+                credentials.refresh(Request())
+                self.__save_user_credentials(credentials)
+            document = self.__discovery_document()
+        return credentials, document
+
+    def get(self, account=None):
+        """:return: Drive service of the current thread for account"""
+        services = getattr(self.__local, 'services', None)
+        if services is None:
+            services = self.__local.services = {}
+        service = services.get(account)
+        if service is None:
+            credentials, document = self.credentials(account)
+            service = services[account] = build_from_document(document, credentials=credentials,
+                                                              requestBuilder=_CountedHttpRequest)
+        return service
+
+
+drive_services = DriveServiceCache('accounts')
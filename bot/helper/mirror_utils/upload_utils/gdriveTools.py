@@ -1,5 +1,4 @@
 import os
-import pickle
 import urllib.parse as urlparse
 from urllib.parse import parse_qs
 
@@ -7,50 +6,86 @@ import re
 import json
 import requests
 import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
 
-from google.auth.transport.requests import Request
-from google.oauth2 import service_account
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.http import MediaFileUpload, MediaIoBaseUpload
 from tenacity import *
 
 from bot import parent_id, DOWNLOAD_DIR, IS_TEAM_DRIVE, INDEX_URL, \
-    USE_SERVICE_ACCOUNTS, download_dict
+    USE_SERVICE_ACCOUNTS, UPLOAD_WORKERS, CLONE_WORKERS, UPLOAD_CHUNK_MIN, UPLOAD_CHUNK_MAX, download_dict
 from bot.helper.ext_utils.bot_utils import *
-from bot.helper.ext_utils.fs_utils import get_mime_type
+from bot.helper.ext_utils.fs_utils import get_mime_type, scan_path
+from bot.helper.ext_utils.mime_types import mime_types
+from bot.helper.ext_utils.metrics import UPLOAD_BYTES, DRIVE_RETRIES
+from bot.helper.mirror_utils.upload_utils.chunk_size import AdaptiveChunkSize
+from bot.helper.mirror_utils.upload_utils.clone_checkpoint import CloneCheckpoint
+from bot.helper.mirror_utils.upload_utils.counting_reader import CountingReader
+from bot.helper.mirror_utils.upload_utils.drive_index import drive_index, FILE_FIELDS
+from bot.helper.mirror_utils.upload_utils.drive_services import drive_services, http_error_reason
+from bot.helper.mirror_utils.upload_utils.service_accounts import service_accounts
+from bot.helper.mirror_utils.upload_utils.tar_stream_upload import TarStreamUpload
+from bot.helper.mirror_utils.upload_utils.upload_sessions import upload_sessions
 
 LOGGER = logging.getLogger(__name__)
 logging.getLogger('googleapiclient.discovery').setLevel(logging.ERROR)
-SERVICE_ACCOUNT_INDEX = 0
+
+
+def _count_retry(retry_state):
+    DRIVE_RETRIES.inc(reason=http_error_reason(retry_state.outcome.exception()))
 
 
 class GoogleDriveHelper:
     def __init__(self, name=None, listener=None):
-        self.__G_DRIVE_TOKEN_FILE = "token.pickle"
-        # Check https://developers.google.com/drive/scopes for all available scopes
-        self.__OAUTH_SCOPE = ['https://www.googleapis.com/auth/drive']
-        # Redirect URI for installed apps, can be left as is
-        self.__REDIRECT_URI = "urn:ietf:wg:oauth:2.0:oob"
         self.__G_DRIVE_DIR_MIME_TYPE = "application/vnd.google-apps.folder"
         self.__G_DRIVE_BASE_DOWNLOAD_URL = "https://drive.google.com/uc?id={}&export=download"
         self.__G_DRIVE_DIR_BASE_DOWNLOAD_URL = "https://drive.google.com/drive/folders/{}"
+        self.__UPLOAD_CHUNK_SIZE = 50 * 1024 * 1024
+        # Chunk size of the latest chunk of any of the uploading threads, for the status message
+        self.chunk_size = self.__UPLOAD_CHUNK_SIZE
+        self.__LIST_PAGE_SIZE = 20
         self.__listener = listener
+        # Only mirrors are traced
+        self.__trace = getattr(listener, 'trace', None)
+        # Drive service objects are not thread safe, so every uploading thread gets its own one
+        self.__local = threading.local()
         self.__service = self.authorize()
-        self.__listener = listener
-        self._file_uploaded_bytes = 0
+        self.__upload_lock = threading.Lock()
+        # Key: normalized local folder path, Value: id of its Drive folder
+        self.__dir_ids = {}
+        self.__dir_lock = threading.RLock()
+        # Normalized local paths of the files uploaded while their folder was still downloading
+        self.__uploaded_files = set()
         self.uploaded_bytes = 0
-        self.UPDATE_INTERVAL = 5
+        self.transferred_size = 0
+        self.total_size = 0
+        # Bytes actually sent or copied, including those sent again by retries
+        self.__speed = SpeedTracker()
         self.start_time = 0
-        self.total_time = 0
         self._should_update = True
         self.is_uploading = True
         self.is_cancelled = False
-        self.status = None
-        self.updater = None
         self.name = name
-        self.update_interval = 3
+
+    @property
+    def __service(self):
+        service = getattr(self.__local, 'service', None)
+        if service is None:
+            service = self.__local.service = self.authorize()
+        return service
+
+    @__service.setter
+    def __service(self, service):
+        self.__local.service = service
+
+    @property
+    def __chunks(self):
+        # Kept per thread, so that what one upload learned carries over to the retries and the next files
+        chunks = getattr(self.__local, 'chunks', None)
+        if chunks is None:
+            chunks = self.__local.chunks = AdaptiveChunkSize(UPLOAD_CHUNK_MIN, UPLOAD_CHUNK_MAX,
+                                                             self.__UPLOAD_CHUNK_SIZE)
+        return chunks
 
     def cancel(self):
         self.is_cancelled = True
@@ -58,13 +93,9 @@ class GoogleDriveHelper:
 
     def speed(self):
         """
-        It calculates the average upload speed and returns it in bytes/seconds unit
-        :return: Upload speed in bytes/second
+        :return: Upload or clone speed of the last seconds in bytes/second
         """
-        try:
-            return self.uploaded_bytes / self.total_time
-        except ZeroDivisionError:
-            return 0
+        return self.__speed.speed()
 
     @staticmethod
     def getIdFromUrl(link: str):
@@ -77,15 +108,23 @@ class GoogleDriveHelper:
         parsed = urlparse.urlparse(link)
         return parse_qs(parsed.query)['id'][0]
 
-    @retry(wait=wait_exponential(multiplier=2, min=3, max=6), stop=stop_after_attempt(5),
-           retry=retry_if_exception_type(HttpError), before=before_log(LOGGER, logging.DEBUG))
-    def _on_upload_progress(self):
-        if self.status is not None:
-            chunk_size = self.status.total_size * self.status.progress() - self._file_uploaded_bytes
-            self._file_uploaded_bytes = self.status.total_size * self.status.progress()
-            LOGGER.debug(f'Uploading {self.name}, chunk size: {get_readable_file_size(chunk_size)}')
-            self.uploaded_bytes += chunk_size
-            self.total_time += self.update_interval
+    def __add_uploaded_bytes(self, count):
+        # Several files of a folder may be uploading at once
+        with self.__upload_lock:
+            self.uploaded_bytes += count
+
+    def __commit_progress(self, media_body, progress, uploaded, counted):
+        """
+        Corrects uploaded_bytes to the offset Drive committed after a chunk, which may be less than was sent
+        :param uploaded: offset committed before the chunk
+        :param counted: bytes of the upload counted so far
+        """
+        if not media_body.has_stream():
+            # Bytes which aren't read from a stream are only seen once the chunk is sent
+            self.__speed.add(progress - uploaded)
+        if progress > uploaded:
+            UPLOAD_BYTES.inc(progress - uploaded)
+        self.__add_uploaded_bytes(progress - counted)
 
     def __upload_empty_file(self, path, file_name, mime_type, parent_id=None):
         media_body = MediaFileUpload(path,
@@ -101,17 +140,39 @@ class GoogleDriveHelper:
         return self.__service.files().create(supportsTeamDrives=True,
                                              body=file_metadata, media_body=media_body).execute()
 
-    def switchServiceAccount(self):
-        global SERVICE_ACCOUNT_INDEX
-        service_account_count = len(os.listdir("accounts"))
-        if SERVICE_ACCOUNT_INDEX == service_account_count - 1:
-            SERVICE_ACCOUNT_INDEX = 0
-        SERVICE_ACCOUNT_INDEX += 1
-        LOGGER.info(f"Switching to {SERVICE_ACCOUNT_INDEX}.json service account")
+    def switchServiceAccount(self, size=0, rate_limited=True):
+        """
+        Moves the current thread to another service account
+        :param size: bytes the new account has to be able to transfer
+        :param rate_limited: the current account got rate limited, rather than being close to its daily limit
+        """
+        account = getattr(self.__local, 'account', None)
+        if rate_limited and account is not None:
+            service_accounts.mark_exhausted(account)
+        self.__local.account = service_accounts.acquire(size, exclude=account)
+        LOGGER.info(f"Switching to {self.__local.account} service account")
         self.__service = self.authorize()
 
+    def __check_quota(self, size):
+        """
+        Makes sure the service account of the current thread can transfer size more bytes today,
+        switching to another one otherwise. The bytes are booked by __book_quota once they are transferred
+        """
+        if not USE_SERVICE_ACCOUNTS:
+            return
+        # Authorizes the thread with an account if it hasn't got one yet
+        self.__service
+        if not service_accounts.has_quota(self.__local.account, size):
+            self.switchServiceAccount(size, rate_limited=False)
+
+    def __book_quota(self, size):
+        """Books size transferred bytes on the service account of the current thread"""
+        if USE_SERVICE_ACCOUNTS:
+            service_accounts.add_usage(self.__local.account, size)
+
     @retry(wait=wait_exponential(multiplier=2, min=3, max=6), stop=stop_after_attempt(5),
-           retry=retry_if_exception_type(HttpError), before=before_log(LOGGER, logging.DEBUG))
+           retry=retry_if_exception_type(HttpError), before=before_log(LOGGER, logging.DEBUG),
+           before_sleep=_count_retry)
     def __set_permission(self, drive_id):
         permissions = {
             'role': 'reader',
@@ -123,7 +184,8 @@ class GoogleDriveHelper:
                                                    body=permissions).execute()
 
     @retry(wait=wait_exponential(multiplier=2, min=3, max=6), stop=stop_after_attempt(5),
-           retry=retry_if_exception_type(HttpError), before=before_log(LOGGER, logging.DEBUG))
+           retry=retry_if_exception_type(HttpError), before=before_log(LOGGER, logging.DEBUG),
+           before_sleep=_count_retry)
     def upload_file(self, file_path, file_name, mime_type, parent_id):
         # File body description
         file_metadata = {
@@ -143,103 +205,228 @@ class GoogleDriveHelper:
             if not IS_TEAM_DRIVE:
                 self.__set_permission(response['id'])
 
-            drive_file = self.__service.files().get(supportsTeamDrives=True,
-                                                    fileId=response['id']).execute()
+            drive_file = self.__service.files().get(supportsTeamDrives=True, fileId=response['id'],
+                                                    fields=FILE_FIELDS).execute()
+            drive_index.add(drive_file)
             download_url = self.__G_DRIVE_BASE_DOWNLOAD_URL.format(drive_file.get('id'))
             return download_url
-        media_body = MediaFileUpload(file_path,
-                                     mimetype=mime_type,
-                                     resumable=True,
-                                     chunksize=50 * 1024 * 1024)
+        # Progress while a chunk is being sent instead of once it is done, see __upload_media
+        reader = CountingReader(open(file_path, 'rb'))
+        media_body = MediaIoBaseUpload(reader, mime_type, chunksize=self.__chunks.size, resumable=True)
+        try:
+            return self.__upload_media(media_body, file_metadata,
+                                       lambda: self.upload_file(file_path, file_name, mime_type, parent_id),
+                                       upload_sessions.key(file_path, file_name, parent_id), reader)
+        finally:
+            reader.close()
+
+    @retry(wait=wait_exponential(multiplier=2, min=3, max=6), stop=stop_after_attempt(5),
+           retry=retry_if_exception_type(HttpError), before=before_log(LOGGER, logging.DEBUG),
+           before_sleep=_count_retry)
+    def upload_tar(self, dir_path, file_name, parent_id):
+        file_metadata = {
+            'name': file_name,
+            'description': 'mirror',
+            'mimeType': 'application/x-tar',
+        }
+        if parent_id is not None:
+            file_metadata['parents'] = [parent_id]
+        # A fresh archive stream on every attempt, a consumed one can't be rewound
+        media_body = TarStreamUpload(dir_path, self.__chunks.size)
+        try:
+            return self.__upload_media(media_body, file_metadata,
+                                       lambda: self.upload_tar(dir_path, file_name, parent_id))
+        finally:
+            media_body.close()
 
+    @staticmethod
+    def __resume_session(drive_file, session_uri, size):
+        """
+        Continues the upload session session_uri with drive_file, from the offset Drive reports for it.
+        The status query is sent here, so only the public resumable_uri and resumable_progress of
+        googleapiclient's HttpRequest are set, rather than its private error state
+        :return: response of the upload if Drive already got all of the file, None otherwise
+        :raises HttpError: if the session is unknown to Drive, 404 or 410 if it expired
+        """
+        resp, content = drive_file.http.request(session_uri, 'PUT', headers={'Content-Range': f'bytes */{size}',
+                                                                             'Content-Length': '0'})
+        if resp.status in (200, 201):
+            return drive_file.postproc(resp, content)
+        if resp.status != 308:
+            raise HttpError(resp, content, uri=session_uri)
+        drive_file.resumable_uri = resp.get('location', session_uri)
+        # Range is missing if Drive hasn't got any byte yet
+        committed = resp.get('range')
+        drive_file.resumable_progress = int(committed.split('-')[1]) + 1 if committed else 0
+        return None
+
+    @staticmethod
+    def __set_chunk_size(media_body, size):
+        """
+        Sets the size of the next chunk of media_body. googleapiclient has no setter for it, but asks
+        chunksize() for every chunk, so the attribute behind it is only changed here
+        """
+        media_body._chunksize = size
+
+    def __upload_media(self, media_body, file_metadata, retry_upload, session_key=None, reader=None):
+        """
+        :param session_key: key the upload session is stored under, to be resumed by a retry or after a restart.
+        None for uploads which can't be resumed.
+        :param reader: CountingReader media_body reads the file through
+        """
+        # None for a tar stream, its size is only known once it is uploaded
+        size = media_body.size()
+        self.__check_quota(size or 0)
         # Insert a file
         drive_file = self.__service.files().create(supportsTeamDrives=True,
                                                    body=file_metadata, media_body=media_body)
         response = None
-        while response is None:
-            if self.is_cancelled:
-                return None
+        status = None
+        # Offset Drive has committed, and bytes of this upload counted into uploaded_bytes
+        uploaded = 0
+        counted = 0
+        session_uri = upload_sessions.get(session_key) if session_key is not None else None
+        if session_uri is not None:
+            LOGGER.info(f"Resuming upload of {file_metadata['name']}")
             try:
-                self.status, response = drive_file.next_chunk()
+                response = self.__resume_session(drive_file, session_uri, size)
             except HttpError as err:
-                if err.resp.get('content-type', '').startswith('application/json'):
-                    reason = json.loads(err.content).get('error').get('errors')[0].get('reason')
-                    if reason == 'userRateLimitExceeded' or reason == 'dailyLimitExceeded':
-                        if USE_SERVICE_ACCOUNTS:
-                            self.switchServiceAccount()
-                            LOGGER.info(f"Got: {reason}, Trying Again.")
-                            return self.upload_file(file_path, file_name, mime_type, parent_id)
-                    else:
-                        raise err
-        self._file_uploaded_bytes = 0
+                if err.resp.status not in (404, 410):
+                    raise
+                LOGGER.info(f"Upload session of {file_metadata['name']} expired, starting over")
+                upload_sessions.delete(session_key)
+                session_uri = None
+            else:
+                # Sent by an earlier attempt, so neither throughput nor newly uploaded bytes
+                uploaded = counted = size if response is not None else drive_file.resumable_progress
+                self.__add_uploaded_bytes(counted)
+
+        def on_read(count):
+            nonlocal counted
+            counted += count
+            self.__add_uploaded_bytes(count)
+            self.__speed.add(count)
+
+        if reader is not None:
+            reader.callback = on_read
+        chunks = self.__chunks
+        try:
+            while response is None:
+                if self.is_cancelled:
+                    return None
+                self.__set_chunk_size(media_body, chunks.size)
+                # Tar streams cap the size they are asked for
+                self.chunk_size = media_body.chunksize()
+                chunk_start = time.time()
+                try:
+                    status, response = drive_file.next_chunk()
+                except HttpError as err:
+                    if err.resp.get('content-type', '').startswith('application/json'):
+                        reason = json.loads(err.content).get('error').get('errors')[0].get('reason')
+                        if reason == 'userRateLimitExceeded' or reason == 'dailyLimitExceeded':
+                            if USE_SERVICE_ACCOUNTS:
+                                self.switchServiceAccount()
+                                LOGGER.info(f"Got: {reason}, Trying Again.")
+                                DRIVE_RETRIES.inc(reason=reason)
+                                # The session counts against the quota of the old account
+                                if session_key is not None:
+                                    upload_sessions.delete(session_key)
+                                    session_key = None
+                                self.__add_uploaded_bytes(-counted)
+                                counted = 0
+                                return retry_upload()
+                        else:
+                            raise err
+                if session_key is not None and session_uri is None and drive_file.resumable_uri is not None:
+                    session_uri = drive_file.resumable_uri
+                    upload_sessions.set(session_key, session_uri)
+                if status is not None:
+                    chunks.record(status.resumable_progress - uploaded, time.time() - chunk_start)
+                    self.__commit_progress(media_body, status.resumable_progress, uploaded, counted)
+                    uploaded = counted = status.resumable_progress
+        except Exception:
+            chunks.failed()
+            # The session may have been started by the chunk which failed
+            if session_key is not None and session_uri is None and drive_file.resumable_uri is not None:
+                upload_sessions.set(session_key, drive_file.resumable_uri)
+            # A retry resumes the session and counts the bytes Drive already got again
+            self.__add_uploaded_bytes(-counted)
+            raise
+        if session_key is not None:
+            upload_sessions.delete(session_key)
+        self.__commit_progress(media_body, media_body.size(), uploaded, counted)
+        # Only once, however often the upload was retried or resumed
+        self.__book_quota(media_body.size())
         # Insert new permissions
         if not IS_TEAM_DRIVE:
             self.__set_permission(response['id'])
         # Define file instance and get url for download
-        drive_file = self.__service.files().get(supportsTeamDrives=True, fileId=response['id']).execute()
+        drive_file = self.__service.files().get(supportsTeamDrives=True, fileId=response['id'],
+                                                fields=FILE_FIELDS).execute()
+        drive_index.add(drive_file)
         download_url = self.__G_DRIVE_BASE_DOWNLOAD_URL.format(drive_file.get('id'))
         return download_url
 
-    def upload(self, file_name: str):
-        if USE_SERVICE_ACCOUNTS:
-            self.service_account_count = len(os.listdir("accounts"))
+    def upload(self, file_name: str, tar_stream=False, dir_id=None, manifest=None):
+        """
+        Uploads the downloaded file/folder file_name
+        :param tar_stream: upload file_name as a tar archive which is generated while uploading
+        :param dir_id: Drive folder of an interrupted upload of the folder file_name, which is continued
+        :param manifest: fs_utils.PathManifest of the folder file_name, if it has been scanned already
+        """
         self.__listener.onUploadStarted()
         file_dir = f"{DOWNLOAD_DIR}{self.__listener.message.message_id}"
         file_path = f"{file_dir}/{file_name}"
         LOGGER.info("Uploading File: " + file_path)
         self.start_time = time.time()
-        self.updater = setInterval(self.update_interval, self._on_upload_progress)
-        if os.path.isfile(file_path):
-            try:
-                mime_type = get_mime_type(file_path)
+        try:
+            if tar_stream:
+                link = self.upload_tar(file_path, f"{file_name}.tar", parent_id)
+                if link is None:
+                    raise Exception('Upload has been manually cancelled')
+                LOGGER.info(f"Uploaded To G-Drive: {file_path}.tar")
+            elif os.path.isfile(file_path):
+                mime_type = self.__get_mime_type(file_path)
                 link = self.upload_file(file_path, file_name, mime_type, parent_id)
                 if link is None:
                     raise Exception('Upload has been manually cancelled')
                 LOGGER.info("Uploaded To G-Drive: " + file_path)
-            except Exception as e:
-                if isinstance(e, RetryError):
-                    LOGGER.info(f"Total Attempts: {e.last_attempt.attempt_number}")
-                    err = e.last_attempt.exception()
-                else:
-                    err = e
-                LOGGER.error(err)
-                self.__listener.onUploadError(str(err))
-                return
-            finally:
-                self.updater.cancel()
-        else:
-            try:
-                dir_id = self.create_directory(os.path.basename(os.path.abspath(file_name)), parent_id)
-                result = self.upload_dir(file_path, dir_id)
+            else:
+                if dir_id is not None and self.resume_folder(file_path, dir_id):
+                    LOGGER.info(f"Resuming upload of {file_path} into {dir_id}")
+                # The folder may already exist if some of its files were uploaded while downloading
+                dir_id = self.__get_dir_id(file_path, parent_id)
+                result = self.upload_dir(file_path, dir_id, manifest)
                 if result is None:
                     raise Exception('Upload has been manually cancelled!')
                 LOGGER.info("Uploaded To G-Drive: " + file_name)
                 link = f"https://drive.google.com/folderview?id={dir_id}"
-            except Exception as e:
-                if isinstance(e, RetryError):
-                    LOGGER.info(f"Total Attempts: {e.last_attempt.attempt_number}")
-                    err = e.last_attempt.exception()
-                else:
-                    err = e
-                LOGGER.error(err)
-                self.__listener.onUploadError(str(err))
-                return
-            finally:
-                self.updater.cancel()
+        except Exception as e:
+            if isinstance(e, RetryError):
+                LOGGER.info(f"Total Attempts: {e.last_attempt.attempt_number}")
+                err = e.last_attempt.exception()
+            else:
+                err = e
+            LOGGER.error(err)
+            self.__listener.onUploadError(str(err))
+            return
         LOGGER.info(download_dict)
         self.__listener.onUploadComplete(link)
         LOGGER.info("Deleting downloaded file/folder..")
         return link
 
     @retry(wait=wait_exponential(multiplier=2, min=3, max=6), stop=stop_after_attempt(5),
-           retry=retry_if_exception_type(HttpError), before=before_log(LOGGER, logging.DEBUG))
+           retry=retry_if_exception_type(HttpError), before=before_log(LOGGER, logging.DEBUG),
+           before_sleep=_count_retry)
     def copyFile(self, file_id, dest_id):
         body = {
             'parents': [dest_id]
         }
 
         try:
-            res = self.__service.files().copy(supportsAllDrives=True,fileId=file_id,body=body).execute()
+            res = self.__service.files().copy(supportsAllDrives=True,fileId=file_id,body=body,
+                                              fields=FILE_FIELDS).execute()
+            drive_index.add(res)
             return res
         except HttpError as err:
             if err.resp.get('content-type', '').startswith('application/json'):
@@ -248,18 +435,21 @@ class GoogleDriveHelper:
                     if USE_SERVICE_ACCOUNTS:
                         self.switchServiceAccount()
                         LOGGER.info(f"Got: {reason}, Trying Again.")
+                        DRIVE_RETRIES.inc(reason=reason)
                         return self.copyFile(file_id,dest_id)
                 else:
                     raise err
 
     @retry(wait=wait_exponential(multiplier=2, min=3, max=6), stop=stop_after_attempt(5),
-           retry=retry_if_exception_type(HttpError), before=before_log(LOGGER, logging.DEBUG))
+           retry=retry_if_exception_type(HttpError), before=before_log(LOGGER, logging.DEBUG),
+           before_sleep=_count_retry)
     def getFileMetadata(self,file_id):
         return self.__service.files().get(supportsAllDrives=True, fileId=file_id,
                                               fields="name,id,mimeType,size").execute()
 
     @retry(wait=wait_exponential(multiplier=2, min=3, max=6), stop=stop_after_attempt(5),
-           retry=retry_if_exception_type(HttpError), before=before_log(LOGGER, logging.DEBUG))
+           retry=retry_if_exception_type(HttpError), before=before_log(LOGGER, logging.DEBUG),
+           before_sleep=_count_retry)
     def getFilesByFolderId(self,folder_id):
         page_token = None
         q = f"'{folder_id}' in parents"
@@ -270,7 +460,7 @@ class GoogleDriveHelper:
                                                    q=q,
                                                    spaces='drive',
                                                    pageSize=200,
-                                                   fields='nextPageToken, files(id, name, mimeType,size)',
+                                                   fields='nextPageToken, files(id, name, mimeType, size, md5Checksum)',
                                                    pageToken=page_token).execute()
             for file in response.get('files', []):
                 files.append(file)
@@ -279,10 +469,15 @@ class GoogleDriveHelper:
                 break
         return files
 
-    def clone(self, link):
+    def clone(self, link, dest_link=None):
+        """
+        :param dest_link: folder of an earlier clone of link, only the files missing in it are copied
+        """
         self.transferred_size = 0
+        self.total_size = 0
         try:
             file_id = self.getIdFromUrl(link)
+            dest_id = self.getIdFromUrl(dest_link) if dest_link is not None else None
         except (KeyError,IndexError):
             msg = "Google drive ID could not be found in the provided link"
             return msg
@@ -290,16 +485,44 @@ class GoogleDriveHelper:
         LOGGER.info(f"File ID: {file_id}")
         try:
             meta = self.getFileMetadata(file_id)
+            self.name = meta.get('name')
             if meta.get("mimeType") == self.__G_DRIVE_DIR_MIME_TYPE:
-                dir_id = self.create_directory(meta.get('name'), parent_id)
-                result = self.cloneFolder(meta.get('name'), meta.get('name'), meta.get('id'), dir_id)
+                checkpoint = CloneCheckpoint(meta.get('id'))
+                if dest_id is None:
+                    dest_id = checkpoint.destination()
+                if dest_id is not None and self.__folder_exists(dest_id):
+                    LOGGER.info(f"Resuming clone of {meta.get('name')} into {dest_id}")
+                    dir_id = dest_id
+                    incremental = True
+                else:
+                    dir_id = self.create_directory(meta.get('name'), parent_id)
+                    incremental = False
+                checkpoint.start(dir_id)
+                result = self.cloneFolder(meta.get('name'), meta.get('name'), meta.get('id'), dir_id,
+                                          checkpoint, incremental)
+                if result is None:
+                    return "Clone has been manually cancelled!"
+                if not self.__clone_failed:
+                    checkpoint.delete()
                 msg += f'<a href="{self.__G_DRIVE_DIR_BASE_DOWNLOAD_URL.format(dir_id)}">{meta.get("name")}</a>' \
                         f' ({get_readable_file_size(self.transferred_size)})'
                 if INDEX_URL is not None:
                     url = requests.utils.requote_uri(f'{INDEX_URL}/{meta.get("name")}/')
                     msg += f' | <a href="{url}"> Index URL</a>'
+                if self.__clone_skipped:
+                    msg += f'\n{self.__clone_skipped} files were already there'
+                if self.__clone_failed:
+                    msg += f'\n{self.__clone_failed} files could not be copied, /clone again to retry them'
             else:
+                try:
+                    self.total_size = int(meta.get("size"))
+                except TypeError:
+                    pass
+                self.__check_quota(self.total_size)
                 file = self.copyFile(meta.get('id'), parent_id)
+                self.__book_quota(self.total_size)
+                self.transferred_size = self.total_size
+                self.__speed.add(self.total_size)
                 msg += f'<a href="{self.__G_DRIVE_BASE_DOWNLOAD_URL.format(file.get("id"))}">{file.get("name")}</a>'
                 try:
                     msg += f' ({get_readable_file_size(int(meta.get("size")))}) '
@@ -317,36 +540,159 @@ class GoogleDriveHelper:
             return err
         return msg
 
-    def cloneFolder(self, name, local_path, folder_id, parent_id):
+    def __folder_exists(self, folder_id):
+        try:
+            meta = self.__service.files().get(supportsAllDrives=True, fileId=folder_id,
+                                              fields="mimeType,trashed").execute()
+        except HttpError as err:
+            LOGGER.info(f"Destination folder {folder_id} not usable: {err}")
+            return False
+        return meta.get('mimeType') == self.__G_DRIVE_DIR_MIME_TYPE and not meta.get('trashed')
+
+    def cloneFolder(self, name, local_path, folder_id, parent_id, checkpoint=None, incremental=False):
+        """
+        Copies the content of the folder folder_id into parent_id. The tree is walked breadth first by
+        CLONE_WORKERS threads, which list the source folders, create the destination folders and copy the files.
+        :param checkpoint: CloneCheckpoint the progress is recorded in
+        :param incremental: parent_id already has content, files which are in it already are skipped
+        :return: parent_id or None if the clone was cancelled
+        """
         LOGGER.info(f"Syncing: {local_path}")
-        files = self.getFilesByFolderId(folder_id)
-        new_id = None
-        if len(files) == 0:
-            return parent_id
-        for file in files:
+        self.__clone_checkpoint = checkpoint if checkpoint is not None else CloneCheckpoint(folder_id)
+        self.__clone_lock = threading.Condition()
+        self.__clone_pending = 0
+        self.__clone_failed = 0
+        self.__clone_skipped = 0
+        self.__clone_error = None
+        # Key: source folder id, Value: number of its files which still have to be copied
+        self.__clone_files_left = {}
+        with ThreadPoolExecutor(max_workers=CLONE_WORKERS) as executor:
+            self.__clone_executor = executor
+            self.__submit_clone_task(self.__clone_folder_items, local_path, folder_id, parent_id, incremental)
+            with self.__clone_lock:
+                while self.__clone_pending > 0:
+                    self.__clone_lock.wait()
+        if self.__clone_error is not None:
+            raise self.__clone_error
+        if self.is_cancelled:
+            return None
+        return parent_id
+
+    def __submit_clone_task(self, task, *args):
+        with self.__clone_lock:
+            self.__clone_pending += 1
+        self.__clone_executor.submit(self.__run_clone_task, task, *args)
+
+    def __run_clone_task(self, task, *args):
+        try:
+            if not self.is_cancelled:
+                task(*args)
+        except Exception as e:
+            if isinstance(e, RetryError):
+                LOGGER.info(f"Total Attempts: {e.last_attempt.attempt_number}")
+                err = e.last_attempt.exception()
+            else:
+                err = e
+            LOGGER.error(err)
+            with self.__clone_lock:
+                if task == self.__clone_file:
+                    self.__clone_failed += 1
+                elif self.__clone_error is None:
+                    # A folder which can't be listed or created fails the whole clone
+                    self.__clone_error = err
+                    self.is_cancelled = True
+        finally:
+            with self.__clone_lock:
+                self.__clone_pending -= 1
+                if self.__clone_pending == 0:
+                    self.__clone_lock.notify_all()
+
+    @staticmethod
+    def __clone_key(file):
+        """:return: what identifies a copy of file, Google Docs have neither size nor checksum"""
+        return file.get('name'), file.get('size'), file.get('md5Checksum')
+
+    def __index_folder(self, folder_id):
+        """:return: (keys of the files, Dict of folder name -> folder id) in folder_id"""
+        files = set()
+        folders = {}
+        for file in self.getFilesByFolderId(folder_id):
             if file.get('mimeType') == self.__G_DRIVE_DIR_MIME_TYPE:
+                folders.setdefault(file.get('name'), file.get('id'))
+            else:
+                files.add(self.__clone_key(file))
+        return files, folders
+
+    def __clone_folder_items(self, local_path, folder_id, parent_id, incremental):
+        checkpoint = self.__clone_checkpoint
+        # All files of the folder were copied before the clone got interrupted
+        files_done = incremental and checkpoint.is_done(folder_id)
+        index = None
+        copies = []
+        for file in self.getFilesByFolderId(folder_id):
+            if file.get('mimeType') == self.__G_DRIVE_DIR_MIME_TYPE:
+                dest_id = None
+                if incremental:
+                    dest_id = checkpoint.folder(file.get('id'))
+                    if dest_id is None:
+                        if index is None:
+                            index = self.__index_folder(parent_id)
+                        dest_id = index[1].get(file.get('name'))
                 file_path = os.path.join(local_path, file.get('name'))
-                current_dir_id = self.create_directory(file.get('name'), parent_id)
-                new_id = self.cloneFolder(file.get('name'), file_path, file.get('id'), current_dir_id)
+                self.__submit_clone_task(self.__clone_subfolder, file_path, file.get('id'), parent_id, dest_id)
+                continue
+            try:
+                size = int(file.get('size'))
+            except TypeError:
+                size = 0
+            with self.__clone_lock:
+                self.total_size += size
+            if files_done:
+                skip = True
+            elif incremental:
+                if index is None:
+                    index = self.__index_folder(parent_id)
+                skip = self.__clone_key(file) in index[0]
             else:
-                try:
-                    self.transferred_size += int(file.get('size'))
-                except TypeError:
-                    pass
-                try:
-                    self.copyFile(file.get('id'), parent_id)
-                    new_id = parent_id
-                except Exception as e:
-                    if isinstance(e, RetryError):
-                        LOGGER.info(f"Total Attempts: {e.last_attempt.attempt_number}")
-                        err = e.last_attempt.exception()
-                    else:
-                        err = e
-                    LOGGER.error(err)
-        return new_id
+                skip = False
+            if skip:
+                with self.__clone_lock:
+                    self.transferred_size += size
+                    self.__clone_skipped += 1
+                continue
+            copies.append((file.get('id'), size))
+        if not copies:
+            checkpoint.set_done(folder_id)
+            return
+        with self.__clone_lock:
+            self.__clone_files_left[folder_id] = len(copies)
+        for file_id, size in copies:
+            self.__submit_clone_task(self.__clone_file, file_id, size, folder_id, parent_id)
+
+    def __clone_subfolder(self, local_path, folder_id, parent_id, dest_id):
+        LOGGER.info(f"Syncing: {local_path}")
+        incremental = dest_id is not None
+        if not incremental:
+            dest_id = self.create_directory(os.path.basename(local_path), parent_id)
+        self.__clone_checkpoint.set_folder(folder_id, dest_id)
+        self.__clone_folder_items(local_path, folder_id, dest_id, incremental)
+
+    def __clone_file(self, file_id, size, folder_id, parent_id):
+        self.__check_quota(size)
+        if self.copyFile(file_id, parent_id) is None:
+            raise Exception(f"Copying {file_id} failed")
+        self.__book_quota(size)
+        self.__speed.add(size)
+        with self.__clone_lock:
+            self.transferred_size += size
+            self.__clone_files_left[folder_id] -= 1
+            folder_done = self.__clone_files_left[folder_id] == 0
+        if folder_done:
+            self.__clone_checkpoint.set_done(folder_id)
 
     @retry(wait=wait_exponential(multiplier=2, min=3, max=6), stop=stop_after_attempt(5),
-           retry=retry_if_exception_type(HttpError), before=before_log(LOGGER, logging.DEBUG))
+           retry=retry_if_exception_type(HttpError), before=before_log(LOGGER, logging.DEBUG),
+           before_sleep=_count_retry)
     def create_directory(self, directory_name, parent_id):
         file_metadata = {
             "name": directory_name,
@@ -354,58 +700,188 @@ class GoogleDriveHelper:
         }
         if parent_id is not None:
             file_metadata["parents"] = [parent_id]
-        file = self.__service.files().create(supportsTeamDrives=True, body=file_metadata).execute()
+        file = self.__service.files().create(supportsTeamDrives=True, body=file_metadata,
+                                             fields=FILE_FIELDS).execute()
+        drive_index.add(file)
         file_id = file.get("id")
         if not IS_TEAM_DRIVE:
             self.__set_permission(file_id)
         LOGGER.info("Created Google-Drive Folder:\nName: {}\nID: {} ".format(file.get("name"), file_id))
         return file_id
 
-    def upload_dir(self, input_directory, parent_id):
-        list_dirs = os.listdir(input_directory)
-        if len(list_dirs) == 0:
+    def upload_pipelined(self, file_path, root_path):
+        """
+        Uploads a finished file of the folder root_path, which is still downloading.
+        upload() of root_path later reuses the Drive folders and skips the files uploaded here.
+        """
+        if self.is_cancelled:
+            return None
+        dir_id = self.__get_dir_id(os.path.dirname(file_path), parent_id, root_path)
+        link = self.__upload_dir_file(file_path, dir_id)
+        if link is not None:
+            with self.__dir_lock:
+                self.__uploaded_files.add(os.path.normpath(file_path))
+        return link
+
+    def __get_dir_id(self, local_dir, root_parent_id, root_path=None):
+        """
+        Creates the Drive folder of local_dir and of its parents up to root_path, once
+        :param root_parent_id: id of the Drive folder root_path is created in
+        :param root_path: local folder the upload started from, local_dir itself if None
+        """
+        local_dir = os.path.normpath(local_dir)
+        root_path = local_dir if root_path is None else os.path.normpath(root_path)
+        with self.__dir_lock:
+            dir_id = self.__dir_ids.get(local_dir)
+            if dir_id is None:
+                if local_dir == root_path:
+                    drive_parent_id = root_parent_id
+                else:
+                    drive_parent_id = self.__get_dir_id(os.path.dirname(local_dir), root_parent_id, root_path)
+                dir_id = self.create_directory(os.path.basename(local_dir), drive_parent_id)
+                self.__dir_ids[local_dir] = dir_id
+                if local_dir == root_path and self.__listener is not None:
+                    self.__listener.onUploadFolderCreated(dir_id)
+            return dir_id
+
+    def discard_pipelined(self, root_path):
+        """
+        Moves the Drive folder of root_path, which upload_pipelined created, to the trash, as the download
+        it was for has been cancelled or failed
+        :return: id of the folder, None if none was created
+        """
+        with self.__dir_lock:
+            dir_id = self.__dir_ids.get(os.path.normpath(root_path))
+        if dir_id is not None:
+            self.__trash(dir_id)
+        return dir_id
+
+    @retry(wait=wait_exponential(multiplier=2, min=3, max=6), stop=stop_after_attempt(5),
+           retry=retry_if_exception_type(HttpError), before=before_log(LOGGER, logging.DEBUG),
+           before_sleep=_count_retry)
+    def __trash(self, file_id):
+        self.__service.files().update(supportsAllDrives=True, fileId=file_id, body={'trashed': True}).execute()
+        drive_index.remove(file_id)
+
+    def resume_folder(self, local_path, dir_id):
+        """
+        Prepares the upload of the folder local_path to continue into dir_id, the Drive folder of an
+        earlier upload of it. Its subfolders are reused and the files which are already there are skipped.
+        Files only show up in Drive once they are complete, so a file with the same name and size is done.
+        :return: False if dir_id can't be used
+        """
+        if not self.__folder_exists(dir_id):
+            return False
+        self.__match_folder(local_path, dir_id)
+        return True
+
+    def __match_folder(self, local_path, dir_id):
+        with self.__dir_lock:
+            self.__dir_ids[os.path.normpath(local_path)] = dir_id
+        files = set()
+        folders = {}
+        for file in self.getFilesByFolderId(dir_id):
+            if file.get('mimeType') == self.__G_DRIVE_DIR_MIME_TYPE:
+                folders.setdefault(file.get('name'), file.get('id'))
+            else:
+                files.add((file.get('name'), file.get('size')))
+        for item in os.listdir(local_path):
+            item_path = os.path.join(local_path, item)
+            if os.path.isdir(item_path):
+                if item in folders:
+                    self.__match_folder(item_path, folders[item])
+            else:
+                size = os.path.getsize(item_path)
+                if (item, str(size)) in files:
+                    with self.__dir_lock:
+                        self.__uploaded_files.add(os.path.normpath(item_path))
+                    self.__add_uploaded_bytes(size)
+
+    def upload_dir(self, input_directory, parent_id, manifest=None):
+        with self.__dir_lock:
+            self.__dir_ids.setdefault(os.path.normpath(input_directory), parent_id)
+        if manifest is None:
+            manifest = scan_path(input_directory)
+        # Folders are created upfront, so that the files can then be uploaded in any order
+        files = self.__create_dir_tree(manifest)
+        if files is None:
+            return None
+        # The types are detected in the order the files are uploaded in, ahead of the uploading threads
+        detections = mime_types.prefetch(file_path for file_path, file_parent_id in files)
+        try:
+            return self.__upload_dir_files(files, parent_id)
+        finally:
+            mime_types.cancel(detections)
+
+    def __upload_dir_files(self, files, parent_id):
+        if UPLOAD_WORKERS == 1 or len(files) < 2:
+            for file_path, file_parent_id in files:
+                if self.__upload_dir_file(file_path, file_parent_id) is None:
+                    return None
             return parent_id
-        new_id = None
-        for item in list_dirs:
-            current_file_name = os.path.join(input_directory, item)
+        with ThreadPoolExecutor(max_workers=min(UPLOAD_WORKERS, len(files))) as executor:
+            futures = [executor.submit(self.__upload_dir_file, file_path, file_parent_id)
+                       for file_path, file_parent_id in files]
+            done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in done:
+                err = future.exception()
+                if err is not None:
+                    # The whole folder is reported as failed, so stop the uploads still running
+                    self.is_cancelled = True
+                    for pending in not_done:
+                        pending.cancel()
+                    raise err
+        if self.is_cancelled:
+            return None
+        return parent_id
+
+    def __create_dir_tree(self, manifest):
+        """
+        Creates the Drive folders of the folders in manifest which don't exist yet
+        :return: list of (file path, id of its Drive folder) of the files to upload, None if cancelled
+        """
+        for dir_path in manifest.dirs:
             if self.is_cancelled:
                 return None
-            if os.path.isdir(current_file_name):
-                current_dir_id = self.create_directory(item, parent_id)
-                new_id = self.upload_dir(current_file_name, current_dir_id)
-            else:
-                mime_type = get_mime_type(current_file_name)
-                file_name = current_file_name.split("/")[-1]
-                # current_file_name will have the full path
-                self.upload_file(current_file_name, file_name, mime_type, parent_id)
-                new_id = parent_id
-        return new_id
+            with self.__dir_lock:
+                dir_id = self.__dir_ids.get(os.path.normpath(dir_path))
+                parent_id = self.__dir_ids[os.path.normpath(os.path.dirname(dir_path))]
+            if dir_id is None:
+                dir_id = self.create_directory(os.path.basename(dir_path), parent_id)
+                with self.__dir_lock:
+                    self.__dir_ids[os.path.normpath(dir_path)] = dir_id
+        files = []
+        with self.__dir_lock:
+            for file_path, size in manifest.files:
+                if os.path.normpath(file_path) not in self.__uploaded_files:
+                    files.append((file_path, self.__dir_ids[os.path.normpath(os.path.dirname(file_path))]))
+        return files
+
+    def __upload_dir_file(self, file_path, parent_id):
+        if self.is_cancelled:
+            return None
+        mime_type = self.__get_mime_type(file_path)
+        file_name = os.path.basename(file_path)
+        if self.__trace is None:
+            return self.upload_file(file_path, file_name, mime_type, parent_id)
+        with self.__trace.timed('upload_file'):
+            return self.upload_file(file_path, file_name, mime_type, parent_id)
+
+    def __get_mime_type(self, file_path):
+        if self.__trace is None:
+            return get_mime_type(file_path)
+        with self.__trace.timed('get_mime_type'):
+            return get_mime_type(file_path)
 
     def authorize(self):
-        # Get credentials
-        credentials = None
-        if not USE_SERVICE_ACCOUNTS:
-            if os.path.exists(self.__G_DRIVE_TOKEN_FILE):
-                with open(self.__G_DRIVE_TOKEN_FILE, 'rb') as f:
-                    credentials = pickle.load(f)
-            if credentials is None or not credentials.valid:
-                if credentials and credentials.expired and credentials.refresh_token:
-                    credentials.refresh(Request())
-                else:
-                    flow = InstalledAppFlow.from_client_secrets_file(
-                        'credentials.json', self.__OAUTH_SCOPE)
-                    LOGGER.info(flow)
-                    credentials = flow.run_console(port=0)
-
-                # Save the credentials for the next run
-                with open(self.__G_DRIVE_TOKEN_FILE, 'wb') as token:
-                    pickle.dump(credentials, token)
-        else:
-            LOGGER.info(f"Authorizing with {SERVICE_ACCOUNT_INDEX}.json service account")
-            credentials = service_account.Credentials.from_service_account_file(
-                f'accounts/{SERVICE_ACCOUNT_INDEX}.json',
-                scopes=self.__OAUTH_SCOPE)
-        return build('drive', 'v3', credentials=credentials, cache_discovery=False)
+        account = None
+        if USE_SERVICE_ACCOUNTS:
+            # Every thread works with its own account, so concurrent uploads spread over the accounts
+            account = getattr(self.__local, 'account', None)
+            if account is None:
+                account = self.__local.account = service_accounts.acquire()
+            LOGGER.info(f"Authorizing with {account} service account")
+        return drive_services.get(account)
 
     def escapes(self, str):
         chars = ['\\', "'", '"', r'\a', r'\b', r'\f', r'\n', r'\r', r'\t']
@@ -413,7 +889,48 @@ class GoogleDriveHelper:
             str = str.replace(char, '\\'+char)
         return str
 
-    def drive_list(self, fileName):
+    def __list_entry(self, file, path=None):
+        """
+        :param path: path of the file below GDRIVE_FOLDER_ID, its name if None
+        """
+        if path is None:
+            path = file.get('name')
+        msg = ""
+        if file.get(
+                'mimeType') == "application/vnd.google-apps.folder":  # Detect Whether Current Entity is a Folder or File.
+            msg += f"⁍ <a href='https://drive.google.com/drive/folders/{file.get('id')}'>{file.get('name')}" \
+                   f"</a> (folder)"
+            if INDEX_URL is not None:
+                url = requests.utils.requote_uri(f'{INDEX_URL}/{path}/')
+                msg += f' | <a href="{url}"> Index URL</a>'
+
+        elif file.get('mimeType') == 'application/vnd.google-apps.shortcut':
+                msg += f"⁍ <a href='https://drive.google.com/drive/folders/{file.get('id')}'>{file.get('name')}" \
+                    f"</a> (shortcut)"
+                # Excluded index link as indexes cant download or open these shortcuts
+        else:
+            msg += f"⁍ <a href='https://drive.google.com/uc?id={file.get('id')}" \
+                   f"&export=download'>{file.get('name')}</a> ({get_readable_file_size(int(file.get('size') or 0))})"
+            if INDEX_URL is not None:
+                url = requests.utils.requote_uri(f'{INDEX_URL}/{path}')
+                msg += f' | <a href="{url}"> Index URL</a>'
+        msg += '\n'
+        return msg
+
+    def drive_list(self, fileName, page=1):
+        """
+        Searches the local index of the drive if it is ready, else the direct children of GDRIVE_FOLDER_ID
+        :param page: page of the results to show, starting from 1
+        """
+        if drive_index.ready:
+            files, total = drive_index.search(str(fileName), page, self.__LIST_PAGE_SIZE)
+            msg = ""
+            for file in files:
+                msg += self.__list_entry(file, drive_index.path(file.get('id')))
+            pages = -(-total // self.__LIST_PAGE_SIZE)
+            if pages > 1:
+                msg += f'\nPage {page} of {pages}, {total} results'
+            return msg
         msg = ""
         fileName = self.escapes(str(fileName))
         # Create Search Query for API request.
@@ -422,27 +939,9 @@ class GoogleDriveHelper:
                                                includeTeamDriveItems=True,
                                                q=query,
                                                spaces='drive',
-                                               pageSize=20,
+                                               pageSize=self.__LIST_PAGE_SIZE,
                                                fields='files(id, name, mimeType, size)',
                                                orderBy='modifiedTime desc').execute()
         for file in response.get('files', []):
-            if file.get(
-                    'mimeType') == "application/vnd.google-apps.folder":  # Detect Whether Current Entity is a Folder or File.
-                msg += f"⁍ <a href='https://drive.google.com/drive/folders/{file.get('id')}'>{file.get('name')}" \
-                       f"</a> (folder)"
-                if INDEX_URL is not None:
-                    url = requests.utils.requote_uri(f'{INDEX_URL}/{file.get("name")}/')
-                    msg += f' | <a href="{url}"> Index URL</a>'
-            
-            elif file.get('mimeType') == 'application/vnd.google-apps.shortcut':
-                    msg += f"⁍ <a href='https://drive.google.com/drive/folders/{file.get('id')}'>{file.get('name')}" \
-                        f"</a> (shortcut)"
-                    # Excluded index link as indexes cant download or open these shortcuts
-            else:
-                msg += f"⁍ <a href='https://drive.google.com/uc?id={file.get('id')}" \
-                       f"&export=download'>{file.get('name')}</a> ({get_readable_file_size(int(file.get('size')))})"
-                if INDEX_URL is not None:
-                    url = requests.utils.requote_uri(f'{INDEX_URL}/{file.get("name")}')
-                    msg += f' | <a href="{url}"> Index URL</a>'
-            msg += '\n'
+            msg += self.__list_entry(file)
         return msg
@@ -0,0 +1,99 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from tenacity import RetryError
+
+from bot import LOGGER, DOWNLOAD_DIR, UPLOAD_WORKERS, download_dict, download_dict_lock
+from bot.helper.ext_utils.bot_utils import setInterval
+from bot.helper.mirror_utils.status_utils.aria_download_status import AriaDownloadStatus
+from bot.helper.mirror_utils.upload_utils.gdriveTools import GoogleDriveHelper
+
+
+class PipelinedUploader:
+    """
+    Uploads the files of a multi-file aria2 download as soon as each of them is complete, while the rest
+    of the download is still running. The final upload of the folder skips the files uploaded here.
+    It is only created once the metadata of a torrent shows more than one file.
+    """
+    POLLING_INTERVAL = 5
+
+    def __init__(self, listener):
+        self.__listener = listener
+        self.drive = GoogleDriveHelper(None, listener)
+        self.__executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS)
+        self.__submitted = set()
+        self.__lock = threading.Lock()
+        self.__finished = False
+        self.__root_path = None
+        self.__periodic = setInterval(self.POLLING_INTERVAL, self.__onInterval)
+
+    def __onInterval(self):
+        with download_dict_lock:
+            status = download_dict.get(self.__listener.uid)
+        if not isinstance(status, AriaDownloadStatus):
+            return
+        try:
+            download = status.aria_download()
+            files = download.files
+        except Exception as e:
+            LOGGER.error(f'Unable to get the files of {self.__listener.uid}: {e}')
+            return
+        # Nothing to overlap with before the files are known
+        if len(files) < 2:
+            return
+        job_dir = f'{DOWNLOAD_DIR}{self.__listener.uid}'
+        root_path = os.path.join(job_dir, download.name)
+        with self.__lock:
+            if self.__finished:
+                return
+            self.__root_path = root_path
+            for file in files:
+                if not file.selected or file.length == 0 or file.completed_length != file.length:
+                    continue
+                # aria2 reports normalized paths, rebuild them the same way the final upload does
+                file_path = os.path.join(job_dir, os.path.relpath(str(file.path), str(download.dir)))
+                if file_path in self.__submitted:
+                    continue
+                self.__submitted.add(file_path)
+                self.__executor.submit(self.__upload, file_path, root_path)
+
+    def __upload(self, file_path, root_path):
+        try:
+            LOGGER.info(f'Uploading while downloading: {file_path}')
+            self.drive.upload_pipelined(file_path, root_path)
+        except Exception as e:
+            # Not marked as uploaded, so the final upload of the folder uploads it again
+            if isinstance(e, RetryError):
+                e = e.last_attempt.exception()
+            LOGGER.error(f'Pipelined upload of {file_path} failed: {e}')
+
+    def finish(self):
+        """Stops looking for finished files and waits for the uploads which are running"""
+        self.__periodic.cancel()
+        with self.__lock:
+            self.__finished = True
+        self.__executor.shutdown(wait=True)
+
+    def cancel(self):
+        """Stops the uploads and moves what they uploaded to the trash, in the background"""
+        self.__periodic.cancel()
+        with self.__lock:
+            self.__finished = True
+        self.drive.cancel()
+        threading.Thread(target=self.__discard, daemon=True).start()
+
+    def __discard(self):
+        # The running uploads stop at their next chunk
+        self.__executor.shutdown(wait=True)
+        if self.__root_path is None:
+            return
+        try:
+            dir_id = self.drive.discard_pipelined(self.__root_path)
+        except Exception as e:
+            if isinstance(e, RetryError):
+                e = e.last_attempt.exception()
+            LOGGER.error(f'Unable to trash the Drive folder of {self.__root_path}, it is left incomplete: {e}')
+            return
+        if dir_id is not None:
+            LOGGER.info(f'Moved the incomplete Drive folder {dir_id} of {self.__root_path} to the trash')
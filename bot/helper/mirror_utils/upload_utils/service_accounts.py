@@ -0,0 +1,95 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+LOGGER = logging.getLogger(__name__)
+
+
+class _Account:
+    def __init__(self, file):
+        self.file = file
+        # (time, bytes) of the uploads and copies of the last DAY
+        self.usage = deque()
+        self.used = 0
+        self.cooldown_until = 0
+        self.last_acquired = 0
+
+
+class ServiceAccountPool:
+    """
+    Hands out the service accounts of the accounts folder to the uploading threads. It keeps track of
+    the bytes every account transferred during the last day, so accounts are rotated before they hit
+    the daily upload limit of Google Drive, and accounts which hit it anyway are put aside for a while.
+    """
+    DAILY_LIMIT = 750 * 1024 ** 3
+    DAY = 24 * 60 * 60
+    # An account which got rate limited is only handed out again after this, unless every account is
+    COOLDOWN = 60 * 60
+
+    def __init__(self, path):
+        self.__path = path
+        self.__lock = threading.Lock()
+        self.__accounts = None
+
+    def __load(self):
+        if self.__accounts is None:
+            files = sorted((file for file in os.listdir(self.__path) if file.endswith('.json')),
+                           key=lambda file: (len(file), file))
+            if not files:
+                raise FileNotFoundError(f'No service accounts found in {self.__path}')
+            self.__accounts = {file: _Account(file) for file in files}
+            LOGGER.info(f'Loaded {len(files)} service accounts')
+        return self.__accounts
+
+    def __remaining(self, account, now):
+        while account.usage and account.usage[0][0] < now - self.DAY:
+            account.used -= account.usage.popleft()[1]
+        return self.DAILY_LIMIT - account.used
+
+    def acquire(self, size=0, exclude=None):
+        """
+        Picks the account which can transfer size bytes and was handed out the longest time ago,
+        so that concurrent uploads use different accounts
+        :param exclude: account which shouldn't be picked, unless it is the only one
+        :return: file name of the account
+        """
+        with self.__lock:
+            accounts = self.__load()
+            now = time.time()
+            candidates = [account for account in accounts.values()
+                          if account.cooldown_until <= now and self.__remaining(account, now) > size]
+            if len(candidates) > 1 and exclude is not None:
+                candidates = [account for account in candidates if account.file != exclude]
+            if candidates:
+                account = min(candidates, key=lambda account: account.last_acquired)
+            else:
+                # Everything is used up, try the account which becomes usable the soonest
+                account = min(accounts.values(), key=lambda account: (account.cooldown_until,
+                                                                       -self.__remaining(account, now)))
+                LOGGER.warning(f'All service accounts are exhausted, trying {account.file}')
+            account.last_acquired = now
+            return account.file
+
+    def has_quota(self, account, size):
+        with self.__lock:
+            account = self.__load()[account]
+            now = time.time()
+            return account.cooldown_until <= now and self.__remaining(account, now) > size
+
+    def add_usage(self, account, size):
+        if not size:
+            return
+        with self.__lock:
+            account = self.__load()[account]
+            account.usage.append((time.time(), size))
+            account.used += size
+
+    def mark_exhausted(self, account):
+        with self.__lock:
+            self.__load()[account].cooldown_until = time.time() + self.COOLDOWN
+        LOGGER.info(f'Service account {account} is rate limited, not using it for {self.COOLDOWN}s')
+
+
+service_accounts = ServiceAccountPool('accounts')
@@ -0,0 +1,105 @@
+import os
+import tarfile
+import threading
+
+from googleapiclient.http import MediaUpload
+
+from bot import LOGGER
+
+
+class TarStreamUpload(MediaUpload):
+    """
+    Resumable media upload of a tar archive of path, which is generated on the fly.
+    The archive is written by a background thread into a pipe, so archiving and uploading
+    overlap and no temporary tar file is ever written to the disk.
+    """
+    # The next chunk and one byte more are held in memory, so the chunks are kept smaller than they may be
+    # for files, whatever size the uploader asks for. A multiple of the 256 KiB Drive requires
+    MAX_CHUNK_SIZE = 64 * 1024 * 1024
+
+    def __init__(self, path, chunksize, mimetype='application/x-tar'):
+        super().__init__()
+        self.__path = path
+        # Same attribute as MediaFileUpload, the uploader resizes the chunks through it
+        self._chunksize = chunksize
+        self.__mimetype = mimetype
+        read_fd, write_fd = os.pipe()
+        self.__reader = os.fdopen(read_fd, 'rb')
+        self.__writer = os.fdopen(write_fd, 'wb')
+        # Bytes of the archive starting at __buffer_start, kept until the server has committed them
+        self.__buffer = bytearray()
+        self.__buffer_start = 0
+        self.__next_begin = 0
+        self.__size = None
+        self.__eof = False
+        self.__error = None
+        self.__thread = threading.Thread(target=self.__archive, daemon=True)
+        self.__thread.start()
+
+    def __archive(self):
+        try:
+            with tarfile.open(fileobj=self.__writer, mode='w|') as tar:
+                tar.add(self.__path, arcname=os.path.basename(self.__path))
+        except BrokenPipeError:
+            # The reading end was closed, the upload has been cancelled or has failed
+            pass
+        except Exception as e:
+            LOGGER.error(f'Tar stream of {self.__path} failed: {e}')
+            self.__error = e
+        finally:
+            try:
+                self.__writer.close()
+            except OSError:
+                pass
+
+    def __fill(self, end):
+        while not self.__eof and self.__buffer_start + len(self.__buffer) < end:
+            data = self.__reader.read(end - self.__buffer_start - len(self.__buffer))
+            if not data:
+                self.__eof = True
+                self.__thread.join()
+                if self.__error is not None:
+                    raise self.__error
+                self.__size = self.__buffer_start + len(self.__buffer)
+            else:
+                self.__buffer += data
+
+    def chunksize(self):
+        return min(self._chunksize, self.MAX_CHUNK_SIZE)
+
+    def mimetype(self):
+        return self.__mimetype
+
+    def size(self):
+        """
+        Size of the archive, which is only known once the whole archive has been generated
+        :return: size in bytes or None if it is still unknown
+        """
+        if not self.__eof:
+            # Look past the next chunk, so that the last chunk is sent along with the total size
+            self.__fill(self.__next_begin + self.chunksize() + 1)
+        return self.__size
+
+    def resumable(self):
+        return True
+
+    def getbytes(self, begin, length):
+        if begin < self.__buffer_start:
+            raise ValueError(f'Bytes from {begin} of the tar stream have already been discarded')
+        del self.__buffer[:begin - self.__buffer_start]
+        self.__buffer_start = begin
+        self.__fill(begin + length)
+        data = bytes(self.__buffer[:length])
+        self.__next_begin = begin + len(data)
+        return data
+
+    def has_stream(self):
+        return False
+
+    def stream(self):
+        """Not supported, has_stream() returns False so googleapiclient reads the chunks through getbytes()"""
+        raise NotImplementedError('A tar stream upload is read through getbytes(), it has no file object')
+
+    def close(self):
+        self.__reader.close()
+        self.__thread.join()
@@ -0,0 +1,65 @@
+import hashlib
+import logging
+import os
+import threading
+
+import redis
+
+import bot
+
+LOGGER = logging.getLogger(__name__)
+
+
+class UploadSessions:
+    """
+    Resumable upload session URIs of the files being uploaded, so that a retry or an upload after a restart
+    continues from what Drive already got instead of sending the file again. They are kept in redis when
+    it is available, else only in memory.
+    """
+    # Drive keeps upload sessions for a week
+    EXPIRE_TIME = 6 * 24 * 60 * 60
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__sessions = {}
+
+    @staticmethod
+    def key(file_path, file_name, parent_id):
+        """
+        :return: key of the upload of the local file file_path as file_name into parent_id, changes with the file
+        """
+        stat = os.stat(file_path)
+        file_id = f'{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}:{parent_id}:{file_name}'
+        return f'upload_session:{hashlib.sha1(file_id.encode()).hexdigest()}'
+
+    @staticmethod
+    def __call(name, *args):
+        # redis is connected in the background at startup
+        client = bot.redis_client
+        if client is None:
+            return None
+        try:
+            return getattr(client, name)(*args)
+        except redis.RedisError as e:
+            LOGGER.error(f'Upload sessions: {e}')
+            return None
+
+    def get(self, key):
+        with self.__lock:
+            uri = self.__sessions.get(key)
+        if uri is None:
+            uri = self.__call('get', key)
+        return uri
+
+    def set(self, key, uri):
+        with self.__lock:
+            self.__sessions[key] = uri
+        self.__call('set', key, uri, self.EXPIRE_TIME)
+
+    def delete(self, key):
+        with self.__lock:
+            self.__sessions.pop(key, None)
+        self.__call('delete', key)
+
+
+upload_sessions = UploadSessions()
@@ -18,5 +18,6 @@ class _BotCommands:
         self.CloneCommand = "clone"
         self.WatchCommand = 'watch'
         self.TarWatchCommand = 'tarwatch'
+        self.TraceCommand = 'trace'
 
 BotCommands = _BotCommands()
@@ -1,6 +1,7 @@
 from telegram.ext import BaseFilter
 from telegram import Message
-from bot import AUTHORIZED_CHATS, OWNER_ID, download_dict, download_dict_lock
+from bot import AUTHORIZED_CHATS, OWNER_ID, BOT_MODE, download_dict, download_dict_lock
+from bot.helper.ext_utils.worker_queue import worker_queue
 
 
 class CustomFilters:
@@ -36,8 +37,10 @@ class CustomFilters:
                     for message_id, status in download_dict.items():
                         if status.gid() == args[1] and status.message.from_user.id == user_id:
                             return True
-                    else:
-                        return False
+                if BOT_MODE == 'frontend':
+                    return any(snapshot.get('gid') == args[1] and snapshot['user_id'] == user_id
+                               for snapshot in worker_queue.snapshots())
+                return False
             # Cancelling by replying to original mirror message
             reply_user = message.reply_to_message.from_user.id
             return bool(reply_user == user_id)
@@ -1,13 +1,54 @@
 from telegram.message import Message
 from telegram.update import Update
 import time
-from bot import AUTO_DELETE_MESSAGE_DURATION, LOGGER, bot, \
-    status_reply_dict, status_reply_dict_lock
-from bot.helper.ext_utils.bot_utils import get_readable_message
-from telegram.error import TimedOut, BadRequest
+import threading
+from bot import AUTO_DELETE_MESSAGE_DURATION, LOGGER, bot, Interval, \
+    status_reply_dict, status_reply_dict_lock, STATUS_EDIT_RATE_LIMIT, BOT_MODE
+from bot.helper.ext_utils.bot_utils import get_readable_message, get_download_snapshots
+from bot.helper.ext_utils.metrics import TELEGRAM_EDIT_FAILURES
+from bot.helper.ext_utils.worker_queue import worker_queue
+from telegram.error import TimedOut, BadRequest, RetryAfter
 from bot import bot
 
 
+class _EditBudget:
+    """
+    Token bucket shared by all the status message edits.
+    Telegram answers bursts of edits with flood waits, during which no message can be edited at all.
+    """
+
+    def __init__(self, edits_per_minute):
+        self.__rate = edits_per_minute / 60
+        # Allow short bursts of up to 10 seconds worth of edits
+        self.__capacity = max(self.__rate * 10, 1)
+        self.__tokens = self.__capacity
+        self.__last_refill = time.time()
+        self.__blocked_until = 0
+        self.__lock = threading.Lock()
+
+    def consume(self):
+        """:return: True if an edit may be sent now"""
+        with self.__lock:
+            now = time.time()
+            self.__tokens = min(self.__capacity, self.__tokens + (now - self.__last_refill) * self.__rate)
+            self.__last_refill = now
+            if now < self.__blocked_until or self.__tokens < 1:
+                return False
+            self.__tokens -= 1
+            return True
+
+    def pause(self, seconds):
+        with self.__lock:
+            self.__blocked_until = max(self.__blocked_until, time.time() + seconds)
+
+
+edit_budget = _EditBudget(STATUS_EDIT_RATE_LIMIT)
+# Key: chat id, Value: time of the last edit of the status message of that chat
+status_edit_times = {}
+_update_lock = threading.Lock()
+_update_pending = threading.Event()
+
+
 def sendMessage(text: str, bot, update: Update):
     try:
         return bot.send_message(update.message.chat_id,
@@ -22,8 +63,13 @@ def editMessage(text: str, message: Message):
         bot.edit_message_text(text=text, message_id=message.message_id,
                               chat_id=message.chat.id,
                               parse_mode='HTMl')
+    except RetryAfter as e:
+        LOGGER.warning(str(e))
+        TELEGRAM_EDIT_FAILURES.inc(reason=type(e).__name__)
+        edit_budget.pause(e.retry_after)
     except Exception as e:
         LOGGER.error(str(e))
+        TELEGRAM_EDIT_FAILURES.inc(reason=type(e).__name__)
 
 
 def deleteMessage(bot, message: Message):
@@ -63,19 +109,61 @@ def delete_all_messages():
 
 
 def update_all_messages():
-    msg = get_readable_message()
+    """
+    Renders the status messages of all the chats. Called on every status tick and on download events;
+    calls made while a render is running are coalesced into one more render.
+    """
+    _update_pending.set()
+    while _update_pending.is_set() and _update_lock.acquire(blocking=False):
+        try:
+            _update_pending.clear()
+            _render_status_messages()
+        finally:
+            _update_lock.release()
+
+
+def _render_status_messages():
+    snapshots = get_download_snapshots()
+    if BOT_MODE == 'worker':
+        # The status messages are rendered by the frontend
+        worker_queue.publish(snapshots)
+        return
+    if BOT_MODE == 'frontend' and not snapshots and not worker_queue.processing():
+        # The listeners run on the workers, so nothing else stops the updates once the last mirror is done
+        try:
+            Interval[0].cancel()
+            del Interval[0]
+        except IndexError:
+            pass
     with status_reply_dict_lock:
-        for chat_id in list(status_reply_dict.keys()):
-            if status_reply_dict[chat_id] and msg != status_reply_dict[chat_id].text:
-                try:
-                    editMessage(msg, status_reply_dict[chat_id])
-                except Exception as e:
-                    LOGGER.error(str(e))
-                status_reply_dict[chat_id].text = msg
+        # Chats which waited the longest go first when there isn't enough budget for all of them
+        chats = sorted(status_reply_dict.items(), key=lambda item: status_edit_times.get(item[0], 0))
+    for chat_id, message in chats:
+        if not message:
+            continue
+        msg = get_readable_message(chat_id, snapshots)
+        if not msg:
+            # All downloads of this chat are done
+            with status_reply_dict_lock:
+                if status_reply_dict.get(chat_id) is message:
+                    deleteMessage(bot, message)
+                    del status_reply_dict[chat_id]
+            continue
+        if msg == message.text:
+            continue
+        if not edit_budget.consume():
+            # Out of budget, the remaining chats are updated on the next tick
+            break
+        editMessage(msg, message)
+        message.text = msg
+        status_edit_times[chat_id] = time.time()
 
 
 def sendStatusMessage(msg, bot):
-    progress = get_readable_message()
+    if BOT_MODE == 'worker':
+        update_all_messages()
+        return
+    progress = get_readable_message(msg.message.chat.id)
     with status_reply_dict_lock:
         if msg.message.chat.id in list(status_reply_dict.keys()):
             try:
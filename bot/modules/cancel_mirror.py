@@ -1,13 +1,34 @@
 from telegram.ext import CommandHandler, run_async
 
-from bot import download_dict, dispatcher, download_dict_lock, DOWNLOAD_DIR
+from bot import download_dict, dispatcher, download_dict_lock, DOWNLOAD_DIR, BOT_MODE
 from bot.helper.ext_utils.fs_utils import clean_download
+from bot.helper.ext_utils.worker_queue import worker_queue
 from bot.helper.telegram_helper.bot_commands import BotCommands
 from bot.helper.telegram_helper.filters import CustomFilters
 from bot.helper.telegram_helper.message_utils import *
 
 from time import sleep
-from bot.helper.ext_utils.bot_utils import getDownloadByGid, MirrorStatus
+from bot.helper.ext_utils.bot_utils import getDownloadByGid, get_worker_snapshots, MirrorStatus
+
+
+def _cancel_on_worker(update, context, gid=None, uid=None):
+    """
+    Cancels a mirror which waits for a worker or runs on one, in the frontend mode
+    :return: False if there is no such mirror
+    """
+    if uid is not None and worker_queue.remove(uid):
+        sendMessage("Mirror has been cancelled before it started.", context.bot, update)
+        return True
+    for snapshot in worker_queue.snapshots():
+        if (gid is not None and snapshot.get('gid') == gid) or (uid is not None and snapshot['uid'] == uid):
+            if snapshot['status'] == MirrorStatus.STATUS_UPLOADING:
+                sendMessage("Upload in Progress, Don't Cancel it.", context.bot, update)
+            elif snapshot['status'] == MirrorStatus.STATUS_ARCHIVING:
+                sendMessage("Archival in Progress, Don't Cancel it.", context.bot, update)
+            else:
+                worker_queue.cancel(snapshot['worker'], snapshot['uid'])
+            return True
+    return False
 
 
 @run_async
@@ -18,6 +39,8 @@ def cancel_mirror(update, context):
         gid = args[1]
         dl = getDownloadByGid(gid)
         if not dl:
+            if BOT_MODE == 'frontend' and _cancel_on_worker(update, context, gid=gid):
+                return
             sendMessage(f"GID: <code>{gid}</code> not found.", context.bot, update)
             return
         with download_dict_lock:
@@ -25,9 +48,11 @@ def cancel_mirror(update, context):
         mirror_message = dl.message
     elif update.message.reply_to_message:
         mirror_message = update.message.reply_to_message
+        if BOT_MODE == 'frontend' and _cancel_on_worker(update, context, uid=mirror_message.message_id):
+            return
         with download_dict_lock:
             keys = list(download_dict.keys())
-            dl = download_dict[mirror_message.message_id]
+            dl = download_dict.get(mirror_message.message_id)
     if len(args) == 1:
         if mirror_message is None or mirror_message.message_id not in keys:
             if BotCommands.MirrorCommand in mirror_message.text or \
@@ -57,9 +82,19 @@ def cancel_all(update, context):
         count = 0
         for dlDetails in list(download_dict.values()):
             if dlDetails.status() == MirrorStatus.STATUS_DOWNLOADING \
-                    or dlDetails.status() == MirrorStatus.STATUS_WAITING:
+                    or dlDetails.status() == MirrorStatus.STATUS_WAITING \
+                    or dlDetails.status() == MirrorStatus.STATUS_CLONING:
                 dlDetails.download().cancel_download()
                 count += 1
+    if BOT_MODE == 'frontend':
+        for snapshot in get_worker_snapshots():
+            if snapshot['status'] == MirrorStatus.STATUS_WAITING and 'worker' not in snapshot:
+                if worker_queue.remove(snapshot['uid']):
+                    count += 1
+            elif snapshot['status'] in (MirrorStatus.STATUS_DOWNLOADING, MirrorStatus.STATUS_WAITING,
+                                        MirrorStatus.STATUS_CLONING):
+                worker_queue.cancel(snapshot['worker'], snapshot['uid'])
+                count += 1
     delete_all_messages()
     sendMessage(f'Cancelled {count} downloads!', context.bot, update)
 
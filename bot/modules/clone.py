@@ -1,24 +1,45 @@
 from telegram.ext import CommandHandler
+from bot.helper.mirror_utils.status_utils.clone_status import CloneStatus
 from bot.helper.mirror_utils.upload_utils.gdriveTools import GoogleDriveHelper
 from bot.helper.telegram_helper.message_utils import *
 from bot.helper.telegram_helper.filters import CustomFilters
 from bot.helper.telegram_helper.bot_commands import BotCommands
-from bot.helper.ext_utils.bot_utils import new_thread
-from bot import dispatcher
+from bot.helper.ext_utils.bot_utils import new_thread, setInterval
+from bot import dispatcher, Interval, DOWNLOAD_STATUS_UPDATE_INTERVAL, download_dict, download_dict_lock
 
 
 @new_thread
 def cloneNode(update,context):
-    args = update.message.text.split(" ",maxsplit=1)
+    args = update.message.text.split(" ",maxsplit=2)
     if len(args) > 1:
         link = args[1]
-        msg = sendMessage(f"Cloning: <code>{link}</code>",context.bot,update)
+        # Folder of an earlier clone of link to complete instead of starting a new one
+        dest_link = args[2].strip() if len(args) > 2 else None
         gd = GoogleDriveHelper()
-        result = gd.clone(link)
-        deleteMessage(context.bot,msg)
+        uid = update.message.message_id
+        with download_dict_lock:
+            download_dict[uid] = CloneStatus(gd, link, update.message)
+        sendStatusMessage(update, context.bot)
+        if len(Interval) == 0:
+            Interval.append(setInterval(DOWNLOAD_STATUS_UPDATE_INTERVAL, update_all_messages))
+        try:
+            result = gd.clone(link, dest_link)
+        finally:
+            with download_dict_lock:
+                del download_dict[uid]
+                count = len(download_dict)
         sendMessage(result,context.bot,update)
+        if count == 0:
+            try:
+                Interval[0].cancel()
+                del Interval[0]
+                delete_all_messages()
+            except IndexError:
+                pass
+        else:
+            update_all_messages()
     else:
         sendMessage("Provide G-Drive Shareable Link to Clone.",context.bot,update)
 
 clone_handler = CommandHandler(BotCommands.CloneCommand,cloneNode,filters=CustomFilters.authorized_chat | CustomFilters.authorized_user)
-dispatcher.add_handler(clone_handler)
\ No newline at end of file
+dispatcher.add_handler(clone_handler)
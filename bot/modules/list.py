@@ -10,9 +10,15 @@ from bot.helper.telegram_helper.bot_commands import BotCommands
 def list_drive(update,context):
     message = update.message.text
     search = message.split(' ',maxsplit=1)[1]
+    page = 1
+    # /list -p <page> <search term>
+    args = search.split(' ', maxsplit=2)
+    if len(args) == 3 and args[0] == '-p' and args[1].isdigit():
+        page = max(int(args[1]), 1)
+        search = args[2]
     LOGGER.info(f"Searching: {search}")
     gdrive = GoogleDriveHelper(None)
-    msg = gdrive.drive_list(search)
+    msg = gdrive.drive_list(search, page)
     if msg:
         reply_message = sendMessage(msg, context.bot, update)
     else:
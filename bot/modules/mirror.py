@@ -1,41 +1,169 @@
 import requests
+from telegram import Message, Update
 from telegram.ext import CommandHandler, run_async
 
-from bot import Interval, INDEX_URL, LOGGER, MEGA_KEY
-from bot import dispatcher, DOWNLOAD_DIR, DOWNLOAD_STATUS_UPDATE_INTERVAL, download_dict, download_dict_lock
-from bot.helper.ext_utils import fs_utils, bot_utils
+from bot import aria2, Interval, INDEX_URL, LOGGER, MEGA_KEY, STREAM_TAR, PIPELINED_UPLOAD, PERSISTENT_JOBS, BOT_MODE
+from bot import dispatcher, DOWNLOAD_DIR, DOWNLOAD_STATUS_UPDATE_INTERVAL, download_dict, download_dict_lock, \
+    EXTRACT_FOLDERS
+from bot.helper.ext_utils import fs_utils, bot_utils, extractor
 from bot.helper.ext_utils.bot_utils import setInterval
-from bot.helper.ext_utils.exceptions import DirectDownloadLinkException, NotSupportedExtractionArchive
+from bot.helper.ext_utils.exceptions import DirectDownloadLinkException, ExtractionError
+from bot.helper.ext_utils.job_queue import scheduler, JobStage
+from bot.helper.ext_utils.job_store import job_store, JobState
+from bot.helper.ext_utils.job_trace import JobTrace, trace_store
+from bot.helper.ext_utils.metrics import DOWNLOAD_BYTES, STAGE_DURATION
+from bot.helper.ext_utils.worker_queue import worker_queue
 from bot.helper.mirror_utils.download_utils.aria2_download import AriaDownloadHelper
 from bot.helper.mirror_utils.download_utils.direct_link_generator import direct_link_generator
 from bot.helper.mirror_utils.download_utils.telegram_downloader import TelegramDownloadHelper
+from bot.helper.mirror_utils.download_utils.youtube_dl_download_helper import YoutubeDLHelper
 from bot.helper.mirror_utils.status_utils import listeners
+from bot.helper.mirror_utils.status_utils.aria_download_status import AriaDownloadStatus
 from bot.helper.mirror_utils.status_utils.extract_status import ExtractStatus
+from bot.helper.mirror_utils.status_utils.queue_status import QueueStatus
 from bot.helper.mirror_utils.status_utils.tar_status import TarStatus
 from bot.helper.mirror_utils.status_utils.upload_status import UploadStatus
 from bot.helper.mirror_utils.upload_utils import gdriveTools
+from bot.helper.mirror_utils.upload_utils.drive_index import drive_index
+from bot.helper.mirror_utils.upload_utils.pipelined_upload import PipelinedUploader
 from bot.helper.telegram_helper.bot_commands import BotCommands
 from bot.helper.telegram_helper.filters import CustomFilters
 from bot.helper.telegram_helper.message_utils import *
 from bot.helper.mirror_utils.download_utils.mega_download import MegaDownloader
 import pathlib
 import os
-import subprocess
 import threading
+import time
+from urllib.parse import urlparse
 
 ariaDlManager = AriaDownloadHelper()
-ariaDlManager.start_listener()
+# The frontend doesn't download anything itself
+if BOT_MODE != 'frontend':
+    ariaDlManager.start_listener()
 
 
 class MirrorListener(listeners.MirrorListeners):
-    def __init__(self, bot, update, isTar=False, tag=None, extract=False):
+    def __init__(self, bot, update, isTar=False, tag=None, extract=False, trace=None):
         super().__init__(bot, update)
         self.isTar = isTar
         self.tag = tag
         self.extract = extract
+        self.user_id = self.message.from_user.id
+        self.pipeline = None
+        # Identifies the source of the mirror, its upload is recorded under it to detect repeated mirrors
+        self.fingerprint = None
+        # Drive folder of an upload which was interrupted by a restart
+        self.upload_dir_id = None
+        self.source = None
+        # Key: stage, Value: time it was entered, to measure how long the mirror spent in it
+        self.__stage_started = {}
+        self.trace = trace if trace is not None else JobTrace(self.uid)
+
+    def submit(self, source, name, start_download, link=None, quality=None):
+        """
+        Starts the mirror, or queues it for a worker in the frontend mode.
+        It is persisted if PERSISTENT_JOBS is enabled, so that it is picked up again after a restart.
+        :param source: 'aria2', 'mega', 'telegram' or 'youtube-dl'
+        :param start_download: callable which starts the download here
+        """
+        job = dict(message=self.message.to_dict(), is_tar=self.isTar, extract=self.extract, tag=self.tag,
+                   fingerprint=self.fingerprint, source=source, link=link, quality=quality,
+                   state=JobState.DOWNLOAD)
+        self.source = source
+        self.trace.name = name
+        if BOT_MODE == 'frontend':
+            # The worker continues the trace
+            self.trace.save()
+            worker_queue.push(self.uid, job)
+            return
+        if PERSISTENT_JOBS:
+            job_store.save(self.uid, **job)
+        self.queueDownload(name, start_download)
+
+    def __updateJob(self, **fields):
+        if PERSISTENT_JOBS:
+            job_store.update(self.uid, **fields)
+
+    def __deleteJob(self):
+        if PERSISTENT_JOBS:
+            job_store.delete(self.uid)
+        if BOT_MODE == 'worker':
+            worker_queue.finish(self.uid)
+
+    def __enqueue(self, stage, name, size):
+        """
+        Admits the job into stage, or queues it and shows its queue position meanwhile. Both happen under
+        download_dict_lock, so that a /cancel finds the QueueStatus as soon as the job is queued
+        :return: None if the job was admitted right away, else its QueueStatus
+        """
+        with download_dict_lock:
+            if scheduler.enqueue(stage, self.uid, self.user_id):
+                return None
+            status = download_dict[self.uid] = QueueStatus(name, size, stage, self)
+        update_all_messages()
+        return status
+
+    def queueDownload(self, name, start_download):
+        """
+        Starts the download right away if the download stage admits it, else queues it
+        :param start_download: callable which starts the download
+        """
+        queue_status = self.__enqueue(JobStage.DOWNLOAD, name, 0)
+        if queue_status is None:
+            self.__startStage('download')
+            start_download()
+            return
+        threading.Thread(target=self.__startWhenAdmitted, args=(start_download, queue_status)).start()
+
+    def __startWhenAdmitted(self, start_download, queue_status):
+        with self.trace.span('queued for download'):
+            admitted = scheduler.wait(self.uid)
+        # A /cancel right as the job was admitted still went to its QueueStatus
+        if admitted and not queue_status.cancelled:
+            self.__startStage('download')
+            start_download()
+        else:
+            self.onDownloadError('Cancelled by user!')
+
+    def __startStage(self, stage):
+        self.__stage_started[stage] = time.time()
+        self.trace.start(stage)
+
+    def __endStage(self, stage):
+        self.trace.end(stage)
+        started = self.__stage_started.pop(stage, None)
+        # Not known for stages which were started before a restart
+        if started is not None:
+            STAGE_DURATION.observe(time.time() - started, stage=stage)
+
+    def waitForSlot(self, stage, name, size):
+        """
+        Blocks until the job is admitted into stage, its status shows the queue position meanwhile
+        :return: False if the job was cancelled while queued
+        """
+        queue_status = self.__enqueue(stage, name, size)
+        if queue_status is None:
+            return True
+        with self.trace.span(f'queued for {stage}'):
+            admitted = scheduler.wait(self.uid)
+        return admitted and not queue_status.cancelled
 
     def onDownloadStarted(self):
-        pass
+        with download_dict_lock:
+            download = download_dict.get(self.uid)
+        if download is not None:
+            self.trace.add_gid(download.gid())
+        if isinstance(download, AriaDownloadStatus):
+            self.__updateJob(gid=download.gid())
+
+    def onDownloadMetadata(self, file_count):
+        """Called by aria2 once the files of a torrent are known, only aria2 reports single finished files"""
+        # The folder of an upload started before a restart is resumed by the final upload
+        if not PIPELINED_UPLOAD or self.isTar or self.extract or self.upload_dir_id is not None:
+            return
+        # A single file has nothing to be uploaded alongside
+        if file_count > 1 and self.pipeline is None:
+            self.pipeline = PipelinedUploader(self)
 
     def onDownloadProgress(self):
         # We are handling this on our own!
@@ -48,8 +176,12 @@ class MirrorListener(listeners.MirrorListeners):
             delete_all_messages()
         except IndexError:
             pass
+        # Lets the frontend know that the last mirror of a worker is done
+        if BOT_MODE == 'worker':
+            update_all_messages()
 
     def onDownloadComplete(self):
+        scheduler.release(JobStage.DOWNLOAD, self.uid)
         with download_dict_lock:
             LOGGER.info(f"Download completed: {download_dict[self.uid].name()}")
             download = download_dict[self.uid]
@@ -58,56 +190,141 @@ class MirrorListener(listeners.MirrorListeners):
             if name is None: # when pyrogram's media.file_name is of NoneType
                 name = os.listdir(f'{DOWNLOAD_DIR}{self.uid}')[0]
             m_path = f'{DOWNLOAD_DIR}{self.uid}/{name}'
-        if self.isTar:
+            if not isinstance(download, QueueStatus):
+                self.trace.add_gid(download.gid())
+        self.trace.name = name
+        manifest = None
+        # The listing is passed on to the extraction and the upload, an archive is listed by tar itself
+        if size == 0 or not self.isTar:
+            try:
+                manifest = fs_utils.scan_path(m_path)
+                size = manifest.size
+            except OSError as e:
+                LOGGER.error(f'Unable to scan {m_path}: {e}')
+        if 'download' in self.__stage_started:
+            self.__endStage('download')
+            DOWNLOAD_BYTES.inc(size, source=self.source or 'unknown')
+        self.__updateJob(state=JobState.DOWNLOADED, name=name, size=size)
+        tar_stream = self.isTar and STREAM_TAR
+        if tar_stream:
+            # The archive is generated on the fly while uploading
+            path = f'{m_path}.tar'
+        elif self.isTar:
             download.is_archiving = True
+            if not self.waitForSlot(JobStage.PROCESS, name, size):
+                self.onUploadError('Cancelled by user!')
+                return
             try:
+                tar_status = TarStatus(name, m_path, size, self)
                 with download_dict_lock:
-                    download_dict[self.uid] = TarStatus(name, m_path, size)
-                path = fs_utils.tar(m_path)
+                    download_dict[self.uid] = tar_status
+                self.__startStage('tar')
+                path = fs_utils.tar(m_path, tar_status.update_progress)
+                self.__endStage('tar')
             except FileNotFoundError:
                 LOGGER.info('File to archive not found!')
                 self.onUploadError('Internal error occurred!!')
                 return
+            finally:
+                scheduler.release(JobStage.PROCESS, self.uid)
         elif self.extract:
             download.is_extracting = True
-            try:
-                path = fs_utils.get_base_name(m_path)
+            # The archives in a downloaded folder are only extracted if EXTRACT_FOLDERS is set
+            if os.path.isdir(m_path) and not EXTRACT_FOLDERS or not extractor.can_extract(m_path):
+                LOGGER.info("Not any valid archive, uploading file as it is.")
+                path = m_path
+            else:
+                if not self.waitForSlot(JobStage.PROCESS, name, size):
+                    self.onUploadError('Cancelled by user!')
+                    return
                 LOGGER.info(
                     f"Extracting : {name} "
                 )
+                extract_status = ExtractStatus(name, m_path, size, self)
                 with download_dict_lock:
-                    download_dict[self.uid] = ExtractStatus(name, m_path, size)
-                archive_result = subprocess.run(["extract", m_path])
-                if archive_result.returncode == 0:
-                    threading.Thread(target=os.remove, args=(m_path,)).start()
-                    LOGGER.info(f"Deleting archive : {m_path}")
-                else:
-                    LOGGER.warning('Unable to extract archive! Uploading anyway')
-                    path = f'{DOWNLOAD_DIR}{self.uid}/{name}'
+                    download_dict[self.uid] = extract_status
+                self.__startStage('extract')
+                try:
+                    path = fs_utils.extract(m_path, extract_status.update_progress,
+                                            manifest.size if manifest is not None else None)
+                except ExtractionError as e:
+                    LOGGER.warning(f'Unable to extract archive! Uploading anyway: {e}')
+                    path = m_path
+                finally:
+                    self.__endStage('extract')
+                    scheduler.release(JobStage.PROCESS, self.uid)
                 LOGGER.info(
                     f'got path : {path}'
                 )
-
-            except NotSupportedExtractionArchive:
-                LOGGER.info("Not any valid archive, uploading file as it is.")
-                path = f'{DOWNLOAD_DIR}{self.uid}/{name}'
         else:
             path = f'{DOWNLOAD_DIR}{self.uid}/{name}'
+        self.__updateJob(state=JobState.UPLOAD, path=path)
+        self.startUpload(path, name, size, manifest)
+
+    def startUpload(self, path, name, size, manifest=None):
+        """
+        Uploads path, the download name after it has been archived or extracted
+        :param manifest: fs_utils.PathManifest of the download, if it has been scanned already
+        """
+        tar_stream = self.isTar and STREAM_TAR
         up_name = pathlib.PurePath(path).name
         LOGGER.info(f"Upload Name : {up_name}")
-        drive = gdriveTools.GoogleDriveHelper(up_name, self)
-        if size == 0:
-            size = fs_utils.get_path_size(m_path)
+        if manifest is not None and manifest.path != path:
+            manifest = None
+        if not tar_stream and manifest is None:
+            try:
+                # Sizes what is uploaded after an extraction, and saves the uploader listing the folder again
+                manifest = fs_utils.scan_path(path)
+                size = manifest.size
+            except OSError as e:
+                LOGGER.error(f'Unable to scan {path}: {e}')
+        if not self.isTar and not self.extract and os.path.isfile(path):
+            with self.trace.span('duplicate check'):
+                uploaded = self.__findUploadedCopy(path, size)
+            if uploaded is not None:
+                LOGGER.info(f"{up_name} has already been uploaded as {uploaded['id']}, not uploading it again")
+                self.onUploadComplete(_drive_link(uploaded))
+                return
+        if self.pipeline is not None:
+            # Continue with the helper which already uploaded the finished files
+            self.pipeline.finish()
+            drive = self.pipeline.drive
+            drive.name = up_name
+        else:
+            drive = gdriveTools.GoogleDriveHelper(up_name, self)
+        if not self.waitForSlot(JobStage.UPLOAD, up_name, size):
+            self.onUploadError('Cancelled by user!')
+            return
         upload_status = UploadStatus(drive, size, self)
         with download_dict_lock:
             download_dict[self.uid] = upload_status
         update_all_messages()
-        drive.upload(up_name)
+        self.__startStage('upload')
+        if tar_stream:
+            drive.upload(name, tar_stream=True)
+        else:
+            drive.upload(up_name, dir_id=self.upload_dir_id, manifest=manifest)
+
+    @staticmethod
+    def __findUploadedCopy(path, size):
+        """:return: a file in the drive with the same content as the local file path of size or None"""
+        if not drive_index.ready:
+            return None
+        # Hashing a big file takes a while, it is only worth it if the drive has a file of that name and size
+        if size == 0 or not drive_index.has_size(size, os.path.basename(path)):
+            return None
+        files = drive_index.find_by_md5(fs_utils.get_md5(path), size)
+        return files[0] if files else None
 
     def onDownloadError(self, error):
         error = error.replace('<', ' ')
         error = error.replace('>', ' ')
         LOGGER.info(self.update.effective_chat.id)
+        scheduler.release_all(self.uid)
+        self.__deleteJob()
+        self.trace.finish(error)
+        if self.pipeline is not None:
+            self.pipeline.cancel()
         with download_dict_lock:
             try:
                 download = download_dict[self.uid]
@@ -133,10 +350,24 @@ class MirrorListener(listeners.MirrorListeners):
     def onUploadStarted(self):
         pass
 
+    def onUploadFolderCreated(self, dir_id):
+        self.__updateJob(dir_id=dir_id)
+
     def onUploadProgress(self):
         pass
 
     def onUploadComplete(self, link: str):
+        self.__endStage('upload')
+        scheduler.release_all(self.uid)
+        self.__deleteJob()
+        self.trace.finish()
+        if self.fingerprint is not None:
+            file_id = gdriveTools.GoogleDriveHelper.getIdFromUrl(link)
+            if BOT_MODE == 'worker':
+                # Repeated mirrors are detected by the frontend
+                worker_queue.add_result(self.fingerprint, file_id)
+            else:
+                drive_index.add_fingerprint(self.fingerprint, file_id)
         with download_dict_lock:
             msg = f'<a href="{link}">{download_dict[self.uid].name()}</a> ({download_dict[self.uid].size()})'
             LOGGER.info(f'Done Uploading {download_dict[self.uid].name()}')
@@ -161,6 +392,9 @@ class MirrorListener(listeners.MirrorListeners):
 
     def onUploadError(self, error):
         e_str = error.replace('<', '').replace('>', '')
+        scheduler.release_all(self.uid)
+        self.__deleteJob()
+        self.trace.finish(e_str)
         with download_dict_lock:
             try:
                 fs_utils.clean_download(download_dict[self.uid].path())
@@ -175,7 +409,49 @@ class MirrorListener(listeners.MirrorListeners):
             update_all_messages()
 
 
+def _drive_link(file):
+    if file.get('mimeType') == 'application/vnd.google-apps.folder':
+        return f"https://drive.google.com/folderview?id={file.get('id')}"
+    return f"https://drive.google.com/uc?id={file.get('id')}&export=download"
+
+
+def _find_mirrored(fingerprint, bot, update):
+    """
+    Replies with the link of the earlier mirror of fingerprint, if there is one
+    :return: True if it has been mirrored before
+    """
+    if fingerprint is None:
+        return False
+    file = drive_index.find_fingerprint(fingerprint)
+    if file is None:
+        return False
+    LOGGER.info(f"{fingerprint} has already been mirrored as {file['id']}")
+    msg = f'Already mirrored: <a href="{_drive_link(file)}">{file["name"]}</a>'
+    if file.get('size') is not None:
+        msg += f' ({bot_utils.get_readable_file_size(file["size"])})'
+    if INDEX_URL is not None:
+        share_url = requests.utils.requote_uri(f'{INDEX_URL}/{drive_index.path(file["id"])}')
+        if file.get('mimeType') == 'application/vnd.google-apps.folder':
+            share_url += '/'
+        msg += f'\n\n Shareable link: <a href="{share_url}">here</a>'
+    sendMessage(msg, bot, update)
+    return True
+
+
+def _get_torrent_fingerprint(link, trace):
+    """:return: fingerprint of the .torrent file at link, see bot_utils.get_torrent_fingerprint, or None"""
+    try:
+        with trace.span('torrent download'):
+            response = requests.get(link, timeout=10)
+            response.raise_for_status()
+    except requests.RequestException as e:
+        LOGGER.warning(f'Unable to get the torrent to identify it: {e}')
+        return None
+    return bot_utils.get_torrent_fingerprint(response.content)
+
+
 def _mirror(bot, update, isTar=False, extract=False):
+    trace = JobTrace(update.message.message_id)
     message_args = update.message.text.split(' ')
     try:
         link = message_args[1]
@@ -183,6 +459,9 @@ def _mirror(bot, update, isTar=False, extract=False):
         link = ''
     LOGGER.info(link)
     link = link.strip()
+    # The same source gives a different upload when it is archived or extracted
+    mode = 'tar' if isTar else 'extract' if extract else 'mirror'
+    fingerprint = None
     reply_to = update.message.reply_to_message
     if reply_to is not None:
         file = None
@@ -195,37 +474,164 @@ def _mirror(bot, update, isTar=False, extract=False):
 
         if len(link) == 0:
             if file is not None:
+                if file.mime_type == "application/x-bittorrent":
+                    with trace.span('get_file'):
+                        link = file.get_file().file_path
+                    # The same torrent as a magnet or a .torrent link has the same info hash
+                    fingerprint = _get_torrent_fingerprint(link, trace) or bot_utils.get_fingerprint(file=file)
+                else:
+                    fingerprint = bot_utils.get_fingerprint(file=file)
+                fingerprint = f'{mode}:{fingerprint}'
+                with trace.span('mirrored before lookup'):
+                    mirrored = _find_mirrored(fingerprint, bot, update)
+                if mirrored:
+                    return
                 if file.mime_type != "application/x-bittorrent":
-                    listener = MirrorListener(bot, update, isTar, tag, extract)
-                    tg_downloader = TelegramDownloadHelper(listener)
-                    tg_downloader.add_download(reply_to, f'{DOWNLOAD_DIR}{listener.uid}/')
+                    listener = MirrorListener(bot, update, isTar, tag, extract, trace)
+                    listener.fingerprint = fingerprint
+                    listener.submit('telegram', getattr(file, 'file_name', None) or 'Telegram file',
+                                    lambda: TelegramDownloadHelper(listener).add_download(
+                                        reply_to, f'{DOWNLOAD_DIR}{listener.uid}/'))
                     sendStatusMessage(update, bot)
                     if len(Interval) == 0:
                         Interval.append(setInterval(DOWNLOAD_STATUS_UPDATE_INTERVAL, update_all_messages))
                     return
-                else:
-                    link = file.get_file().file_path
     else:
         tag = None
     if not bot_utils.is_url(link) and not bot_utils.is_magnet(link):
         sendMessage('No download source provided', bot, update)
         return
+    if fingerprint is None:
+        source = None
+        if urlparse(link).path.lower().endswith('.torrent'):
+            source = _get_torrent_fingerprint(link, trace)
+        fingerprint = f'{mode}:{source or bot_utils.get_fingerprint(link)}'
+        with trace.span('mirrored before lookup'):
+            mirrored = _find_mirrored(fingerprint, bot, update)
+        if mirrored:
+            return
 
     try:
-        link = direct_link_generator(link)
+        with trace.span('direct_link_generator'):
+            link = direct_link_generator(link)
     except DirectDownloadLinkException as e:
         LOGGER.info(f'{link}: {e}')
-    listener = MirrorListener(bot, update, isTar, tag, extract)
+    listener = MirrorListener(bot, update, isTar, tag, extract, trace)
+    listener.fingerprint = fingerprint
     if bot_utils.is_mega_link(link) and MEGA_KEY is not None:
-        mega_dl = MegaDownloader(listener)
-        mega_dl.add_download(link, f'{DOWNLOAD_DIR}{listener.uid}/')
+        listener.submit('mega', link, lambda: MegaDownloader(listener).add_download(
+            link, f'{DOWNLOAD_DIR}{listener.uid}/'), link)
     else:
-        ariaDlManager.add_download(link, f'{DOWNLOAD_DIR}{listener.uid}/', listener)
+        listener.submit('aria2', link, lambda: ariaDlManager.add_download(
+            link, f'{DOWNLOAD_DIR}{listener.uid}/', listener), link)
     sendStatusMessage(update, bot)
     if len(Interval) == 0:
         Interval.append(setInterval(DOWNLOAD_STATUS_UPDATE_INTERVAL, update_all_messages))
 
 
+def _find_aria_download(gid, path):
+    """:return: the aria2 download of gid, or of the torrent its magnet was followed by, or None"""
+    try:
+        download = aria2.get_download(gid)
+        while download.followed_by_ids:
+            download = aria2.get_download(download.followed_by_ids[0])
+    except Exception:
+        # aria2 has been restarted as well
+        return None
+    if download.is_removed or download.has_failed or os.path.normpath(download.dir) != os.path.normpath(path):
+        return None
+    return download
+
+
+def start_job(uid, job):
+    """
+    Starts the job uid, or picks it up again in the state it was left in
+    :return: its listener
+    """
+    bot = dispatcher.bot
+    message = Message.de_json(job['message'], bot)
+    # Continues the trace of the frontend, or of the process before a restart
+    listener = MirrorListener(bot, Update(0, message=message), job['is_tar'], job['tag'], job['extract'],
+                              trace_store.load(uid))
+    listener.fingerprint = job['fingerprint']
+    listener.upload_dir_id = job.get('dir_id')
+    listener.source = job['source']
+    path = f'{DOWNLOAD_DIR}{uid}/'
+    state = job['state']
+    source = job['source']
+    link = job['link']
+    if state == JobState.UPLOAD:
+        LOGGER.info(f"Resuming upload of {job['path']}")
+        with download_dict_lock:
+            download_dict[uid] = QueueStatus(job['name'], job['size'], JobStage.UPLOAD, listener)
+        threading.Thread(target=listener.startUpload, args=(job['path'], job['name'], job['size'])).start()
+    elif state == JobState.DOWNLOADED:
+        LOGGER.info(f"Processing {job['name']} again")
+        # Stands in for the finished download, onDownloadComplete reads its name and size
+        with download_dict_lock:
+            download_dict[uid] = QueueStatus(job['name'], job['size'], JobStage.PROCESS, listener)
+        threading.Thread(target=listener.onDownloadComplete).start()
+    elif source == 'aria2':
+        download = _find_aria_download(job.get('gid'), path) if job.get('gid') else None
+        if download is not None:
+            LOGGER.info(f"Re-attaching to aria2 download {download.gid}")
+            scheduler.restore(JobStage.DOWNLOAD, uid, listener.user_id)
+            with download_dict_lock:
+                download_dict[uid] = AriaDownloadStatus(download.gid, listener)
+                if download.is_torrent:
+                    download_dict[uid].is_torrent = True
+            if download.is_complete:
+                # Its completion was missed while the bot was down
+                threading.Thread(target=listener.onDownloadComplete).start()
+            elif download.is_torrent:
+                listener.onDownloadMetadata(len(download.files))
+        else:
+            if job.get('gid') is not None:
+                # aria2 continues from the control files of the partial download
+                LOGGER.info(f"Adding {link} to aria2 again")
+            listener.queueDownload(link, lambda: ariaDlManager.add_download(link, path, listener))
+    elif source == 'mega':
+        listener.queueDownload(link, lambda: MegaDownloader(listener).add_download(link, path))
+    elif source == 'youtube-dl':
+        ydl = YoutubeDLHelper(listener)
+        listener.queueDownload(link, threading.Thread(target=ydl.add_download,
+                                                      args=(link, f'{DOWNLOAD_DIR}{uid}', job['quality'])).start)
+    else:
+        reply_to = message.reply_to_message
+        listener.queueDownload('Telegram file', lambda: TelegramDownloadHelper(listener).add_download(
+            reply_to, path))
+    return listener
+
+
+def recover_jobs():
+    """
+    Picks up the mirrors which were running when the bot stopped, if PERSISTENT_JOBS is enabled,
+    and sends their status messages again
+    """
+    if not PERSISTENT_JOBS:
+        return
+    jobs = job_store.all()
+    if not jobs:
+        return
+    LOGGER.info(f'Recovering {len(jobs)} mirrors')
+    # Key: chat id, Value: update of a mirror in that chat
+    chats = {}
+    for uid, job in jobs.items():
+        try:
+            listener = start_job(uid, job)
+        except Exception as e:
+            LOGGER.error(f'Unable to recover mirror {uid}: {e}')
+            job_store.delete(uid)
+            if BOT_MODE == 'worker':
+                worker_queue.finish(uid)
+            continue
+        chats[listener.message.chat.id] = listener.update
+    for update in chats.values():
+        sendStatusMessage(update, dispatcher.bot)
+    if chats and len(Interval) == 0:
+        Interval.append(setInterval(DOWNLOAD_STATUS_UPDATE_INTERVAL, update_all_messages))
+
+
 @run_async
 def mirror(update, context):
     _mirror(context.bot, update)
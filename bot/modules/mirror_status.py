@@ -10,7 +10,7 @@ import threading
 
 @run_async
 def mirror_status(update,context):
-    message = get_readable_message()
+    message = get_readable_message(update.effective_chat.id)
     if len(message) == 0:
         message = "No active downloads"
         reply_message = sendMessage(message, context.bot, update)
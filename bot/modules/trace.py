@@ -0,0 +1,58 @@
+import html
+import io
+import json
+
+from telegram.ext import CommandHandler, run_async
+
+from bot import dispatcher
+from bot.helper.ext_utils.job_trace import trace_store
+from bot.helper.telegram_helper.bot_commands import BotCommands
+from bot.helper.telegram_helper.filters import CustomFilters
+from bot.helper.telegram_helper.message_utils import sendMessage
+
+
+def _format_trace(trace):
+    name = html.escape(trace['name'] or str(trace['uid']))
+    if trace['finished'] is not None:
+        result = 'completed' if trace['result'] == 'completed' else f"failed: {html.escape(trace['result'])}"
+        msg = f"<b>{name}</b>\n{result} after {trace['finished'] - trace['started']:.2f}s\n\n"
+    else:
+        msg = f"<b>{name}</b>\nrunning\n\n"
+    lines = [f"+{span['start']:>8.2f}s  {span['duration']:>8.2f}s  {span['name']}" for span in trace['spans']]
+    lines += [f"+{span['start']:>8.2f}s  {'...':>9}  {span['name']}" for span in trace['running']]
+    msg += f"<code>{html.escape(chr(10).join(lines))}</code>"
+    if trace['totals']:
+        msg += '\n\nPer file:'
+        for op, total in sorted(trace['totals'].items()):
+            msg += f"\n{html.escape(op)}: {total['count']} times, {total['seconds']:.2f}s"
+    return msg
+
+
+@run_async
+def job_trace(update, context):
+    args = update.message.text.split(' ')[1:]
+    export = 'json' in args
+    args = [arg for arg in args if arg != 'json']
+    if args:
+        gid = args[0]
+    elif update.message.reply_to_message:
+        gid = str(update.message.reply_to_message.message_id)
+    else:
+        sendMessage(f"Send /{BotCommands.TraceCommand} gid, or reply with it to the message which started the "
+                    f"mirror. Add json to get the trace as a file.", context.bot, update)
+        return
+    trace = trace_store.find(gid)
+    if trace is None:
+        sendMessage(f"No trace of GID: <code>{html.escape(gid)}</code>", context.bot, update)
+        return
+    if export:
+        document = io.BytesIO(json.dumps(trace, indent=2).encode('utf-8'))
+        context.bot.send_document(document=document, filename=f"trace-{trace['uid']}.json",
+                                  reply_to_message_id=update.message.message_id, chat_id=update.message.chat_id)
+        return
+    sendMessage(_format_trace(trace), context.bot, update)
+
+
+trace_handler = CommandHandler(BotCommands.TraceCommand, job_trace,
+                               filters=CustomFilters.authorized_chat | CustomFilters.authorized_user)
+dispatcher.add_handler(trace_handler)
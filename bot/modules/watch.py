@@ -32,7 +32,9 @@ def _watch(bot: Bot, update: Update, args: list, isTar=False):
 
     listener = MirrorListener(bot, update, isTar, tag)
     ydl = YoutubeDLHelper(listener)
-    threading.Thread(target=ydl.add_download,args=(link, f'{DOWNLOAD_DIR}{listener.uid}', qual)).start()
+    listener.submit('youtube-dl', link, threading.Thread(target=ydl.add_download,
+                                                         args=(link, f'{DOWNLOAD_DIR}{listener.uid}', qual)).start,
+                    link, qual)
     sendStatusMessage(update, bot)
     if len(Interval) == 0:
         Interval.append(setInterval(DOWNLOAD_STATUS_UPDATE_INTERVAL, update_all_messages))
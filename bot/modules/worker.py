@@ -0,0 +1,77 @@
+import threading
+from time import sleep
+
+from bot import Interval, DOWNLOAD_DIR, DOWNLOAD_STATUS_UPDATE_INTERVAL, LOGGER, WORKER_ID, WORKER_JOBS, \
+    PERSISTENT_JOBS, download_dict, download_dict_lock
+from bot.helper.ext_utils.bot_utils import setInterval, MirrorStatus
+from bot.helper.ext_utils.fs_utils import clean_download
+from bot.helper.ext_utils.job_store import job_store
+from bot.helper.ext_utils.worker_queue import worker_queue
+from bot.helper.mirror_utils.upload_utils.drive_index import drive_index
+from bot.helper.telegram_helper.message_utils import update_all_messages
+from .mirror import start_job
+
+# Seconds a worker waits for a queued mirror before checking its capacity again
+POLL_TIMEOUT = 5
+
+
+def _handle_cancels():
+    while True:
+        uid = worker_queue.next_cancel(POLL_TIMEOUT)
+        if uid is None:
+            continue
+        with download_dict_lock:
+            dl = download_dict.get(uid)
+        # The frontend only asks for mirrors which aren't uploading or being archived
+        if dl is None or dl.status() in (MirrorStatus.STATUS_UPLOADING, MirrorStatus.STATUS_ARCHIVING):
+            continue
+        LOGGER.info(f'Cancelling {uid} for the frontend')
+        dl.download().cancel_download()
+        sleep(1)  # Wait a Second For Aria2 To free Resources.
+        clean_download(f'{DOWNLOAD_DIR}{uid}/')
+
+
+def run_worker():
+    """
+    Runs the mirrors the frontend queues, up to WORKER_JOBS at a time. Their progress is reported
+    to the frontend, the final messages are sent from here.
+    """
+    threading.Thread(target=_handle_cancels, daemon=True).start()
+    # The mirrors which were picked up again from the job store keep running here
+    worker_queue.requeue_processing(job_store.all() if PERSISTENT_JOBS else ())
+    LOGGER.info(f'Worker {WORKER_ID} is waiting for mirrors')
+    while True:
+        with download_dict_lock:
+            running = len(download_dict)
+        if running >= WORKER_JOBS:
+            sleep(1)
+            continue
+        item = worker_queue.pop(POLL_TIMEOUT)
+        if item is None:
+            continue
+        uid, job = item
+        LOGGER.info(f"Starting {job['link'] or 'Telegram file'} ({uid})")
+        if PERSISTENT_JOBS:
+            job_store.save(uid, **job)
+        try:
+            start_job(uid, job)
+        except Exception as e:
+            LOGGER.error(f'Unable to start mirror {uid}: {e}')
+            job_store.delete(uid)
+            worker_queue.finish(uid)
+            continue
+        if len(Interval) == 0:
+            Interval.append(setInterval(DOWNLOAD_STATUS_UPDATE_INTERVAL, update_all_messages))
+        update_all_messages()
+
+
+def _collect_results():
+    while True:
+        result = worker_queue.next_result(POLL_TIMEOUT)
+        if result is not None:
+            drive_index.add_fingerprint(*result)
+
+
+def start_frontend():
+    """Records the mirrors the workers finished, so that repeating them is answered with their link"""
+    threading.Thread(target=_collect_results, daemon=True).start()
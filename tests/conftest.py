@@ -0,0 +1,56 @@
+"""
+The modules under test import the bot package, which reads its config from the environment at import time.
+It is configured here like the benchmarks do, without redis or any other service, and imported from a
+scratch directory, so that its log.txt and session files don't end up in the repository.
+"""
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = tempfile.mkdtemp(prefix='mirror-bot-tests-')
+atexit.register(shutil.rmtree, WORK_DIR, ignore_errors=True)
+
+_CONFIG = {
+    'BOT_TOKEN': '123456:tests',
+    'GDRIVE_FOLDER_ID': 'root',
+    'OWNER_ID': '100',
+    'DOWNLOAD_DIR': os.path.join(WORK_DIR, 'downloads/'),
+    'DOWNLOAD_STATUS_UPDATE_INTERVAL': '5',
+    'AUTO_DELETE_MESSAGE_DURATION': '-1',
+    'USER_SESSION_STRING': 'tests',
+    'TELEGRAM_API': '0',
+    'TELEGRAM_HASH': 'tests',
+    'IS_TEAM_DRIVE': 'True',
+}
+for name, value in _CONFIG.items():
+    os.environ.setdefault(name, value)
+os.environ['BOT_MODE'] = 'standalone'
+os.environ['PERSISTENT_JOBS'] = 'False'
+os.environ['USE_SERVICE_ACCOUNTS'] = 'False'
+os.environ['DRIVE_INDEX_DB'] = os.path.join(WORK_DIR, 'drive_index.db')
+
+sys.path.insert(0, REPO_DIR)
+os.chdir(WORK_DIR)
+
+
+class FakeClock:
+    """Stands in for the time module of a module under test, time only moves when advance is called"""
+
+    def __init__(self, now=1000000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
@@ -0,0 +1,87 @@
+import pytest
+
+from bot.helper.mirror_utils.status_utils import aria_download_status
+from bot.helper.mirror_utils.status_utils.aria_download_status import get_download, ARIA_STATE_CACHE_TTL
+
+
+class FakeClient:
+    TELL_ACTIVE = 'aria2.tellActive'
+    TELL_WAITING = 'aria2.tellWaiting'
+    TELL_STOPPED = 'aria2.tellStopped'
+
+    def __init__(self):
+        # Key: method, Value: download structs it returns, or an exception
+        self.results = {self.TELL_ACTIVE: [], self.TELL_WAITING: [], self.TELL_STOPPED: []}
+        self.multicalls = 0
+
+    def multicall2(self, calls):
+        self.multicalls += 1
+        results = []
+        for method, params in calls:
+            result = self.results[method]
+            # Like aria2, a failed call comes back as a fault struct in its place
+            results.append({'code': 1, 'message': 'failed'} if result is None else [result])
+        return results
+
+
+class FakeApi:
+    def __init__(self):
+        self.client = FakeClient()
+        self.fetched = []
+
+    def get_download(self, gid):
+        self.fetched.append(gid)
+        return f'download {gid}'
+
+
+@pytest.fixture
+def aria2(monkeypatch, clock):
+    api = FakeApi()
+    monkeypatch.setattr(aria_download_status, 'aria2', api)
+    monkeypatch.setattr(aria_download_status, 'time', clock)
+    monkeypatch.setattr(aria_download_status, '_aria_downloads', {})
+    monkeypatch.setattr(aria_download_status, '_aria_state_time', 0)
+    return api
+
+
+def test_downloads_of_all_lists_are_fetched_in_one_call(aria2):
+    aria2.client.results[FakeClient.TELL_ACTIVE] = [{'gid': 'a'}]
+    aria2.client.results[FakeClient.TELL_WAITING] = [{'gid': 'b'}]
+    aria2.client.results[FakeClient.TELL_STOPPED] = [{'gid': 'c'}]
+    assert [get_download(gid).gid for gid in 'abc'] == ['a', 'b', 'c']
+    assert aria2.client.multicalls == 1
+    assert aria2.fetched == []
+
+
+def test_state_is_served_from_the_cache_until_it_expires(aria2, clock):
+    aria2.client.results[FakeClient.TELL_ACTIVE] = [{'gid': 'a', 'status': 'active'}]
+    get_download('a')
+    aria2.client.results[FakeClient.TELL_ACTIVE] = [{'gid': 'a', 'status': 'complete'}]
+    clock.advance(ARIA_STATE_CACHE_TTL)
+    assert get_download('a').status == 'active'
+    clock.advance(0.01)
+    assert get_download('a').status == 'complete'
+    assert aria2.client.multicalls == 2
+
+
+def test_download_added_after_the_refresh_is_fetched_on_its_own(aria2):
+    aria2.client.results[FakeClient.TELL_ACTIVE] = [{'gid': 'a'}]
+    get_download('a')
+    assert get_download('new') == 'download new'
+    assert aria2.fetched == ['new']
+    assert aria2.client.multicalls == 1
+
+
+def test_failed_call_leaves_out_only_its_list(aria2):
+    aria2.client.results[FakeClient.TELL_ACTIVE] = [{'gid': 'a'}]
+    aria2.client.results[FakeClient.TELL_WAITING] = None
+    assert get_download('a').gid == 'a'
+
+
+def test_failed_refresh_falls_back_to_single_fetches(aria2):
+    def fail(calls):
+        raise ConnectionError('aria2 is down')
+
+    aria2.client.multicall2 = fail
+    assert get_download('a') == 'download a'
+    assert aria2.fetched == ['a']
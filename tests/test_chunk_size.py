@@ -0,0 +1,62 @@
+from bot.helper.mirror_utils.upload_utils.chunk_size import AdaptiveChunkSize
+
+ALIGNMENT = AdaptiveChunkSize.ALIGNMENT
+MB = 1024 ** 2
+
+
+def test_initial_size_is_aligned_and_clamped():
+    assert AdaptiveChunkSize(1 * MB, 64 * MB, 10 * MB + 1).size == 10 * MB
+    assert AdaptiveChunkSize(1 * MB, 64 * MB, 1000 * MB).size == 64 * MB
+    assert AdaptiveChunkSize(1 * MB, 64 * MB, 1).size == 1 * MB
+
+
+def test_minimum_is_at_least_one_alignment():
+    chunk_size = AdaptiveChunkSize(1, 64 * MB, 1)
+    assert chunk_size.size == ALIGNMENT
+    chunk_size.failed()
+    assert chunk_size.size == ALIGNMENT
+
+
+def test_maximum_below_the_minimum_is_raised_to_it():
+    assert AdaptiveChunkSize(8 * MB, 1 * MB, 32 * MB).size == 8 * MB
+
+
+def test_size_follows_the_throughput():
+    chunk_size = AdaptiveChunkSize(1 * MB, 1024 * MB, 16 * MB)
+    # 1MB/s sends 20MB in the target time
+    chunk_size.record(16 * MB, 16)
+    assert chunk_size.size == 20 * MB
+
+
+def test_size_is_at_most_doubled_per_chunk():
+    chunk_size = AdaptiveChunkSize(1 * MB, 1024 * MB, 8 * MB)
+    chunk_size.record(8 * MB, 0.01)
+    assert chunk_size.size == 16 * MB
+
+
+def test_size_is_aligned_after_a_record():
+    chunk_size = AdaptiveChunkSize(1 * MB, 1024 * MB, 8 * MB)
+    chunk_size.record(1000003, 7)
+    assert chunk_size.size % ALIGNMENT == 0
+    assert chunk_size.size <= 1000003 / 7 * AdaptiveChunkSize.TARGET_CHUNK_TIME
+
+
+def test_size_is_clamped_to_the_limits():
+    chunk_size = AdaptiveChunkSize(4 * MB, 32 * MB, 32 * MB)
+    chunk_size.record(32 * MB, 0.1)
+    assert chunk_size.size == 32 * MB
+    chunk_size.record(1 * MB, 100)
+    assert chunk_size.size == 4 * MB
+
+
+def test_failure_halves_the_size():
+    chunk_size = AdaptiveChunkSize(1 * MB, 64 * MB, 16 * MB)
+    chunk_size.failed()
+    assert chunk_size.size == 8 * MB
+
+
+def test_empty_or_instant_chunks_are_ignored():
+    chunk_size = AdaptiveChunkSize(1 * MB, 64 * MB, 16 * MB)
+    chunk_size.record(0, 1)
+    chunk_size.record(16 * MB, 0)
+    assert chunk_size.size == 16 * MB
@@ -0,0 +1,59 @@
+from bot.helper.telegram_helper import message_utils
+from bot.helper.telegram_helper.message_utils import _EditBudget
+
+
+def _budget(monkeypatch, clock, edits_per_minute):
+    monkeypatch.setattr(message_utils, 'time', clock)
+    return _EditBudget(edits_per_minute)
+
+
+def _burst(budget):
+    count = 0
+    while budget.consume():
+        count += 1
+    return count
+
+
+def test_burst_is_limited_to_ten_seconds_of_edits(monkeypatch, clock):
+    budget = _budget(monkeypatch, clock, 60)
+    assert _burst(budget) == 10
+
+
+def test_slow_rate_still_allows_one_edit(monkeypatch, clock):
+    budget = _budget(monkeypatch, clock, 1)
+    assert _burst(budget) == 1
+    clock.advance(30)
+    assert not budget.consume()
+    clock.advance(30)
+    assert budget.consume()
+
+
+def test_refill_follows_the_rate(monkeypatch, clock):
+    budget = _budget(monkeypatch, clock, 60)
+    _burst(budget)
+    clock.advance(3)
+    assert _burst(budget) == 3
+
+
+def test_refill_is_capped_at_the_capacity(monkeypatch, clock):
+    budget = _budget(monkeypatch, clock, 60)
+    _burst(budget)
+    clock.advance(3600)
+    assert _burst(budget) == 10
+
+
+def test_pause_blocks_edits_until_the_flood_wait_is_over(monkeypatch, clock):
+    budget = _budget(monkeypatch, clock, 60)
+    budget.pause(5)
+    clock.advance(4.9)
+    assert not budget.consume()
+    clock.advance(0.1)
+    assert budget.consume()
+
+
+def test_shorter_pause_does_not_shorten_a_longer_one(monkeypatch, clock):
+    budget = _budget(monkeypatch, clock, 60)
+    budget.pause(10)
+    budget.pause(1)
+    clock.advance(5)
+    assert not budget.consume()
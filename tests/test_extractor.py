@@ -0,0 +1,172 @@
+import gzip
+import io
+import os
+import stat
+import tarfile
+import zipfile
+
+import pytest
+
+from bot.helper.ext_utils import extractor
+from bot.helper.ext_utils.exceptions import ExtractionError, NotSupportedExtractionArchive
+
+
+def _add(archive, name, data=b'', **fields):
+    member = tarfile.TarInfo(name)
+    member.size = len(data)
+    for field, value in fields.items():
+        setattr(member, field, value)
+    archive.addfile(member, io.BytesIO(data))
+
+
+def _tar(path, members, mode='w'):
+    """:param members: (name, data, TarInfo fields) of every member"""
+    with tarfile.open(path, mode) as archive:
+        for name, data, fields in members:
+            _add(archive, name, data, **fields)
+    return str(path)
+
+
+def _file(name, data=b'data'):
+    return name, data, {}
+
+
+def _dir(name, mode=0o755):
+    return name, b'', {'type': tarfile.DIRTYPE, 'mode': mode}
+
+
+def _symlink(name, target):
+    return name, b'', {'type': tarfile.SYMTYPE, 'linkname': target}
+
+
+def _hardlink(name, target):
+    return name, b'', {'type': tarfile.LNKTYPE, 'linkname': target}
+
+
+def test_tar_is_extracted_next_to_it_and_deleted(tmp_path):
+    path = _tar(tmp_path / 'files.tar', [_dir('folder'), _file('folder/a.txt', b'a'), _file('b.txt', b'bb')])
+    size = os.path.getsize(path)
+    progress = []
+    output = extractor.extract(path, progress.append)
+    assert output == str(tmp_path / 'files')
+    assert (tmp_path / 'files' / 'folder' / 'a.txt').read_bytes() == b'a'
+    assert (tmp_path / 'files' / 'b.txt').read_bytes() == b'bb'
+    assert not os.path.exists(path)
+    assert progress == sorted(progress)
+    assert 0 < progress[-1] <= size
+
+
+@pytest.mark.parametrize('name', ['../outside.txt', '{tmp_path}/outside.txt', 'folder/../../outside.txt'])
+def test_members_outside_the_destination_are_skipped(tmp_path, name):
+    path = _tar(tmp_path / 'files.tar', [_file(name.format(tmp_path=tmp_path)), _file('inside.txt')])
+    extractor.extract(path)
+    assert (tmp_path / 'files' / 'inside.txt').exists()
+    assert not (tmp_path / 'outside.txt').exists()
+
+
+@pytest.mark.parametrize('target', ['../../outside', '/etc/passwd', 'sub/../../../outside'])
+def test_symlinks_out_of_the_destination_are_skipped(tmp_path, target):
+    path = _tar(tmp_path / 'files.tar', [_dir('folder'), _symlink('folder/link', target), _symlink('ok', 'b.txt'),
+                                          _file('b.txt')])
+    extractor.extract(path)
+    assert not os.path.lexists(tmp_path / 'files' / 'folder' / 'link')
+    assert os.path.islink(tmp_path / 'files' / 'ok')
+
+
+def test_hardlinks_out_of_the_destination_are_skipped(tmp_path):
+    (tmp_path / 'secret').write_bytes(b'secret')
+    path = _tar(tmp_path / 'files.tar', [_hardlink('link', '../secret'), _file('a.txt'), _hardlink('copy', 'a.txt')])
+    extractor.extract(path)
+    assert not os.path.lexists(tmp_path / 'files' / 'link')
+    assert (tmp_path / 'files' / 'copy').read_bytes() == b'data'
+
+
+def test_nothing_is_written_through_an_extracted_symlink(tmp_path):
+    outside = tmp_path / 'outside'
+    outside.mkdir()
+    path = _tar(tmp_path / 'files.tar', [_symlink('escape', '../outside'), _file('escape/evil.txt')])
+    extractor.extract(path)
+    assert not (outside / 'evil.txt').exists()
+
+
+def test_read_only_folders_get_their_mode_after_their_files(tmp_path):
+    path = _tar(tmp_path / 'files.tar', [_dir('folder', 0o555), _dir('folder/sub', 0o6777), _file('folder/sub/a.txt')])
+    extractor.extract(path)
+    folder = tmp_path / 'files' / 'folder'
+    assert (folder / 'sub' / 'a.txt').exists()
+    assert stat.S_IMODE(folder.stat().st_mode) == 0o555
+    # No set-id bits and not writable by others
+    assert stat.S_IMODE((folder / 'sub').stat().st_mode) == 0o755
+    os.chmod(folder, 0o755)
+
+
+@pytest.mark.parametrize('use_module', [False, True])
+def test_compressed_tar(tmp_path, monkeypatch, use_module):
+    if use_module:
+        monkeypatch.setattr(extractor, '_decompressor', lambda compression: None)
+    path = _tar(tmp_path / 'files.tar.gz', [_file('a.txt', b'a' * 100000)], 'w:gz')
+    extractor.extract(path)
+    assert (tmp_path / 'files' / 'a.txt').read_bytes() == b'a' * 100000
+
+
+def test_compressed_file(tmp_path):
+    path = tmp_path / 'notes.txt.gz'
+    path.write_bytes(gzip.compress(b'notes'))
+    assert extractor.extract(str(path)) == str(tmp_path / 'notes.txt')
+    assert (tmp_path / 'notes.txt').read_bytes() == b'notes'
+
+
+def test_broken_archive_is_an_extraction_error(tmp_path):
+    path = tmp_path / 'broken.tar.gz'
+    path.write_bytes(b'not gzip at all' * 100)
+    with pytest.raises(ExtractionError):
+        extractor.extract(str(path))
+
+
+def test_unsupported_file_is_rejected(tmp_path):
+    path = tmp_path / 'file.txt'
+    path.write_bytes(b'')
+    assert not extractor.can_extract(str(path))
+    with pytest.raises(NotSupportedExtractionArchive):
+        extractor.extract(str(path))
+
+
+def test_archive_of_archives_is_extracted_again(tmp_path):
+    inner = _tar(tmp_path / 'inner.tar', [_file('a.txt', b'a')])
+    with zipfile.ZipFile(tmp_path / 'outer.zip', 'w') as archive:
+        archive.write(inner, 'inner.tar')
+    os.remove(inner)
+    extractor.extract(str(tmp_path / 'outer.zip'))
+    assert (tmp_path / 'outer' / 'inner' / 'a.txt').read_bytes() == b'a'
+    assert not (tmp_path / 'outer' / 'inner.tar').exists()
+
+
+def test_archives_in_a_folder_are_extracted_in_place(tmp_path):
+    folder = tmp_path / 'download'
+    (folder / 'sub').mkdir(parents=True)
+    _tar(folder / 'sub' / 'files.tar', [_file('a.txt')])
+    (folder / 'readme.txt').write_bytes(b'')
+    assert extractor.can_extract(str(folder))
+    assert extractor.extract(str(folder)) == str(folder)
+    assert (folder / 'sub' / 'files' / 'a.txt').exists()
+    assert (folder / 'readme.txt').exists()
+
+
+def test_folder_without_archives_is_rejected(tmp_path):
+    (tmp_path / 'readme.txt').write_bytes(b'')
+    assert not extractor.can_extract(str(tmp_path))
+    with pytest.raises(NotSupportedExtractionArchive):
+        extractor.extract(str(tmp_path))
+
+
+@pytest.mark.parametrize('name, parsed', [
+    ('movie.part1.rar', ('movie', '7z', None)),
+    ('movie.part2.rar', None),
+    ('movie.r00', None),
+    ('movie.7z.001', ('movie', '7z', None)),
+    ('movie.7z.002', None),
+    ('files.TAR.GZ', ('files', 'tar', 'gz')),
+    ('.tar', None),
+])
+def test_volumes_are_recognized(name, parsed):
+    assert extractor._parse(name) == parsed
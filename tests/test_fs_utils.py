@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+from bot.helper.ext_utils import fs_utils
+
+
+def _write(path, size):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b'x' * size)
+    return str(path)
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / 'download'
+    root.mkdir()
+    files = [_write(root / 'a.bin', 10), _write(root / 'one' / 'b.bin', 20), _write(root / 'one' / 'deep' / 'c.bin', 30),
+             _write(root / 'two' / 'd.bin', 40)]
+    (root / 'empty').mkdir()
+    return root, files
+
+
+def test_single_file(tmp_path):
+    path = _write(tmp_path / 'file.bin', 123)
+    manifest = fs_utils.scan_path(path)
+    assert manifest.path == path
+    assert manifest.size == 123
+    assert manifest.files == [(path, 123)]
+    assert manifest.dirs == []
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_folder_lists_every_file_and_folder(monkeypatch, tree, workers):
+    monkeypatch.setattr(fs_utils, 'SCAN_WORKERS', workers)
+    root, files = tree
+    manifest = fs_utils.scan_path(str(root))
+    assert manifest.size == 100
+    assert sorted(manifest.files) == sorted(zip(files, (10, 20, 30, 40)))
+    assert sorted(manifest.dirs) == sorted(str(root / name) for name in ('one', 'one/deep', 'two', 'empty'))
+    assert fs_utils.get_path_size(str(root)) == 100
+
+
+def test_folders_come_before_the_folders_in_them(tree):
+    root, files = tree
+    dirs = fs_utils.scan_path(str(root)).dirs
+    assert dirs.index(str(root / 'one')) < dirs.index(str(root / 'one' / 'deep'))
+
+
+def test_single_subfolder_is_scanned_without_threads(tmp_path):
+    root = tmp_path / 'download'
+    path = _write(root / 'only' / 'sub' / 'a.bin', 5)
+    manifest = fs_utils.scan_path(str(root))
+    assert manifest.files == [(path, 5)]
+    assert manifest.dirs == [str(root / 'only'), str(root / 'only' / 'sub')]
+
+
+def test_symlinks_are_skipped(tmp_path, tree):
+    root, files = tree
+    os.symlink(root, root / 'one' / 'loop')
+    os.symlink(files[0], root / 'link.bin')
+    os.symlink(tmp_path / 'missing', root / 'dangling')
+    manifest = fs_utils.scan_path(str(root))
+    assert manifest.size == 100
+    assert len(manifest.files) == 4
+    assert str(root / 'one' / 'loop') not in manifest.dirs
+
+
+def test_missing_path_is_an_error(tmp_path):
+    with pytest.raises(OSError):
+        fs_utils.scan_path(str(tmp_path / 'missing'))
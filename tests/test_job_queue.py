@@ -0,0 +1,129 @@
+import threading
+
+from bot.helper.ext_utils.job_queue import JobScheduler, JobStage
+
+DOWNLOAD = JobStage.DOWNLOAD
+UPLOAD = JobStage.UPLOAD
+
+
+def _scheduler(limit=0, user_limit=0):
+    return JobScheduler({DOWNLOAD: (limit, user_limit), UPLOAD: (0, 0)})
+
+
+def test_jobs_are_admitted_up_to_the_limit():
+    scheduler = _scheduler(limit=2)
+    assert scheduler.enqueue(DOWNLOAD, 1, 'a')
+    assert scheduler.enqueue(DOWNLOAD, 2, 'b')
+    assert not scheduler.enqueue(DOWNLOAD, 3, 'c')
+    assert scheduler.position(3) == (DOWNLOAD, 1, 1)
+    assert scheduler.waiting_counts() == {DOWNLOAD: 1, UPLOAD: 0}
+
+
+def test_zero_means_no_limit():
+    scheduler = _scheduler()
+    assert all(scheduler.enqueue(DOWNLOAD, uid, 'a') for uid in range(100))
+
+
+def test_stages_are_limited_separately():
+    scheduler = _scheduler(limit=1)
+    assert scheduler.enqueue(DOWNLOAD, 1, 'a')
+    assert scheduler.enqueue(UPLOAD, 2, 'a')
+
+
+def test_user_limit_lets_other_users_through():
+    scheduler = _scheduler(user_limit=1)
+    assert scheduler.enqueue(DOWNLOAD, 1, 'a')
+    assert not scheduler.enqueue(DOWNLOAD, 2, 'a')
+    assert scheduler.enqueue(DOWNLOAD, 3, 'b')
+
+
+def test_release_admits_the_queued_jobs_in_order():
+    scheduler = _scheduler(limit=1)
+    scheduler.enqueue(DOWNLOAD, 1, 'a')
+    scheduler.enqueue(DOWNLOAD, 2, 'b')
+    scheduler.enqueue(DOWNLOAD, 3, 'c')
+    assert scheduler.position(3) == (DOWNLOAD, 2, 2)
+    scheduler.release(DOWNLOAD, 1)
+    assert scheduler.position(2) is None
+    assert scheduler.position(3) == (DOWNLOAD, 1, 1)
+    assert scheduler.wait(2)
+    assert scheduler.queued_count() == 1
+
+
+def test_queued_job_of_a_user_at_the_limit_does_not_hold_up_the_others():
+    scheduler = _scheduler(limit=2, user_limit=1)
+    scheduler.enqueue(DOWNLOAD, 1, 'a')
+    scheduler.enqueue(DOWNLOAD, 2, 'b')
+    scheduler.enqueue(DOWNLOAD, 3, 'a')
+    scheduler.enqueue(DOWNLOAD, 4, 'c')
+    scheduler.release(DOWNLOAD, 2)
+    assert scheduler.position(3) == (DOWNLOAD, 1, 1)
+    assert scheduler.position(4) is None
+
+
+def test_new_job_does_not_skip_the_queue():
+    scheduler = _scheduler(limit=1)
+    scheduler.enqueue(DOWNLOAD, 1, 'a')
+    scheduler.enqueue(DOWNLOAD, 2, 'b')
+    scheduler.release(DOWNLOAD, 1)
+    assert not scheduler.enqueue(DOWNLOAD, 3, 'c')
+
+
+def test_job_admitted_before_it_waits_is_not_lost():
+    scheduler = _scheduler(limit=1)
+    scheduler.enqueue(DOWNLOAD, 1, 'a')
+    scheduler.enqueue(DOWNLOAD, 2, 'b')
+    scheduler.release(DOWNLOAD, 1)
+    assert not scheduler.cancel(2)
+    assert scheduler.wait(2)
+
+
+def test_wait_blocks_until_a_slot_frees_up():
+    scheduler = _scheduler(limit=1)
+    scheduler.enqueue(DOWNLOAD, 1, 'a')
+    scheduler.enqueue(DOWNLOAD, 2, 'b')
+    results = []
+    thread = threading.Thread(target=lambda: results.append(scheduler.wait(2)))
+    thread.start()
+    thread.join(0.1)
+    assert thread.is_alive()
+    scheduler.release(DOWNLOAD, 1)
+    thread.join(5)
+    assert results == [True]
+
+
+def test_cancel_wakes_the_waiting_job_and_frees_its_place():
+    scheduler = _scheduler(limit=1)
+    scheduler.enqueue(DOWNLOAD, 1, 'a')
+    scheduler.enqueue(DOWNLOAD, 2, 'b')
+    scheduler.enqueue(DOWNLOAD, 3, 'c')
+    results = []
+    thread = threading.Thread(target=lambda: results.append(scheduler.wait(2)))
+    thread.start()
+    assert scheduler.cancel(2)
+    thread.join(5)
+    assert results == [False]
+    assert scheduler.position(3) == (DOWNLOAD, 1, 1)
+    assert not scheduler.wait(2)
+
+
+def test_release_all_frees_every_stage_and_the_queue():
+    scheduler = JobScheduler({DOWNLOAD: (1, 0), UPLOAD: (1, 0)})
+    scheduler.enqueue(DOWNLOAD, 1, 'a')
+    scheduler.enqueue(UPLOAD, 1, 'a')
+    scheduler.enqueue(DOWNLOAD, 2, 'b')
+    scheduler.release_all(1)
+    assert scheduler.enqueue(UPLOAD, 3, 'c')
+    assert scheduler.position(2) is None
+    assert scheduler.wait(2)
+
+
+def test_restored_job_counts_beyond_the_limit():
+    scheduler = _scheduler(limit=1)
+    scheduler.restore(DOWNLOAD, 1, 'a')
+    scheduler.restore(DOWNLOAD, 2, 'a')
+    assert not scheduler.enqueue(DOWNLOAD, 3, 'b')
+    scheduler.release(DOWNLOAD, 1)
+    assert scheduler.position(3) == (DOWNLOAD, 1, 1)
+    scheduler.release(DOWNLOAD, 2)
+    assert scheduler.wait(3)
@@ -0,0 +1,75 @@
+import pytest
+
+from bot.helper.mirror_utils.upload_utils import service_accounts
+from bot.helper.mirror_utils.upload_utils.service_accounts import ServiceAccountPool
+
+GB = 1024 ** 3
+
+
+@pytest.fixture
+def pool(monkeypatch, clock, tmp_path):
+    monkeypatch.setattr(service_accounts, 'time', clock)
+    for index in (10, 2, 1):
+        (tmp_path / f'{index}.json').write_text('{}')
+    (tmp_path / 'notes.txt').write_text('')
+    return ServiceAccountPool(str(tmp_path))
+
+
+def test_accounts_are_handed_out_in_turn(pool, clock):
+    acquired = []
+    for _ in range(4):
+        acquired.append(pool.acquire())
+        clock.advance(1)
+    assert acquired == ['1.json', '2.json', '10.json', '1.json']
+
+
+def test_excluded_account_is_skipped_unless_it_is_the_only_one(pool):
+    assert pool.acquire(exclude='1.json') == '2.json'
+    pool.mark_exhausted('2.json')
+    pool.mark_exhausted('10.json')
+    assert pool.acquire(exclude='1.json') == '1.json'
+
+
+def test_account_without_quota_for_the_file_is_skipped(pool):
+    pool.add_usage('1.json', 700 * GB)
+    assert not pool.has_quota('1.json', 60 * GB)
+    assert pool.has_quota('1.json', 10 * GB)
+    assert pool.acquire(60 * GB) != '1.json'
+
+
+def test_quota_rolls_over_after_a_day(pool, clock):
+    pool.add_usage('1.json', 500 * GB)
+    clock.advance(ServiceAccountPool.DAY / 2)
+    pool.add_usage('1.json', 250 * GB)
+    assert not pool.has_quota('1.json', 0)
+    clock.advance(ServiceAccountPool.DAY / 2 + 1)
+    assert pool.has_quota('1.json', 400 * GB)
+    assert not pool.has_quota('1.json', 500 * GB)
+
+
+def test_rate_limited_account_cools_down(pool, clock):
+    pool.mark_exhausted('1.json')
+    assert not pool.has_quota('1.json', 0)
+    clock.advance(ServiceAccountPool.COOLDOWN + 1)
+    assert pool.has_quota('1.json', 0)
+
+
+def test_exhausted_pool_picks_the_account_usable_the_soonest(pool, clock):
+    pool.mark_exhausted('1.json')
+    clock.advance(1)
+    pool.mark_exhausted('2.json')
+    clock.advance(1)
+    pool.mark_exhausted('10.json')
+    assert pool.acquire() == '1.json'
+
+
+def test_exhausted_pool_prefers_the_most_remaining_quota(pool):
+    pool.add_usage('1.json', 750 * GB)
+    pool.add_usage('2.json', 740 * GB)
+    pool.add_usage('10.json', 745 * GB)
+    assert pool.acquire(20 * GB) == '2.json'
+
+
+def test_empty_folder_is_an_error(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        ServiceAccountPool(str(tmp_path)).acquire()